@@ -0,0 +1,56 @@
+# coding=utf-8
+"""
+Compare the balancing strategies of the BST implementations.
+
+Measures insert, lookup and delete throughput, and the depth the tree ends up
+with, for each strategy on random, sorted and adversarial streams of keys:
+
+    python benchmarks/balancing.py [number of keys]
+"""
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+from data_structures.balanced_bst import RedBlackBST, WeightBalancedBST
+from data_structures.bst import BST
+
+TREE_TYPES = (BST, RedBlackBST, WeightBalancedBST)
+
+
+def key_streams(n):
+    keys = list(range(n))
+    shuffled = keys[:]
+    random.shuffle(shuffled)
+    # alternating between the two ends, closing in on the middle, keeps
+    # inserting at the deepest points of the tree on both sides
+    zigzag = [k for pair in zip(keys[:n // 2], reversed(keys[n // 2:])) for k in pair]
+    return [('random', shuffled), ('sorted', keys), ('zigzag', zigzag)]
+
+
+def throughput(operation, keys):
+    start = time.perf_counter()
+    for key in keys:
+        operation(key)
+    return len(keys) / (time.perf_counter() - start)
+
+
+def main(n):
+    print('{0:<10} {1:<18} {2:>12} {3:>12} {4:>12} {5:>6}'.format(
+        'keys', 'tree', 'insert/s', 'lookup/s', 'delete/s', 'depth'))
+    for name, keys in key_streams(n):
+        lookups = keys[:]
+        random.shuffle(lookups)
+        for tree_type in TREE_TYPES:
+            tree = tree_type()
+            inserts = throughput(tree.insert, keys)
+            depth = tree.depth()
+            lookup_rate = throughput(tree.contains, lookups)
+            deletes = throughput(tree.delete, keys)
+            print('{0:<10} {1:<18} {2:>12,.0f} {3:>12,.0f} {4:>12,.0f} {5:>6}'.format(
+                name, tree_type.__name__, inserts, lookup_rate, deletes, depth))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,274 @@
+# coding=utf-8
+
+from collections import namedtuple
+from functools import lru_cache
+import operator
+
+from data_structures.bst import BST, _BSTMapNode, _BSTNode, _load_values
+
+
+"""\
+Augmented binary search tree module
+
+Provides AggregateBST, a BST whose nodes also keep an aggregate (such as the
+sum, minimum or maximum) of some measure of the items in their subtree. The
+aggregate of the items in any range can then be found by combining the
+aggregates of O(log(n)) subtrees rather than by visiting every item.
+
+The aggregates are kept up to date wherever the tree updates the sizes and
+depths of its subtrees, so every operation of BST keeps its complexity (give
+or take the cost of combining measures), and in addition:
+
+aggregate of the items in a range: O(log(n))
+aggregate of the whole tree: O(1)
+"""
+
+
+class Monoid(namedtuple('Monoid', ('combine', 'identity'))):
+    """
+    A way to aggregate measures: combine is an associative function of two
+    measures, and identity is the aggregate of no measures at all.
+
+    Measures are always combined in the order of their items, so combine
+    need not be commutative.
+    """
+    __slots__ = ()
+
+
+SUM = Monoid(operator.add, 0)
+MIN = Monoid(min, None)
+MAX = Monoid(max, None)
+
+
+def _identity(item):
+    return item
+
+
+class _Aggregated(object):
+    """
+    Node behaviour shared by the aggregate node types: the aggregate of the
+    subtree is updated along with its size and depth.
+
+    Trees get subclasses of the node types supplying their combine and
+    measure functions by way of _aggregate_node_types. Each node measures its
+    item once, when it is made, and keeps the result in its own slot.
+    """
+    __slots__ = ()
+    combine = measure = None
+
+    def update_aggregate(self):
+        """Update the aggregate of this node's subtree from those of its children."""
+        agg = self.own
+        if self.left is not None:
+            agg = self.combine(self.left.agg, agg)
+        if self.right is not None:
+            agg = self.combine(agg, self.right.agg)
+        self.agg = agg
+
+    def update_stats(self):
+        _BSTNode.update_stats(self)
+        self.update_aggregate()
+
+    def rebalance(self):
+        # any rotations update the stats of the nodes they move on their own
+        self.update_aggregate()
+        return _BSTNode.rebalance(self)
+
+
+def _copy_aggregated(node):
+    """
+    Return a detached copy of an aggregate node, with its stats and aggregates
+    but not its children, without measuring its item again.
+    """
+    copied = object.__new__(type(node))
+    copied.val, copied.left, copied.right = node.val, None, None
+    copied.len_, copied.depth = node.len_, node.depth
+    copied.own, copied.agg = node.own, node.agg
+    return copied
+
+
+class _AggregateNode(_Aggregated, _BSTNode):
+    __slots__ = ('own', 'agg')  # the measure of this node's item, and of its subtree
+
+    def __init__(self, value):
+        _BSTNode.__init__(self, value)
+        self.own = self.agg = self.measure(value)
+
+    def copy(self):
+        return _copy_aggregated(self)
+
+
+class _AggregateMapNode(_Aggregated, _BSTMapNode):
+    __slots__ = ('own', 'agg')
+
+    def __init__(self, key, value):
+        _BSTMapNode.__init__(self, key, value)
+        self.own = self.agg = self.measure(value)
+
+    def copy(self):
+        node = _copy_aggregated(self)
+        node.value = self.value
+        return node
+
+
+@lru_cache(maxsize=128)
+def _aggregate_node_types(combine, measure):
+    """
+    Return the node types for trees keyed by their items and by key functions.
+    Trees with the same combine and measure functions share the same types.
+    """
+    attributes = {
+        '__slots__': (),
+        'combine': staticmethod(combine),
+        'measure': staticmethod(measure),
+    }
+    return (
+        type('AggregateNode', (_AggregateNode,), attributes),
+        type('AggregateMapNode', (_AggregateMapNode,), attributes),
+    )
+
+
+def _range_aggregate(node, start, stop, inclusive, combine):
+    """
+    Return the aggregate of the measures of the items in the subtree whose
+    values fall within the given range, or None if there are none.
+    """
+    low_inclusive, high_inclusive = inclusive
+
+    def after_start(val):
+        return start is None or start < val or (low_inclusive and start == val)
+
+    def before_stop(val):
+        return stop is None or val < stop or (high_inclusive and val == stop)
+
+    # find the highest node in the range, below which the rest of it must be
+    while node is not None:
+        if not after_start(node.val):
+            node = node.right
+        elif not before_stop(node.val):
+            node = node.left
+        else:
+            break
+    else:
+        return None
+    result = node.own
+
+    # Everything on the left of that node is before stop. Walking down towards
+    # start, each node in the range comes with its whole right subtree, and
+    # both come before everything gathered so far.
+    left = node.left
+    while left is not None:
+        if after_start(left.val):
+            if left.right is not None:
+                result = combine(left.right.agg, result)
+            result = combine(left.own, result)
+            left = left.left
+        else:
+            left = left.right
+
+    # and the same for the right side, mirrored
+    right = node.right
+    while right is not None:
+        if before_stop(right.val):
+            if right.left is not None:
+                result = combine(result, right.left.agg)
+            result = combine(result, right.own)
+            right = right.right
+        else:
+            right = right.left
+    return result
+
+
+class AggregateBST(BST):
+    """
+    Binary search tree that can aggregate the items in any range in O(log(n)).
+
+    The aggregate is given by a Monoid, which by default sums the items:
+
+    >>> b = AggregateBST([5, 1, 4, 2, 3])
+    >>> b.aggregate(2, 4)
+    9
+    >>> b.insert(10)
+    >>> b.aggregate(3, None)
+    22
+    >>> b.aggregate(6, 9)
+    0
+
+    A measure function can pick out what to aggregate from each item, and a
+    key function what to sort them by. Ranges are given as keys, as for irange:
+
+    >>> sales = AggregateBST(
+    ...     [(1, 9.5), (3, 4.0), (2, 2.5), (7, 1.0)],
+    ...     key=lambda sale: sale[0],
+    ...     measure=lambda sale: sale[1],
+    ... )
+    >>> sales.aggregate(2, 7, inclusive=(True, False))
+    6.5
+
+    MIN, MAX and any other Monoid can be used in place of the sum:
+
+    >>> AggregateBST(sales, key=lambda sale: sale[0], monoid=MAX,
+    ...              measure=lambda sale: sale[1]).aggregate(2, None)
+    4.0
+
+    Otherwise it provides all of the operations of BST.
+    """
+
+    def __init__(self, items=(), key=None, monoid=SUM, measure=None):
+        """
+        Create a new tree aggregating the measures of its items (or the
+        items themselves, if no measure is given) with the given Monoid,
+        optionally sorting them by the given key function. If an iterable is
+        passed, all of its items are added to the tree.
+        """
+        BST.__init__(self, key=key)
+        self._monoid = monoid
+        self._measure = measure
+        node_type, map_node_type = _aggregate_node_types(monoid.combine, measure or _identity)
+        self._make_node = node_type if key is None else lambda entry: map_node_type(*entry)
+        self.update(items)
+
+    @classmethod
+    def from_sorted(cls, items, key=None, monoid=SUM, measure=None):
+        """
+        Create a new, perfectly balanced tree from items that are already in
+        sorted order (by the key function, if given) in O(n) time. Duplicate
+        items are ignored.
+
+        Raises ValueError if the items are not sorted.
+        """
+        return cls(key=key, monoid=monoid, measure=measure)._fill_sorted(items)
+
+    @classmethod
+    def load(cls, fileobj, key=None, monoid=SUM, measure=None):
+        """
+        Create a new tree from the items written to a binary file object by
+        dump(), in O(n) time. The key, monoid and measure are not saved, and
+        must be given again.
+        """
+        return cls.from_sorted(_load_values(fileobj), key, monoid, measure)
+
+    def __reduce__(self):
+        return type(self).from_sorted, (list(self), self._key, self._monoid, self._measure)
+
+    def _check_joinable(self, other):
+        BST._check_joinable(self, other)
+        if other._monoid != self._monoid or other._measure is not self._measure:
+            raise ValueError("cannot join trees with different aggregates")
+
+    def aggregate(self, start=None, stop=None, inclusive=(True, True)):
+        """
+        Return the aggregate of the items in the given range, in O(log(n))
+        time, or the monoid's identity if there are none. The range is the
+        same as that of irange() and count_range(), but defaults to the
+        whole tree, whose aggregate takes O(1).
+        """
+        if self._head is None or (start is not None and stop is not None and stop < start):
+            return self._monoid.identity
+        if start is None and stop is None:
+            return self._head.agg
+        if start is not None and start == stop:
+            # a range that begins and ends on the same value covers it if either end does
+            inclusive = (True, True) if any(inclusive) else (False, False)
+        result = _range_aggregate(self._head, start, stop, inclusive, self._monoid.combine)
+        return self._monoid.identity if result is None else result
@@ -0,0 +1,314 @@
+# coding=utf-8
+
+from data_structures.bst import BST, _BSTMapNode, _BSTNode
+
+
+"""\
+Alternative balancing module
+
+Provides RedBlackBST and WeightBalancedBST, which have exactly the interface
+and complexities of bst.BST but keep their trees balanced in other ways than
+BST's AVL balancing:
+
+Red-black trees allow the two sides of a node to differ more in depth, and
+so need fewer rotations to insert and delete, at the cost of lookups going
+slightly deeper.
+
+Weight-balanced trees keep the numbers of items on the two sides of each node
+within a constant factor of each other, using the subtree sizes every node
+already keeps for indexing.
+
+Each node balances its subtree from its children alone whenever they change,
+just as the AVL nodes of BST do, so all the operations of BST (including
+bulk updates, split and join) work unchanged.
+
+Which is fastest depends on the workload; benchmarks/balancing.py compares
+them on a few kinds of key streams.
+"""
+
+
+# Red-black trees
+#
+# Colours are kept as ranks: each node's rank is the number of black nodes on
+# any path down from it to a missing child, not counting itself but counting
+# the missing child, so missing children have rank 0 and leaves rank 1. A
+# child is red when it has the same rank as its parent, and black when its
+# rank is one less. A red node never has a red child.
+#
+# Storing ranks rather than colours lets a node see from its children alone
+# when a path below it has gained a red node too many (after an insertion or
+# a join) or lost a black one (after a deletion), and fix it there. The root
+# of a tree has no colour.
+
+def _rank(node):
+    return node.rank if node is not None else 0
+
+
+class _RedBlack(object):
+    """Node behaviour shared by the red-black node types."""
+    __slots__ = ()
+
+    def update_stats(self):
+        """
+        Update the depth, size and rank of this node's subtree. The rank is the
+        least its children allow, as if none of its children were red.
+        """
+        _BSTNode.update_stats(self)
+        left_rank, right_rank = _rank(self.left), _rank(self.right)
+        self.rank = 1 + (left_rank if left_rank < right_rank else right_rank)
+
+    def rebalance(self):
+        """
+        Update this node's stats after its children have changed, fix any
+        breach of the red-black rules between it and its children or
+        grandchildren, and return what should go in its place.
+
+        A returned node may have a rank one less than this node had, which its
+        parent must then fix in turn.
+        """
+        # this is _BSTNode.update_stats() inlined, keeping the children's ranks
+        left, right = self.left, self.right
+        if left is None:
+            left_depth = left_rank = 0
+            self.len_ = 1 + (right.len_ if right is not None else 0)
+        else:
+            left_depth, left_rank = left.depth, left.rank
+            self.len_ = 1 + left.len_ + (right.len_ if right is not None else 0)
+        if right is None:
+            right_depth = right_rank = 0
+        else:
+            right_depth, right_rank = right.depth, right.rank
+        self.depth = 1 + (left_depth if left_depth > right_depth else right_depth)
+
+        rank = self.rank
+        if rank - left_rank > 1:
+            return self._fix_short_left()
+        elif rank - right_rank > 1:
+            return self._fix_short_right()
+        elif left_rank == rank and (_rank(left.left) == rank or _rank(left.right) == rank):
+            # two reds in a row on the left
+            if right_rank == rank:
+                # both children red: make them black by promoting this node
+                self.rank += 1
+                return self
+            if _rank(left.right) == rank:
+                self.left = left.left_rotation()
+            top = self.right_rotation()
+        elif right_rank == rank and (_rank(right.left) == rank or _rank(right.right) == rank):
+            # two reds in a row on the right
+            if left_rank == rank:
+                self.rank += 1
+                return self
+            if _rank(right.left) == rank:
+                self.right = right.right_rotation()
+            top = self.left_rotation()
+        else:
+            return self
+        # the top of the rotated subtree goes black, and its children red
+        top.rank = top.left.rank = top.right.rank = rank
+        return top
+
+    def _fix_short_left(self):
+        """Fix the left subtree having one fewer black node than the right."""
+        rank = self.rank
+        sibling = self.right
+        if sibling.rank == rank:
+            # red sibling: rotate it up, leaving this node red with a black
+            # sibling, which the cases below can always fix
+            top = self.left_rotation()
+            top.rank = self.rank = rank
+            top.left = self._fix_short_left()
+            _BSTNode.update_stats(top)
+            return top
+        near, far = sibling.left, sibling.right
+        if _rank(far) == sibling.rank:
+            # red far nephew: rotate the sibling up, taking this node's place,
+            # and make both sides black
+            top = self.left_rotation()
+            top.rank = rank
+            self.rank = rank - 1
+            return top
+        elif _rank(near) == sibling.rank:
+            # red near nephew: rotate it up twice and make both sides black
+            self.right = sibling.right_rotation()
+            top = self.left_rotation()
+            top.rank = rank
+            self.rank = sibling.rank = rank - 1
+            return top
+        else:
+            # black nephews: make the sibling red by demoting this node, which
+            # passes the shortfall up to the parent unless this node was red
+            self.rank = rank - 1
+            return self
+
+    def _fix_short_right(self):
+        """Fix the right subtree having one fewer black node than the left."""
+        rank = self.rank
+        sibling = self.left
+        if sibling.rank == rank:
+            top = self.right_rotation()
+            top.rank = self.rank = rank
+            top.right = self._fix_short_right()
+            _BSTNode.update_stats(top)
+            return top
+        near, far = sibling.right, sibling.left
+        if _rank(far) == sibling.rank:
+            top = self.right_rotation()
+            top.rank = rank
+            self.rank = rank - 1
+            return top
+        elif _rank(near) == sibling.rank:
+            self.left = sibling.left_rotation()
+            top = self.right_rotation()
+            top.rank = rank
+            self.rank = sibling.rank = rank - 1
+            return top
+        else:
+            self.rank = rank - 1
+            return self
+
+    def drop(self):
+        if self.left is not None and self.right is not None:
+            # the successor takes this node's place, and its colour with it
+            right, successor = self.right.pick_minimum()
+            successor.left, successor.right = self.left, right
+            successor.rank = self.rank
+            return successor.rebalance()
+        return _BSTNode.drop(self)
+
+    def join_side(self, left, right):
+        # join where the ranks match; this node becomes red there, or black
+        # if it ends up at the top
+        left_rank, right_rank = _rank(left), _rank(right)
+        if left_rank > right_rank:
+            return -1
+        elif right_rank > left_rank:
+            return 1
+        else:
+            return 0
+
+
+class _RedBlackNode(_RedBlack, _BSTNode):
+    __slots__ = ('rank',)
+
+    def __init__(self, value):
+        _BSTNode.__init__(self, value)
+        self.rank = 1
+
+    def copy(self):
+        node = _BSTNode.copy(self)
+        node.rank = self.rank
+        return node
+
+
+class _RedBlackMapNode(_RedBlack, _BSTMapNode):
+    __slots__ = ('rank',)
+
+    def __init__(self, key, value):
+        _BSTMapNode.__init__(self, key, value)
+        self.rank = 1
+
+    def copy(self):
+        node = _BSTMapNode.copy(self)
+        node.rank = self.rank
+        return node
+
+
+# Weight-balanced trees
+#
+# The weight of a subtree is one more than its size. Neither child of a node
+# may weigh more than DELTA times the other, and when one does, a single or
+# double rotation is chosen by comparing the weights of its children using
+# GAMMA. These are the parameters shown by Hirai and Yamamoto to be the only
+# integer ones for which one rotation always restores the balance.
+
+_DELTA = 3
+_GAMMA = 2
+
+
+def _weight(node):
+    return node.len_ + 1 if node is not None else 1
+
+
+class _WeightBalanced(object):
+    """Node behaviour shared by the weight-balanced node types."""
+    __slots__ = ()
+
+    def rebalance(self):
+        """
+        Update this node's stats after its children have changed, check that it
+        is balanced, and return what should go in its place.
+        """
+        # this is _BSTNode.update_stats() inlined, keeping the children's weights
+        left, right = self.left, self.right
+        if left is None:
+            left_depth, left_weight = 0, 1
+        else:
+            left_depth, left_weight = left.depth, left.len_ + 1
+        if right is None:
+            right_depth, right_weight = 0, 1
+        else:
+            right_depth, right_weight = right.depth, right.len_ + 1
+        self.depth = 1 + (left_depth if left_depth > right_depth else right_depth)
+        self.len_ = left_weight + right_weight - 1
+        if _DELTA * left_weight < right_weight:
+            # right side is too heavy
+            if _weight(right.left) >= _GAMMA * _weight(right.right):
+                self.right = right.right_rotation()
+            return self.left_rotation()
+        elif _DELTA * right_weight < left_weight:
+            # left side is too heavy
+            if _weight(left.right) >= _GAMMA * _weight(left.left):
+                self.left = left.left_rotation()
+            return self.right_rotation()
+        else:
+            return self
+
+    def join_side(self, left, right):
+        left_weight, right_weight = _weight(left), _weight(right)
+        if _DELTA * right_weight < left_weight:
+            return -1
+        elif _DELTA * left_weight < right_weight:
+            return 1
+        else:
+            return 0
+
+
+class _WeightBalancedNode(_WeightBalanced, _BSTNode):
+    __slots__ = ()
+
+
+class _WeightBalancedMapNode(_WeightBalanced, _BSTMapNode):
+    __slots__ = ()
+
+
+class RedBlackBST(BST):
+    """
+    Binary search tree balanced as a red-black tree.
+
+    >>> b = RedBlackBST(['one', 'two', 'three'])
+    >>> b.insert('four')
+    >>> b
+    data_structures.balanced_bst.RedBlackBST(['four', 'one', 'three', 'two'])
+
+    It provides all of the operations of BST.
+    """
+
+    _node_type = _RedBlackNode
+    _map_node_type = _RedBlackMapNode
+
+
+class WeightBalancedBST(BST):
+    """
+    Binary search tree balanced by the sizes of its subtrees.
+
+    >>> b = WeightBalancedBST(['one', 'two', 'three'])
+    >>> b.insert('four')
+    >>> b
+    data_structures.balanced_bst.WeightBalancedBST(['four', 'one', 'three', 'two'])
+
+    It provides all of the operations of BST.
+    """
+
+    _node_type = _WeightBalancedNode
+    _map_node_type = _WeightBalancedMapNode
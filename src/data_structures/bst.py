@@ -1,131 +1,192 @@
 # coding=utf-8
 # from __future__ import unicode_literals
 
+from array import array
 from collections import deque
+from itertools import islice
+from operator import attrgetter, itemgetter
+import pickle
+import struct
+import sys
 
 
 """\
 Binary Search Tree module
 
-Provides an implementation of a binary search tree. Runtime complexities
-are as follows:
+Provides an implementation of a binary search tree as a sorted set (BST), a
+sorted key-value map (BSTMap), and an immutable sorted set that shares
+structure between versions (PersistentBST). Runtime complexities are as follows:
 
 insert, contains, delete, index: O(log(n))
+update, difference_update with k items: O(k log(n/k + 1))
+split, join: O(log(n))
+bisect, count of items in a range: O(log(n))
+floor, ceiling, lower, higher, min, max, pop_min, pop_max: O(log(n))
+k nearest items: O(log(n) + k)
+moving a cursor to the next or previous item: amortized O(1)
+slicing k items: O(log(n) + k), deleting a contiguous slice: O(log(n))
 size, depth, balance: O(1)
+construction from already-sorted items, loading a dumped tree: O(n)
 """
 
 
+def _sorted_unique(items):
+    """
+    Return a list of the given items with duplicates removed if they are in
+    sorted order, or None if they are not.
+    """
+    result = []
+    for item in items:
+        hash(item)  # reject mutable items
+        if result:
+            last = result[-1]
+            if item == last:
+                continue
+            elif item < last:
+                return None
+        result.append(item)
+    return result
+
+
 class _BSTNode(object):
+    # Children are plain attributes rather than properties: whatever changes a
+    # node's children is responsible for calling update_stats() (usually by way
+    # of rebalance()) once it is done, rather than on every assignment.
+    __slots__ = ('val', 'left', 'right', 'len_', 'depth')
+
     def __init__(self, value):
         self.val = value
-        self._left = None
-        self._right = None
+        self.left = None
+        self.right = None
         self.len_ = 1
         self.depth = 1
 
-    @property
-    def left(self):
-        return self._left
-
-    @left.setter
-    def left(self, node):
-        self._left = node
-        self.update_stats()
-
-    @property
-    def right(self):
-        return self._right
-
-    @right.setter
-    def right(self, node):
-        self._right = node
-        self.update_stats()
+    def copy(self):
+        """Return a detached copy of this node, with its stats but not its children."""
+        node = type(self)(self.val)
+        node.len_, node.depth = self.len_, self.depth
+        return node
 
     def update_stats(self):
         """Update the depth and size of this node's subtree."""
-        self.depth = 1 + max(
-            self.left.depth if self.left else 0,
-            self.right.depth if self.right else 0
-        )
-        self.len_ = (
-            1 +
-            (self.left.len_ if self.left else 0) +
-            (self.right.len_ if self.right else 0)
-        )
+        left, right = self.left, self.right
+        if left is None:
+            if right is None:
+                self.depth = 1
+                self.len_ = 1
+            else:
+                self.depth = 1 + right.depth
+                self.len_ = 1 + right.len_
+        elif right is None:
+            self.depth = 1 + left.depth
+            self.len_ = 1 + left.len_
+        else:
+            self.depth = 1 + max(left.depth, right.depth)
+            self.len_ = 1 + left.len_ + right.len_
 
     @property
     def balance(self):
-        left_depth = self.left.depth if self.left else 0
-        right_depth = self.right.depth if self.right else 0
+        left_depth = self.left.depth if self.left is not None else 0
+        right_depth = self.right.depth if self.right is not None else 0
         return left_depth - right_depth
 
     def left_rotation(self):
         pivot = self.right
         self.right = pivot.left
         pivot.left = self
+        self.update_stats()
+        pivot.update_stats()
         return pivot
 
     def right_rotation(self):
         pivot = self.left
         self.left = pivot.right
         pivot.right = self
+        self.update_stats()
+        pivot.update_stats()
         return pivot
 
     def rebalance(self):
-        """Check that this node is balanced and return what should go in its place"""
-        balance = self.balance
+        """
+        Update this node's stats after its children have changed, check that it
+        is balanced, and return what should go in its place.
+        """
+        # this is update_stats() inlined, keeping the depths for the balance
+        left, right = self.left, self.right
+        if left is None:
+            left_depth = 0
+            self.len_ = 1 + (right.len_ if right is not None else 0)
+        else:
+            left_depth = left.depth
+            self.len_ = 1 + left.len_ + (right.len_ if right is not None else 0)
+        right_depth = right.depth if right is not None else 0
+        self.depth = 1 + (left_depth if left_depth > right_depth else right_depth)
+
+        balance = left_depth - right_depth
         if balance < -1:  # https://goo.gl/q0VorO
             # right tree is deeper
             # perform left rotation
-            if self.right.balance > 0:  # avoid right-left case
-                self.right = self.right.right_rotation()
+            if right.balance > 0:  # avoid right-left case
+                self.right = right.right_rotation()
             return self.left_rotation()
 
         elif balance > 1:
             # left tree is deeper
             # perform right rotation
-            if self.left.balance < 0:  # avoid left-right case
-                self.left = self.left.left_rotation()
+            if left.balance < 0:  # avoid left-right case
+                self.left = left.left_rotation()
             return self.right_rotation()
 
         else:
             # tree is balanced
             return self
 
+    def join_side(self, left, right):
+        """
+        Decide where this detached node should join two subtrees whose values
+        lie on either side of its own: -1 to descend the right edge of left,
+        1 to descend the left edge of right, or 0 to join them right here.
+        """
+        left_depth = left.depth if left is not None else 0
+        right_depth = right.depth if right is not None else 0
+        if left_depth > right_depth + 1:
+            return -1
+        elif right_depth > left_depth + 1:
+            return 1
+        else:
+            return 0
+
     def insert(self, item):
         """
         Ensure the item is in the tree below this node and return the node that should
         go in this node's place once the tree is balanced.
         """
-        if item == self.val:
+        path, found = _search_path(self, item)
+        if found is not None:
             return self
-        elif item < self.val:
-            if self.left:
-                self.left = self.left.insert(item)
-                return self.rebalance()
-            else:
-                self.left = _BSTNode(item)
-                return self
+        parent = path[-1]
+        if item < parent.val:
+            parent.left = type(self)(item)
         else:
-            if self.right:
-                self.right = self.right.insert(item)
-                return self.rebalance()
-            else:
-                self.right = _BSTNode(item)
-                return self
+            parent.right = type(self)(item)
+        return _retrace(path)
 
     def pick_minimum(self):
         """
         Remove the node that contains the minimum value in this subtree.
 
         The returned value is a tuple of what this node should be replaced with
-        and what the minimum value in the sub-tree was.
+        and the node that held the minimum value, now detached from the tree.
         """
-        if self.left:
-            self.left, value = self.left.pick_minimum()
-            return self.rebalance(), value
-        else:
-            return self.right, self.val
+        if self.left is None:
+            return self.right, self
+        path = []
+        node = self
+        while node.left is not None:
+            path.append(node)
+            node = node.left
+        path[-1].left = node.right
+        return _retrace(path), node
 
     def drop(self):
         """
@@ -134,12 +195,14 @@ class _BSTNode(object):
         Return the node that should go in this node's place, whether it is still
         this node or another that is being moved upwards.
         """
-        if self.left:
-            if self.right:
+        if self.left is not None:
+            if self.right is not None:
                 # both children
-                # steal the value of the next node in order
-                self.right, self.val = self.right.pick_minimum()
-                return self.rebalance()
+                # move the next node in order into this node's place, taking
+                # whatever else it carries along with its value
+                right, successor = self.right.pick_minimum()
+                successor.left, successor.right = self.left, right
+                return successor.rebalance()
             else:
                 # left child only
                 return self.left
@@ -156,151 +219,1119 @@ class _BSTNode(object):
         Return the node that should go in this node's place, whether it is still
         this node or another that is being moved upwards.
         """
-        # if this node holds the value, remove it
-        if self.val == val:
-            return self.drop()
+        path, found = _search_path(self, val)
+        if found is None:
+            return self
+        return _replace_child(path, found, found.drop())
+
+    def __contains__(self, item):
+        return _find_node(self, item) is not None
+
+    def __len__(self):
+        return self.len_
+
+    def node_at(self, index):
+        """Return the node holding the index'th value of this sub-tree in sorted order"""
+        node = self
+        while True:
+            left = node.left
+            if left is not None:
+                if index >= left.len_:
+                    # skip over entire left tree
+                    index -= left.len_
+                else:
+                    node = left
+                    continue
+            # we have skipped the left side
+            if index == 0:
+                return node
+            # we have skipped our own value as well now
+            # it must be in the right side subtree
+            index -= 1
+            node = node.right
 
-        # otherwise recurse down to find the value
-        elif val < self.val:
-            if self.left:
-                self.left = self.left.remove_val(val)
-                return self.rebalance()
+    def del_index(self, index):
+        """Delete the index'th value of this sub-tree in sorted order
+        and return what this node should be replaced with"""
+        path = []
+        node = self
+        while True:
+            left_len = node.left.len_ if node.left is not None else 0
+            if index < left_len:
+                path.append(node)
+                node = node.left
+            elif index == left_len:
+                break
             else:
-                return self
+                # skip over the entire left tree and this node's own value
+                index -= left_len + 1
+                path.append(node)
+                node = node.right
+        return _replace_child(path, node, node.drop())
+
+
+class _BSTMapNode(_BSTNode):
+    """A tree node that carries a value alongside the key it is sorted by (in val)."""
+    __slots__ = ('value',)
+
+    def __init__(self, key, value):
+        _BSTNode.__init__(self, key)
+        self.value = value
+
+    def copy(self):
+        node = type(self)(self.val, self.value)
+        node.len_, node.depth = self.len_, self.depth
+        return node
+
+    def insert(self, key, value, replace=True):
+        """
+        Ensure the key is in the tree below this node with the given value (or
+        with its existing value, if not replacing) and return the node that should
+        go in this node's place once the tree is balanced.
+        """
+        path, found = _search_path(self, key)
+        if found is not None:
+            if replace:
+                found.value = value
+            return self
+        parent = path[-1]
+        if key < parent.val:
+            parent.left = type(self)(key, value)
+        else:
+            parent.right = type(self)(key, value)
+        return _retrace(path)
+
+
+def _search_path(node, val):
+    """
+    Search the subtree for the given value, returning a tuple of the list of
+    nodes visited before finding it and the node holding it (or None, in which
+    case the last node on the path is where it would be attached).
+    """
+    path = []
+    while node is not None:
+        if val == node.val:
+            return path, node
+        path.append(node)
+        node = node.left if val < node.val else node.right
+    return path, None
+
+
+def _retrace(path):
+    """
+    Rebalance the nodes of a path down from the root of a subtree, bottom up,
+    after the children of the last node on the path have changed. Returns the
+    new root of the subtree. The path is consumed.
+    """
+    pop = path.pop
+    node = pop()
+    replacement = node.rebalance()
+    while path:
+        parent = pop()
+        if parent.left is node:
+            parent.left = replacement
+        else:
+            parent.right = replacement
+        node = parent
+        replacement = parent.rebalance()
+    return replacement
+
+
+def _replace_child(path, old, new):
+    """
+    Put a new subtree in the place of the old one below the last node on a path
+    down from the root of a subtree and rebalance up the path, returning the
+    new root of the subtree.
+    """
+    if not path:
+        return new
+    parent = path[-1]
+    if parent.left is old:
+        parent.left = new
+    else:
+        parent.right = new
+    return _retrace(path)
+
+
+def _make_map_node(item):
+    return _BSTMapNode(item[0], item[1])
+
+
+_get_val = attrgetter('val')
+_get_value = attrgetter('value')
+_get_item = attrgetter('val', 'value')
+
+
+# Traversal engine
+#
+# In-order traversals are driven by an explicit stack of the ancestors whose
+# values have yet to be visited, with the next node to visit on top. Each node
+# is pushed and popped exactly once, so every value is produced in amortized
+# O(1) rather than being re-yielded through every generator above it.
+
+def _left_spine(node, stack=None):
+    """Push the node and its chain of left children onto the stack and return it."""
+    if stack is None:
+        stack = []
+    while node is not None:
+        stack.append(node)
+        node = node.left
+    return stack
+
+
+def _right_spine(node, stack=None):
+    """Push the node and its chain of right children onto the stack and return it."""
+    if stack is None:
+        stack = []
+    while node is not None:
+        stack.append(node)
+        node = node.right
+    return stack
+
+
+def _lower_bound_spine(node, start, inclusive):
+    """
+    Return the traversal stack for an in-order walk that begins at the first
+    node at or after start (strictly after, if not inclusive).
+    """
+    stack = []
+    if start is None:
+        return _left_spine(node, stack)
+    while node is not None:
+        if start < node.val or (inclusive and start == node.val):
+            stack.append(node)
+            node = node.left
+        else:
+            node = node.right
+    return stack
+
+
+def _upper_bound_spine(node, stop, inclusive):
+    """
+    Return the traversal stack for a reverse in-order walk that begins at the
+    last node at or before stop (strictly before, if not inclusive).
+    """
+    stack = []
+    while node is not None:
+        if node.val < stop or (inclusive and node.val == stop):
+            stack.append(node)
+            node = node.right
         else:
-            if self.right:
-                self.right = self.right.remove_val(val)
-                return self.rebalance()
+            node = node.left
+    return stack
+
+
+def _index_spine(node, index, reverse=False):
+    """
+    Return the traversal stack for an in-order walk (or a reverse in-order
+    walk) that begins at the node with the given index in the subtree.
+    """
+    stack = []
+    while node is not None:
+        left_len = node.left.len_ if node.left is not None else 0
+        if index < left_len:
+            if not reverse:
+                stack.append(node)
+            node = node.left
+        elif index == left_len:
+            stack.append(node)
+            break
+        else:
+            if reverse:
+                stack.append(node)
+            index -= left_len + 1
+            node = node.right
+    return stack
+
+
+def _slice_nodes(node, start, stop, step):
+    """Yield the nodes of the subtree at the indices of range(start, stop, step)."""
+    count = len(range(start, stop, step))
+    if count == 0:
+        return iter(())
+    if step > 0:
+        nodes = _in_order_nodes(_index_spine(node, start))
+    else:
+        nodes = _reverse_order_nodes(_index_spine(node, start, reverse=True))
+        step = -step
+    return islice(nodes, 0, (count - 1) * step + 1, step)
+
+
+def _in_order_nodes(stack):
+    """Yield nodes in-order, continuing from the given traversal stack."""
+    pop = stack.pop
+    while stack:
+        node = pop()
+        yield node
+        _left_spine(node.right, stack)
+
+
+def _reverse_order_nodes(stack):
+    """Yield nodes in reverse in-order, continuing from the given traversal stack."""
+    pop = stack.pop
+    while stack:
+        node = pop()
+        yield node
+        _right_spine(node.left, stack)
+
+
+def _pre_order_nodes(node):
+    """Yield the nodes of the subtree pre-order."""
+    stack = [node]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node = pop()
+        yield node
+        if node.right is not None:
+            push(node.right)
+        if node.left is not None:
+            push(node.left)
+
+
+def _post_order_nodes(node):
+    """Yield the nodes of the subtree post-order."""
+    stack = []
+    pop, push = stack.pop, stack.append
+    last = None
+    while stack or node is not None:
+        if node is not None:
+            # descend as far left as possible
+            push(node)
+            node = node.left
+        else:
+            top = stack[-1]
+            if top.right is not None and top.right is not last:
+                # the right subtree has not been visited yet
+                node = top.right
             else:
-                return self
+                yield top
+                last = pop()
 
-    def __contains__(self, item):
-        if item == self.val:
-            return True
-        elif item < self.val:
-            return self.left is not None and item in self.left
+
+def _irange_nodes(node, start, stop, inclusive, reverse=False):
+    """
+    Yield the nodes of the subtree whose values fall within the given range
+    in-order, or in reverse in-order.
+    """
+    if start is not None and start == stop:
+        # a range that begins and ends on the same value covers it if either end does
+        inclusive = (True, True) if any(inclusive) else (False, False)
+    if reverse:
+        if stop is None:
+            nodes = _reverse_order_nodes(_right_spine(node))
+        else:
+            nodes = _reverse_order_nodes(_upper_bound_spine(node, stop, inclusive[1]))
+        if start is None:
+            return nodes
         else:
-            return self.right is not None and item in self.right
+            return _nodes_down_to(nodes, start, inclusive[0])
+    nodes = _in_order_nodes(_lower_bound_spine(node, start, inclusive[0]))
+    if stop is None:
+        return nodes
+    else:
+        return _nodes_until(nodes, stop, inclusive[1])
+
+
+def _nodes_until(nodes, stop, inclusive):
+    """Yield the nodes until one is found beyond stop."""
+    for node in nodes:
+        val = node.val
+        if val < stop or (inclusive and val == stop):
+            yield node
+        else:
+            return
+
+
+def _nodes_down_to(nodes, start, inclusive):
+    """Yield the nodes until one is found before start."""
+    for node in nodes:
+        val = node.val
+        if start < val or (inclusive and start == val):
+            yield node
+        else:
+            return
+
+
+def _find_node(node, val):
+    """Return the node in the subtree that holds the given value, or None."""
+    while node is not None:
+        if val == node.val:
+            return node
+        elif val < node.val:
+            node = node.left
+        else:
+            node = node.right
+    return None
+
+
+def _rank(node, val, inclusive=False):
+    """
+    Return the number of values in the subtree less than the given value (or
+    less than or equal to it, if inclusive).
+    """
+    rank = 0
+    while node is not None:
+        if node.val < val or (inclusive and node.val == val):
+            # this node and everything to its left come before val
+            rank += 1
+            if node.left is not None:
+                rank += node.left.len_
+            node = node.right
+        else:
+            node = node.left
+    return rank
 
-    def __len__(self):
-        return self.len_
+
+def _min_node(node):
+    """Return the node in the subtree with the least value."""
+    while node.left is not None:
+        node = node.left
+    return node
+
+
+def _max_node(node):
+    """Return the node in the subtree with the greatest value."""
+    while node.right is not None:
+        node = node.right
+    return node
+
+
+def _floor_node(node, val, inclusive=True):
+    """
+    Return the node in the subtree with the greatest value at or below the
+    given value (strictly below, if not inclusive), or None.
+    """
+    found = None
+    while node is not None:
+        if node.val < val or (inclusive and node.val == val):
+            found = node
+            node = node.right
+        else:
+            node = node.left
+    return found
+
+
+def _ceiling_node(node, val, inclusive=True):
+    """
+    Return the node in the subtree with the least value at or above the
+    given value (strictly above, if not inclusive), or None.
+    """
+    found = None
+    while node is not None:
+        if val < node.val or (inclusive and node.val == val):
+            found = node
+            node = node.left
+        else:
+            node = node.right
+    return found
+
+
+def _sorted_unique_items(items, replace=True):
+    """
+    Return a list of the given (key, value) pairs with duplicate keys removed,
+    keeping the last value for each (or the first, if not replacing), if they
+    are in sorted order by key, or None if they are not.
+    """
+    result = []
+    for item in items:
+        key, value = item
+        hash(key)  # reject mutable keys
+        if result:
+            last = result[-1][0]
+            if key == last:
+                if replace:
+                    result[-1] = key, value
+                continue
+            elif key < last:
+                return None
+        result.append((key, value))
+    return result
+
+
+def _build_balanced(values, start, stop, make_node=_BSTNode):
+    """
+    Build a perfectly balanced subtree from the sorted, unique values in
+    values[start:stop] and return its root node.
+    """
+    if start >= stop:
+        return None
+    mid = (start + stop - 1) >> 1
+    node = make_node(values[mid])
+    node.left = _build_balanced(values, start, mid, make_node)
+    node.right = _build_balanced(values, mid + 1, stop, make_node)
+    node.update_stats()
+    return node
+
+
+def _sorted_values(items):
+    """Return the given items sorted, without duplicates."""
+    items = list(items)
+    values = _sorted_unique(items)
+    if values is None:
+        values = sorted(set(items))
+    return values
+
+
+def _sorted_entries(items, key):
+    """
+    Return (key(item), item) pairs for the given items sorted by key, keeping
+    only the first item for each key.
+    """
+    entries = [(key(item), item) for item in items]
+    result = _sorted_unique_items(entries, replace=False)
+    if result is None:
+        # the sort is stable, so the first item for each key stays first
+        entries.sort(key=itemgetter(0))
+        result = _sorted_unique_items(entries, replace=False)
+    return result
+
+
+# Split and join
+#
+# These rebuild balanced subtrees out of existing nodes in time proportional to
+# the difference in depth of the pieces being joined, rather than re-inserting
+# values one at a time. They consume the subtrees they are given.
+
+def _join(left, node, right):
+    """
+    Join two subtrees and a detached node whose value lies between theirs into
+    one balanced subtree, and return its root.
+    """
+    side = node.join_side(left, right)
+    if side < 0:
+        # descend the right edge of the taller left side
+        left.right = _join(left.right, node, right)
+        return left.rebalance()
+    elif side > 0:
+        # descend the left edge of the taller right side
+        right.left = _join(left, node, right.left)
+        return right.rebalance()
+    else:
+        node.left, node.right = left, right
+        node.update_stats()
+        return node
+
+
+def _join2(left, right):
+    """Join two subtrees, every value in left being less than every value in right."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    right, minimum = right.pick_minimum()
+    return _join(left, minimum, right)
+
+
+def _split(node, val):
+    """
+    Split a subtree around a value.
+
+    Returns a tuple of the subtree of values less than val, the now detached
+    node holding val (or None if it was not present), and the subtree of
+    values greater than val.
+    """
+    if node is None:
+        return None, None, None
+    left, right = node.left, node.right
+    if val == node.val:
+        node.left = node.right = None
+        node.update_stats()
+        return left, node, right
+    elif val < node.val:
+        less, found, greater = _split(left, val)
+        return less, found, _join(greater, node, right)
+    else:
+        less, found, greater = _split(right, val)
+        return _join(left, node, less), found, greater
+
+
+def _split_index(node, index):
+    """
+    Split a subtree by position, returning a tuple of the subtree of its first
+    index values and the subtree of the rest.
+    """
+    if node is None:
+        return None, None
+    left, right = node.left, node.right
+    left_len = left.len_ if left is not None else 0
+    if index <= left_len:
+        less, greater = _split_index(left, index)
+        return less, _join(greater, node, right)
+    else:
+        less, greater = _split_index(right, index - left_len - 1)
+        return _join(left, node, less), greater
+
+
+def _union_sorted(node, keys, start, stop, values=None, make_node=_BSTNode):
+    """
+    Add the sorted, unique values in keys[start:stop] to the subtree and
+    return its new root, in O(k log(n/k + 1)) time for k values.
+
+    New nodes are made from the corresponding entries in values if given.
+    """
+    if values is None:
+        values = keys
+    if start >= stop:
+        return node
+    if node is None:
+        return _build_balanced(values, start, stop, make_node)
+    mid = (start + stop - 1) >> 1
+    less, found, greater = _split(node, keys[mid])
+    if found is None:
+        found = make_node(values[mid])
+    return _join(
+        _union_sorted(less, keys, start, mid, values, make_node),
+        found,
+        _union_sorted(greater, keys, mid + 1, stop, values, make_node),
+    )
+
+
+def _difference_sorted(node, values, start, stop):
+    """
+    Remove the sorted, unique values in values[start:stop] from the subtree and
+    return its new root, in O(k log(n/k + 1)) time for k values.
+    """
+    if start >= stop or node is None:
+        return node
+    mid = (start + stop - 1) >> 1
+    less, _, greater = _split(node, values[mid])
+    return _join2(
+        _difference_sorted(less, values, start, mid),
+        _difference_sorted(greater, values, mid + 1, stop),
+    )
+
+
+def _intersection_sorted(node, values, start, stop):
+    """
+    Remove everything but the sorted, unique values in values[start:stop] from
+    the subtree and return its new root, in O(k log(n/k + 1)) time for k values.
+    """
+    if start >= stop or node is None:
+        return None
+    mid = (start + stop - 1) >> 1
+    less, found, greater = _split(node, values[mid])
+    left = _intersection_sorted(less, values, start, mid)
+    right = _intersection_sorted(greater, values, mid + 1, stop)
+    if found is None:
+        return _join2(left, right)
+    else:
+        return _join(left, found, right)
+
+
+def _symmetric_difference_sorted(node, keys, start, stop, values=None, make_node=_BSTNode):
+    """
+    Remove the sorted, unique values in keys[start:stop] from the subtree if
+    they are present and add them if they are not, and return its new root, in
+    O(k log(n/k + 1)) time for k values.
+
+    New nodes are made from the corresponding entries in values if given.
+    """
+    if values is None:
+        values = keys
+    if start >= stop:
+        return node
+    if node is None:
+        return _build_balanced(values, start, stop, make_node)
+    mid = (start + stop - 1) >> 1
+    less, found, greater = _split(node, keys[mid])
+    left = _symmetric_difference_sorted(less, keys, start, mid, values, make_node)
+    right = _symmetric_difference_sorted(greater, keys, mid + 1, stop, values, make_node)
+    if found is None:
+        return _join(left, make_node(values[mid]), right)
+    else:
+        return _join2(left, right)
+
+
+def _copy_subtree(node):
+    """Return a copy of the subtree, sharing its values but none of its nodes."""
+    if node is None:
+        return None
+    new = node.copy()
+    new.left = _copy_subtree(node.left)
+    new.right = _copy_subtree(node.right)
+    return new
+
+
+# Persistent trees
+#
+# These never modify a node once it is part of a tree. Every node on the path
+# to a change is copied instead, so an update costs O(log(n)) new nodes and
+# the old tree remains intact, sharing every other node with the new one.
+
+def _persistent_node(template, left, right):
+    """Return a new node with the template's contents and the given children."""
+    node = template.copy()
+    node.left, node.right = left, right
+    node.update_stats()
+    return node
+
+
+def _persistent_balance(template, left, right):
+    """
+    Return a new balanced subtree with the template's contents at its root
+    and the given children, rotating by way of new nodes if necessary.
+    """
+    left_depth = left.depth if left is not None else 0
+    right_depth = right.depth if right is not None else 0
+    if left_depth > right_depth + 1:
+        # left tree is deeper
+        inner = left.right
+        if (left.left.depth if left.left is not None else 0) >= (inner.depth if inner is not None else 0):
+            # single right rotation
+            return _persistent_node(left, left.left, _persistent_node(template, inner, right))
+        else:
+            # left-right case: the inner grandchild becomes the root
+            return _persistent_node(
+                inner,
+                _persistent_node(left, left.left, inner.left),
+                _persistent_node(template, inner.right, right),
+            )
+    elif right_depth > left_depth + 1:
+        # right tree is deeper
+        inner = right.left
+        if (right.right.depth if right.right is not None else 0) >= (inner.depth if inner is not None else 0):
+            # single left rotation
+            return _persistent_node(right, _persistent_node(template, left, inner), right.right)
+        else:
+            # right-left case: the inner grandchild becomes the root
+            return _persistent_node(
+                inner,
+                _persistent_node(template, left, inner.left),
+                _persistent_node(right, inner.right, right.right),
+            )
+    else:
+        return _persistent_node(template, left, right)
+
+
+def _persistent_insert(node, key, new_node):
+    """
+    Return the root of a subtree like the given one but also containing the
+    detached new_node, sorted by key. If the key is already present the
+    subtree is returned unchanged.
+    """
+    if node is None:
+        return new_node
+    if key == node.val:
+        return node
+    elif key < node.val:
+        left = _persistent_insert(node.left, key, new_node)
+        if left is node.left:
+            return node
+        return _persistent_balance(node, left, node.right)
+    else:
+        right = _persistent_insert(node.right, key, new_node)
+        if right is node.right:
+            return node
+        return _persistent_balance(node, node.left, right)
+
+
+def _persistent_pick_minimum(node):
+    """
+    Return the root of a subtree like the given one without its minimum, and
+    the node that held the minimum.
+    """
+    if node.left is None:
+        return node.right, node
+    left, minimum = _persistent_pick_minimum(node.left)
+    return _persistent_balance(node, left, node.right), minimum
+
+
+def _persistent_remove(node, key):
+    """
+    Return the root of a subtree like the given one without the given key. If
+    the key is not present the subtree is returned unchanged.
+    """
+    if node is None:
+        return None
+    if key == node.val:
+        if node.left is None:
+            return node.right
+        if node.right is None:
+            return node.left
+        right, successor = _persistent_pick_minimum(node.right)
+        return _persistent_balance(successor, node.left, right)
+    elif key < node.val:
+        left = _persistent_remove(node.left, key)
+        if left is node.left:
+            return node
+        return _persistent_balance(node, left, node.right)
+    else:
+        right = _persistent_remove(node.right, key)
+        if right is node.right:
+            return node
+        return _persistent_balance(node, node.left, right)
+
+
+# Serialization
+#
+# Dumped trees are a header of a magic number, a one-byte format code and the
+# item count, followed by the items in sorted order. Trees of only ints or only
+# floats store them as packed 64 bit values, and trees of only strings or only
+# bytes as a table of lengths followed by the concatenated data. Anything else
+# is pickled as a list.
+
+_DUMP_MAGIC = b'BST1'
+_DUMP_HEADER = struct.Struct('<4scQ')
+_INT64_MIN, _INT64_MAX = -1 << 63, (1 << 63) - 1
+
+
+def _packed(values, typecode):
+    """Return the bytes of an array of the values, little-endian."""
+    packed = array(typecode, values)
+    if sys.byteorder != 'little':  # pragma: no cover
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpacked(data, typecode):
+    """Return the values from the little-endian bytes of an array."""
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if sys.byteorder != 'little':  # pragma: no cover
+        unpacked.byteswap()
+    return unpacked.tolist()
+
+
+def _dump_values(values, fileobj):
+    """Write the list of values to the binary file object."""
+    types = set(map(type, values))
+    # the values are in the tree's order, which for keyed trees need not be numeric
+    if types == {int} and _INT64_MIN <= min(values) and max(values) <= _INT64_MAX:
+        code, chunks = b'q', [_packed(values, 'q')]
+    elif types == {float}:
+        code, chunks = b'd', [_packed(values, 'd')]
+    elif types == {str} or types == {bytes}:
+        if types == {str}:
+            code = b's'
+            values = [value.encode('utf-8') for value in values]
+        else:
+            code = b'b'
+        chunks = [_packed(map(len, values), 'I')]
+        chunks.extend(values)
+    else:
+        code, chunks = b'p', [pickle.dumps(values, pickle.HIGHEST_PROTOCOL)]
+    fileobj.write(_DUMP_HEADER.pack(_DUMP_MAGIC, code, len(values)))
+    for chunk in chunks:
+        fileobj.write(chunk)
+
+
+def _read_exactly(fileobj, size):
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise ValueError("unexpected end of dumped tree")
+    return data
+
+
+def _load_values(fileobj):
+    """Read a list of values written by _dump_values from the binary file object."""
+    magic, code, count = _DUMP_HEADER.unpack(_read_exactly(fileobj, _DUMP_HEADER.size))
+    if magic != _DUMP_MAGIC:
+        raise ValueError("not a dumped tree")
+    if code in (b'q', b'd'):
+        return _unpacked(_read_exactly(fileobj, 8 * count), code.decode())
+    elif code in (b's', b'b'):
+        lengths = _unpacked(_read_exactly(fileobj, 4 * count), 'I')
+        data = _read_exactly(fileobj, sum(lengths))
+        values = []
+        offset = 0
+        for length in lengths:
+            values.append(data[offset:offset + length])
+            offset += length
+        if code == b's':
+            values = [value.decode('utf-8') for value in values]
+        return values
+    elif code == b'p':
+        # the pickle reads only as much of the file as it occupies
+        return pickle.load(fileobj)
+    else:
+        raise ValueError("unknown dumped tree format")
+
+
+def _check_index(index, length):
+    """
+    Validate an index into a tree of the given length, returning the
+    equivalent non-negative index.
+    """
+    if not isinstance(index, int):
+        raise TypeError("indices must be integers")
+    if index < 0:
+        # support negative indexing from the end
+        index += length
+    if index < 0 or index >= length:
+        raise IndexError
+    return index
+
+
+class _BSTBase(object):
+    """Operations shared by all the tree-backed sorted sets, none of which modify the tree."""
+
+    # counts changes to the tree, so that cursors can tell when their place is lost
+    _version = 0
+
+    @classmethod
+    def from_sorted(cls, items, key=None):
+        """
+        Create a new, perfectly balanced tree from items that are already in
+        sorted order (by the key function, if given) in O(n) time. Duplicate
+        items are ignored.
+
+        Raises ValueError if the items are not sorted.
+        """
+        return cls(key=key)._fill_sorted(items)
+
+    def _fill_sorted(self, items):
+        """Fill this empty tree from items already in sorted order, and return it."""
+        key = self._key
+        if key is None:
+            values = _sorted_unique(items)
+        else:
+            values = _sorted_unique_items(((key(item), item) for item in items), replace=False)
+        if values is None:
+            raise ValueError("items must be in sorted order")
+        self._head = _build_balanced(values, 0, len(values), self._make_node)
+        return self
+
+    @classmethod
+    def load(cls, fileobj, key=None):
+        """
+        Create a new tree from the items written to a binary file object by
+        dump(), in O(n) time. A tree that had a key function must be given
+        the same one again.
+        """
+        return cls.from_sorted(_load_values(fileobj), key=key)
+
+    def dump(self, fileobj):
+        """
+        Write the items of the tree to a binary file object in a compact form
+        that load() can read back. Trees of ints, floats, strings or bytes are
+        written as packed data, and trees of other items as a pickled list.
+        """
+        _dump_values(list(self), fileobj)
+
+    def __reduce__(self):
+        # pickle the items as a flat list rather than as nested nodes, and
+        # rebuild the tree from them in linear time
+        return type(self).from_sorted, (list(self), self._key)
+
+    def _sort_key(self, item):
+        """Return what the tree sorts the given item by."""
+        return item if self._key is None else self._key(item)
+
+    def _from_head(self, head):
+        """Create a new tree like this one around the given root node."""
+        tree = object.__new__(type(self))
+        # share everything but the nodes, such as the key function and node factory
+        tree.__dict__.update(self.__dict__)
+        tree._head = head
+        return tree
+
+    def contains(self, item):
+        """Return True if the given item is in the tree."""
+        key = self._key
+        return _find_node(self._head, item if key is None else key(item)) is not None
+
+    __contains__ = contains
 
     def in_order(self):
-        """Traverse the subtree in-order."""
-        if self.left:
-            for item in self.left.in_order():
-                yield item
-        yield self.val
-        if self.right:
-            for item in self.right.in_order():
-                yield item
+        """Traverse the tree in-order."""
+        return map(self._get, _in_order_nodes(_left_spine(self._head)))
+
+    __iter__ = in_order
+
+    def reverse_order(self):
+        """Traverse the tree in reversed in-order"""
+        return map(self._get, _reverse_order_nodes(_right_spine(self._head)))
+
+    __reversed__ = reverse_order
 
     def pre_order(self):
-        """Traverse the subtree pre-order."""
-        yield self.val
-        if self.left:
-            for item in self.left.pre_order():
-                yield item
-        if self.right:
-            for item in self.right.pre_order():
-                yield item
+        """Traverse the tree pre-order."""
+        if self._head:
+            return map(self._get, _pre_order_nodes(self._head))
+        else:
+            return iter(())
 
     def post_order(self):
-        """Traverse the subtree post-order."""
-        if self.left:
-            for item in self.left.post_order():
-                yield item
-        if self.right:
-            for item in self.right.post_order():
-                yield item
-        yield self.val
+        """Traverse the tree post-order."""
+        if self._head:
+            return map(self._get, _post_order_nodes(self._head))
+        else:
+            return iter(())
 
-    def reverse_order(self):
-        """Traverse the subtree in reverse in-order."""
-        if self.right:
-            for item in self.right.reverse_order():
-                yield item
-        yield self.val
-        if self.left:
-            for item in self.left.reverse_order():
-                yield item
-
-    def get_index(self, index):
-        """Return the index'th value of this sub-tree in sorted order"""
-        if self.left:
-            # inspector thinks self.left isn't sized
-            # noinspection PyTypeChecker
-            left_len = len(self.left)
-            if index >= left_len:
-                # skip over entire left tree
-                index -= left_len
-            else:
-                return self.left.get_index(index)
-        # we have skipped the left side
-        if index == 0:
-            return self.val
+    def breadth_first(self):
+        """Traverse the tree breadth-first."""
+        if self._head:
+            get = self._get
+            q = deque((self._head,))
+            while q:
+                node = q.pop()
+                yield get(node)
+                if node.left is not None:
+                    q.appendleft(node.left)
+                if node.right is not None:
+                    q.appendleft(node.right)
+
+    def __getitem__(self, index):
+        """
+        Get an item from the tree by index, in sorted order.
+
+        Slicing returns a list of the items in O(log(n) + k) time for k items.
+        """
+        if isinstance(index, slice):
+            return list(self.islice(index.start, index.stop, index.step))
+        index = _check_index(index, len(self))
+        return self._get(self._head.node_at(index))
+
+    def islice(self, start=None, stop=None, step=None):
+        """
+        Iterate over the items with indices in the given slice, in sorted order
+        (or reversed, for a negative step). Finding the first item takes
+        O(log(n)) time, and every item after it amortized O(1) per index stepped.
+        """
+        start, stop, step = slice(start, stop, step).indices(len(self))
+        return map(self._get, _slice_nodes(self._head, start, stop, step))
+
+    def irange(self, start, stop, inclusive=(True, True), reverse=False):
+        """
+        Iterate over the items within the given range in sorted order, or
+        in reverse sorted order from stop down to start if reverse is True.
+        """
+        if self._head is None or (stop is not None and start is not None and stop < start):
+            return iter(())
         else:
-            index -= 1
-        # we have skipped our own value as well now
-        # it must be in the right side subtree
-        return self.right.get_index(index)
+            return map(self._get, _irange_nodes(self._head, start, stop, inclusive, reverse))
 
-    def del_index(self, index):
-        """Delete the index'th value of this sub-tree in sorted order
-        and return what this node should be replaced with"""
-        if self.left:
-            # inspector thinks self.left isn't sized
-            # noinspection PyTypeChecker
-            left_len = len(self.left)
-            if index >= left_len:
-                # skip over entire left tree
-                index -= left_len
+    def cursor(self, start=None, inclusive=True):
+        """
+        Return a BSTCursor positioned before the first item at or after start
+        (strictly after, if not inclusive), or before the first item in the
+        tree if start is None.
+        """
+        return BSTCursor(self, start, inclusive)
+
+    def _nearby(self, node):
+        return None if node is None else self._get(node)
+
+    def floor(self, value):
+        """Return the greatest item at or below the given value, or None."""
+        return self._nearby(_floor_node(self._head, value))
+
+    def ceiling(self, value):
+        """Return the least item at or above the given value, or None."""
+        return self._nearby(_ceiling_node(self._head, value))
+
+    def lower(self, value):
+        """Return the greatest item strictly below the given value, or None."""
+        return self._nearby(_floor_node(self._head, value, inclusive=False))
+
+    def higher(self, value):
+        """Return the least item strictly above the given value, or None."""
+        return self._nearby(_ceiling_node(self._head, value, inclusive=False))
+
+    def min(self):
+        """Return the least item in the tree, raising ValueError if it is empty."""
+        if self._head is None:
+            raise ValueError("min() of an empty tree")
+        return self._get(_min_node(self._head))
+
+    def max(self):
+        """Return the greatest item in the tree, raising ValueError if it is empty."""
+        if self._head is None:
+            raise ValueError("max() of an empty tree")
+        return self._get(_max_node(self._head))
+
+    def nearest(self, value, k=1):
+        """
+        Return a list of the (up to) k items nearest to the given value, nearest
+        first, in O(log(n) + k) time. Where two items are equally near the
+        lesser comes first. Values must support subtraction to find distances.
+        """
+        after = _in_order_nodes(_lower_bound_spine(self._head, value, True))
+        before = _reverse_order_nodes(_upper_bound_spine(self._head, value, False))
+        next_after = next(after, None)
+        next_before = next(before, None)
+        result = []
+        while len(result) < k:
+            if next_after is None:
+                if next_before is None:
+                    break
+                take_before = True
+            elif next_before is None:
+                take_before = False
             else:
-                self.left = self.left.del_index(index)
-                return self.rebalance()
-        # we have skipped the left side
-        if index == 0:
-            return self.drop()
-        else:
-            index -= 1
-        # we have skipped our own value as well now
-        # it must be in the right side subtree
-        self.right = self.right.del_index(index)
-        return self.rebalance()
-
-    def irange(self, start, stop, inclusive):
-        # when stop <= self.val we can eliminate stop for the left side
-        # when start >= self.val we can eliminate start for the right side
-        if start is None and stop is None:
-            # with no bounds, shortcut to faster traversal
-            for item in self.in_order():
-                yield item
-            return
+                take_before = value - next_before.val <= next_after.val - value
+            if take_before:
+                result.append(self._get(next_before))
+                next_before = next(before, None)
+            else:
+                result.append(self._get(next_after))
+                next_after = next(after, None)
+        return result
+
+    def index(self, item):
+        """Return the index of an item in sorted order, raising ValueError if it is not present."""
+        node = self._head
+        index = 0
+        key = self._sort_key(item)
+        while node is not None:
+            if key == node.val:
+                return index + (node.left.len_ if node.left is not None else 0)
+            elif key < node.val:
+                node = node.left
+            else:
+                index += 1 + (node.left.len_ if node.left is not None else 0)
+                node = node.right
+        raise ValueError("{0!r} is not in the tree".format(item))
 
-        # calculate whether the beginning and end of the range cover this node's value
-        starts_before_val = start is None or start < self.val
-        ends_after_val = stop is None or self.val < stop
+    def bisect_left(self, item):
+        """Return the index where the item would be inserted, before any equal item."""
+        return _rank(self._head, self._sort_key(item))
 
-        # cover left branch
-        if self.left and starts_before_val:
-            for item in self.left.irange(start, None if ends_after_val else stop, inclusive):
-                yield item
+    def bisect_right(self, item):
+        """Return the index where the item would be inserted, after any equal item."""
+        return _rank(self._head, self._sort_key(item), inclusive=True)
+
+    def count_range(self, start, stop, inclusive=(True, True)):
+        """
+        Return the number of items in the given range in O(log(n)) time, equal
+        to the number of items irange() would produce for the same range.
+        """
+        if start is not None and start == stop:
+            # a range that begins and ends on the same value covers it if either end does
+            inclusive = (True, True) if any(inclusive) else (False, False)
+        begin = 0 if start is None else _rank(self._head, start, not inclusive[0])
+        end = len(self) if stop is None else _rank(self._head, stop, inclusive[1])
+        return max(0, end - begin)
+
+    def size(self):
+        """Return the number of items in the tree."""
+        # noinspection PyTypeChecker
+        return len(self._head) if self._head else 0
 
-        # yield this value if it's covered by the range
-        if (
-            (starts_before_val and ends_after_val) or
-            (inclusive[0] and start == self.val) or
-            (inclusive[1] and stop == self.val)
-        ):
-            yield self.val
+    __len__ = size
 
-        # cover right branch
-        if self.right and ends_after_val:
-            for item in self.right.irange(None if starts_before_val else start, stop, inclusive):
-                yield item
+    def depth(self):
+        """Return the depth of the tree's lowest leaf node."""
+        return self._head.depth if self._head else 0
+
+    def balance(self):
+        """
+        Return the difference in depth of the left and right sides of the
+        tree's head. 0 means balanced, positive means the left side is
+        deeper, negative means the right side is deeper.
+        """
+        if self._head:
+            return self._head.balance
+        else:
+            return 0
+
+    def __repr__(self):
+        return "{0}.{1}({2})".format(
+            type(self).__module__, type(self).__name__, list(self) if self else ""
+        )
 
 
-class BST(object):
+class BST(_BSTBase):
     """
     Binary Search Tree.
 
@@ -350,135 +1381,690 @@ class BST(object):
     >>> del b[1]
     >>> b
     data_structures.bst.BST(['a', 'c'])
+
+    Slices of the tree by index are lists:
+
+    >>> b = BST(range(10))
+    >>> b[2:5]
+    [2, 3, 4]
+    >>> del b[1:-1]
+    >>> b
+    data_structures.bst.BST([0, 9])
+
+    Trees support set operations with each other:
+
+    >>> BST([1, 2, 3]) & BST([2, 3, 4])
+    data_structures.bst.BST([2, 3])
+    >>> BST([1, 2, 3]) ^ BST([2, 3, 4])
+    data_structures.bst.BST([1, 4])
+
+    Trees can be built from already-sorted items in linear time:
+
+    >>> BST.from_sorted([1, 2, 2, 3])
+    data_structures.bst.BST([1, 2, 3])
+
+    and so can be saved to a file and loaded again quickly:
+
+    >>> from io import BytesIO
+    >>> f = BytesIO()
+    >>> BST([3, 1, 2]).dump(f)
+    >>> _ = f.seek(0)
+    >>> BST.load(f)
+    data_structures.bst.BST([1, 2, 3])
+
+    The items nearest to a value can be found:
+
+    >>> b = BST([10, 20, 30, 40])
+    >>> b.floor(25), b.ceiling(25), b.lower(20), b.higher(20)
+    (20, 30, 10, 30)
+    >>> b.nearest(24, 3)
+    [20, 30, 10]
+
+    Items can be sorted by a key function instead of by their own value. Each
+    item's key is computed once, when it is added, and kept with it in the tree.
+    Items with equal keys are treated as the same item, and range and nearness
+    queries such as irange, count_range and floor take keys rather than items:
+
+    >>> b = BST([('b', 2), ('a', 3), ('c', 1)], key=lambda pair: pair[1])
+    >>> b
+    data_structures.bst.BST([('c', 1), ('b', 2), ('a', 3)])
+    >>> list(b.irange(2, None))
+    [('b', 2), ('a', 3)]
     """
 
-    def __init__(self, items=()):
+    # the types of the nodes of the tree, which balance it as they change
+    _node_type = _BSTNode
+    _map_node_type = _BSTMapNode
+
+    def __init__(self, items=(), key=None):
         """
-        Create a new tree.
-        If an iterable is passed, all of its items are added to the tree.
+        Create a new tree, optionally sorting its items by the given key function.
+        If an iterable is passed, all of its items are added to the tree. If
+        the items are already in sorted order the tree is built directly in
+        O(n) time rather than by inserting them one at a time.
         """
         self._head = None
-        for item in items:
-            self.insert(item)
+        self._key = key
+        # extracts an item from a node: keyed trees hold the key in val
+        self._get = _get_val if key is None else _get_value
+        # makes a node from a value, or from a (key, item) pair for keyed trees
+        if key is None:
+            self._make_node = self._node_type
+        else:
+            map_node_type = self._map_node_type
+            self._make_node = lambda entry: map_node_type(*entry)
+        if key is None:
+            items = list(items)
+            values = _sorted_unique(items)
+            if values is not None:
+                self._head = _build_balanced(values, 0, len(values), self._make_node)
+            else:
+                for item in items:
+                    self.insert(item)
+        else:
+            entries = [(key(item), item) for item in items]
+            sorted_entries = _sorted_unique_items(entries, replace=False)
+            if sorted_entries is not None:
+                self._head = _build_balanced(sorted_entries, 0, len(sorted_entries), self._make_node)
+            else:
+                for item_key, item in entries:
+                    self._insert_keyed(item_key, item)
 
     def insert(self, item):
         """Insert an item into the BST. If it is already present, ignore."""
+        self._version += 1
+        if self._key is not None:
+            self._insert_keyed(self._key(item), item)
+            return
         hash(item)  # reject mutable items
         if self._head:
             self._head = self._head.insert(item)
         else:
-            self._head = _BSTNode(item)
+            self._head = self._make_node(item)
+
+    def _insert_keyed(self, key, item):
+        """Insert an item with its already computed key."""
+        hash(key)  # reject mutable keys
+        if self._head:
+            self._head = self._head.insert(key, item, replace=False)
+        else:
+            self._head = self._make_node((key, item))
 
     def delete(self, item):
         """Delete an item from the BST if it exists."""
+        self._version += 1
         if self._head:
-            self._head = self._head.remove_val(item)
+            self._head = self._head.remove_val(self._sort_key(item))
 
-    def contains(self, item):
-        """Return True if the given item is in the tree."""
-        return self._head is not None and item in self._head
+    def _sorted_keys(self, items):
+        """Return the sort keys of the given items sorted, without duplicates."""
+        if self._key is None:
+            return _sorted_values(items)
+        else:
+            return _sorted_values(map(self._key, items))
 
-    __contains__ = contains
+    def update(self, items):
+        """
+        Insert all the given items into the BST.
 
-    def in_order(self):
-        """Traverse the tree in-order."""
-        if self._head:
-            return self._head.in_order()
+        The items are sorted and merged into the tree in one pass, which for k
+        items takes O(k log(n/k + 1)) time rather than k separate insertions.
+        """
+        self._version += 1
+        if self._key is None:
+            values = _sorted_values(items)
+            self._head = _union_sorted(self._head, values, 0, len(values), make_node=self._make_node)
         else:
-            return iter(())
+            entries = _sorted_entries(items, self._key)
+            keys = [entry[0] for entry in entries]
+            self._head = _union_sorted(self._head, keys, 0, len(keys), entries, self._make_node)
 
-    __iter__ = in_order
+    def difference_update(self, items):
+        """
+        Delete all the given items from the BST if they exist.
 
-    def reverse_order(self):
-        """Traverse the tree in reversed in-order"""
-        if self._head:
-            return self._head.reverse_order()
-        else:
-            return iter(())
+        The items are sorted and removed from the tree in one pass, which for k
+        items takes O(k log(n/k + 1)) time rather than k separate deletions.
+        """
+        self._version += 1
+        keys = self._sorted_keys(items)
+        self._head = _difference_sorted(self._head, keys, 0, len(keys))
 
-    __reversed__ = reverse_order
+    def intersection_update(self, items):
+        """
+        Delete all the items from the BST that are not among the given items.
 
-    def pre_order(self):
-        """Traverse the tree pre-order."""
-        if self._head:
-            return self._head.pre_order()
-        else:
-            return iter(())
+        The items are sorted and intersected with the tree in one pass, which
+        for k items takes O(k log(n/k + 1)) time.
+        """
+        self._version += 1
+        keys = self._sorted_keys(items)
+        self._head = _intersection_sorted(self._head, keys, 0, len(keys))
 
-    def post_order(self):
-        """Traverse the tree post-order."""
-        if self._head:
-            return self._head.post_order()
+    def symmetric_difference_update(self, items):
+        """
+        Delete the given items that are in the BST, and insert those that are not.
+
+        The items are sorted and merged with the tree in one pass, which for k
+        items takes O(k log(n/k + 1)) time.
+        """
+        self._version += 1
+        if self._key is None:
+            values = _sorted_values(items)
+            self._head = _symmetric_difference_sorted(
+                self._head, values, 0, len(values), make_node=self._make_node)
         else:
-            return iter(())
+            entries = _sorted_entries(items, self._key)
+            keys = [entry[0] for entry in entries]
+            self._head = _symmetric_difference_sorted(
+                self._head, keys, 0, len(keys), entries, self._make_node)
+
+    def copy(self):
+        """Return a shallow copy of the tree in O(n) time."""
+        return self._from_head(_copy_subtree(self._head))
+
+    __copy__ = copy
+
+    # Set operators with other trees. Each works by copying the left operand in
+    # O(n) and merging the other's (already sorted) items into it in one pass.
+    # The result is always a tree like the left operand, with its type, key
+    # function and balancing, whatever the type and size of the right one.
+
+    def __or__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        result = self.copy()
+        result.update(other)
+        return result
+
+    def __and__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        if len(other) < len(self):
+            # the result is no bigger than the other tree, so rather than copying
+            # this one, look the other's items up in it and build the result
+            # (still a tree like this one) from the items found
+            nodes = (_find_node(self._head, key) for key in self._sorted_keys(other))
+            return self._from_head(None)._fill_sorted([self._get(node) for node in nodes if node is not None])
+        result = self.copy()
+        result.intersection_update(other)
+        return result
+
+    def __sub__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        result = self.copy()
+        result.difference_update(other)
+        return result
+
+    def __xor__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        result = self.copy()
+        result.symmetric_difference_update(other)
+        return result
+
+    def __ior__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        if not isinstance(other, _BSTBase):
+            return NotImplemented
+        self.symmetric_difference_update(other)
+        return self
+
+    def split(self, item):
+        """
+        Split the tree into two trees in O(log(n)) time: one with the items less
+        than the given item, and one with the rest. Returns (lower, upper).
 
-    def breadth_first(self):
-        """Traverse the tree breadth-first."""
-        if self._head:
-            q = deque((self._head,))
-            while q:
-                node = q.pop()
-                yield node.val
-                if node.left:
-                    q.appendleft(node.left)
-                if node.right:
-                    q.appendleft(node.right)
+        The nodes of this tree are reused by the two new trees, so this tree is
+        left empty.
+        """
+        self._version += 1
+        less, found, greater = _split(self._head, self._sort_key(item))
+        if found is not None:
+            greater = _join(None, found, greater)
+        self._head = None
+        return self._from_head(less), self._from_head(greater)
 
-    def __getitem__(self, index):
-        """Get an item from the tree by index, in sorted order."""
-        if not isinstance(index, int):
-            raise TypeError("indices must be integers")
-        if index < 0:
-            # support negative indexing from the end
-            index += len(self)
-        if index < 0 or index >= len(self):
-            raise IndexError
-        return self._head.get_index(index)
+    def _check_joinable(self, other):
+        """
+        Raise TypeError or ValueError unless the other tree's nodes can be
+        moved into this one: they must be of the same kinds, sorted the same
+        way. This also keeps persistent trees, whose nodes may be shared, out.
+        """
+        if type(other) is not type(self):
+            raise TypeError("cannot join a {0} into a {1}".format(
+                type(other).__name__, type(self).__name__))
+        if other._key is not self._key:
+            raise ValueError("cannot join trees with different key functions")
+
+    def join(self, other):
+        """
+        Move all the items of another tree into this one in O(log(n)) time. The
+        items of the two trees must not overlap: every item in one of them must
+        be less than every item in the other, otherwise ValueError is raised.
+
+        The nodes of the other tree are reused by this one, so it is left empty.
+        It must be a tree of the same type with the same key function, otherwise
+        TypeError or ValueError is raised and neither tree is changed.
+        """
+        if other is self:
+            raise ValueError("cannot join a tree with itself")
+        self._check_joinable(other)
+        if self._head is None or other._head is None:
+            self._head = self._head if self._head is not None else other._head
+        elif _max_node(self._head).val < _min_node(other._head).val:
+            self._head = _join2(self._head, other._head)
+        elif _max_node(other._head).val < _min_node(self._head).val:
+            self._head = _join2(other._head, self._head)
+        else:
+            raise ValueError("cannot join trees with overlapping items")
+        self._version += 1
+        other._version += 1
+        other._head = None
 
     def __delitem__(self, index):
-        """Delete an item from the tree by index, in sorted order."""
-        if not isinstance(index, int):
-            raise TypeError("indices must be integers")
-        if index < 0:
-            # support negative indexing from the end
-            index += len(self)
-        if index < 0 or index >= len(self):
-            raise IndexError
+        """
+        Delete an item from the tree by index, in sorted order.
+
+        Deleting a contiguous slice splits the whole run out of the tree at once
+        in O(log(n)) time.
+        """
+        self._version += 1
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                if start < stop:
+                    less, rest = _split_index(self._head, start)
+                    _, greater = _split_index(rest, stop - start)
+                    self._head = _join2(less, greater)
+            else:
+                # delete from the end of the tree backwards so earlier indices stay put
+                for i in sorted(range(start, stop, step), reverse=True):
+                    self._head = self._head.del_index(i)
+            return
+        index = _check_index(index, len(self))
         self._head = self._head.del_index(index)
 
-    def irange(self, start, stop, inclusive=(True, True)):
-        if self._head is None or (stop is not None and start is not None and stop < start):
-            return iter(())
-        else:
-            return self._head.irange(start, stop, inclusive)
+    def pop_min(self):
+        """Remove and return the least item in the tree, raising IndexError if it is empty."""
+        if self._head is None:
+            raise IndexError("pop from an empty tree")
+        self._version += 1
+        self._head, node = self._head.pick_minimum()
+        return self._get(node)
+
+    def pop_max(self):
+        """Remove and return the greatest item in the tree, raising IndexError if it is empty."""
+        if self._head is None:
+            raise IndexError("pop from an empty tree")
+        self._version += 1
+        item = self._get(_max_node(self._head))
+        self._head = self._head.del_index(self._head.len_ - 1)
+        return item
 
     def clear(self):
         """Empties the tree."""
+        self._version += 1
         self._head = None
 
-    def size(self):
-        """Return the number of items in the tree."""
-        # noinspection PyTypeChecker
-        return len(self._head) if self._head else 0
 
-    __len__ = size
+class PersistentBST(_BSTBase):
+    """
+    Immutable binary search tree.
 
-    def depth(self):
-        """Return the depth of the tree's lowest leaf node."""
-        return self._head.depth if self._head else 0
+    Instead of changing the tree, insert and delete return a new tree in
+    O(log(n)) time. The new tree shares every node that did not change with
+    the old one, which remains exactly as it was, so any tree can be kept as a
+    consistent snapshot and read from while newer versions are made.
 
-    def balance(self):
+    >>> a = PersistentBST([1, 2, 3])
+    >>> b = a.insert(4).delete(1)
+    >>> b
+    data_structures.bst.PersistentBST([2, 3, 4])
+    >>> a
+    data_structures.bst.PersistentBST([1, 2, 3])
+
+    Otherwise it provides all of the operations of BST that do not modify
+    the tree.
+    """
+
+    def __init__(self, items=(), key=None):
         """
-        Return the difference in depth of the left and right sides of the
-        tree's head. 0 means balanced, positive means the left side is
-        deeper, negative means the right side is deeper.
+        Create a new tree, optionally sorting its items by the given key
+        function, from the items of an iterable.
         """
-        if self._head:
-            return self._head.balance
+        self._head = None
+        self._key = key
+        self._get = _get_val if key is None else _get_value
+        self._make_node = _BSTNode if key is None else _make_map_node
+        if key is None:
+            values = _sorted_values(items)
+            self._head = _build_balanced(values, 0, len(values), self._make_node)
         else:
-            return 0
+            entries = _sorted_entries(items, key)
+            self._head = _build_balanced(entries, 0, len(entries), self._make_node)
+
+    def insert(self, item):
+        """Return a tree with the item inserted. If it is already present, return this tree."""
+        key = self._key
+        if key is None:
+            hash(item)  # reject mutable items
+            head = _persistent_insert(self._head, item, self._make_node(item))
+        else:
+            item_key = key(item)
+            hash(item_key)  # reject mutable keys
+            head = _persistent_insert(self._head, item_key, self._make_node((item_key, item)))
+        return self if head is self._head else self._from_head(head)
+
+    def delete(self, item):
+        """Return a tree with the item deleted. If it is not present, return this tree."""
+        head = _persistent_remove(self._head, self._sort_key(item))
+        return self if head is self._head else self._from_head(head)
+
+
+class BSTCursor(object):
+    """
+    A resumable place in a tree, between two of its items (or at either end),
+    that can be moved forwards and backwards one item at a time.
+
+    >>> b = BST(range(0, 100, 10))
+    >>> c = b.cursor(35)
+    >>> c.next(), c.next(), c.prev()
+    (40, 50, 50)
+
+    Cursors are iterators over the items after them, which makes paging easy:
+
+    >>> from itertools import islice
+    >>> list(islice(c, 3))
+    [50, 60, 70]
+    >>> list(islice(c, 3))
+    [80, 90]
+
+    Moving forwards or backwards takes amortized O(1) time. A cursor keeps its
+    place between the items around it if the tree changes, finding its way
+    back again on its next move in O(log(n)) time:
+
+    >>> c.seek(20)
+    >>> b.delete(20)
+    >>> c.next()
+    30
+    """
+
+    def __init__(self, tree, start=None, inclusive=True):
+        self._tree = tree
+        self.seek(start, inclusive)
+
+    def _reset(self, path, before):
+        # The cursor is just before or just after the last node on a path down
+        # from the root, or at the end of an empty tree when there is none.
+        self._path = path
+        self._before = before
+        self._version = self._tree._version
+
+    def seek(self, key, inclusive=True):
+        """
+        Move the cursor to just before the first item at or after key (strictly
+        after, if not inclusive), or to the beginning of the tree if key is None.
+
+        Seeking past an item without including it puts the cursor just after
+        the last item at or before that key, ready to move backwards from it.
+        """
+        node = self._tree._head
+        if key is None:
+            self._reset(_left_spine(node), True)
+            return
+        path = []
+        found = 0
+        while node is not None:
+            path.append(node)
+            if key < node.val or (inclusive and key == node.val):
+                found = len(path)
+                if key == node.val:
+                    break
+                node = node.left
+            else:
+                node = node.right
+        if found:
+            del path[found:]
+            self._reset(path, True)
+        else:
+            self.seek_end()
+
+    def seek_end(self):
+        """Move the cursor to just after the last item in the tree."""
+        self._reset(_right_spine(self._tree._head), False)
+
+    def _check_version(self):
+        """Find the cursor's place again if the tree has changed."""
+        if self._version != self._tree._version:
+            path = self._path
+            if not path:
+                self.seek(None)
+            else:
+                self.seek(path[-1].val, inclusive=self._before)
+
+    def next(self):
+        """Move the cursor past the next item and return it, raising StopIteration at the end."""
+        self._check_version()
+        path = self._path
+        if not path:
+            raise StopIteration
+        if self._before:
+            self._before = False
+            return self._tree._get(path[-1])
+        node = path[-1]
+        if node.right is not None:
+            _left_spine(node.right, path)
+        else:
+            # climb until coming up from a left child
+            while True:
+                child = path.pop()
+                if not path:
+                    # that was the last node; stay after it
+                    self.seek_end()
+                    raise StopIteration
+                if path[-1].left is child:
+                    break
+        return self._tree._get(path[-1])
+
+    __next__ = next
+
+    def prev(self):
+        """
+        Move the cursor back past the previous item and return it, raising
+        StopIteration at the beginning.
+        """
+        self._check_version()
+        path = self._path
+        if not path:
+            raise StopIteration
+        if not self._before:
+            self._before = True
+            return self._tree._get(path[-1])
+        node = path[-1]
+        if node.left is not None:
+            _right_spine(node.left, path)
+        else:
+            # climb until coming up from a right child
+            while True:
+                child = path.pop()
+                if not path:
+                    # that was the first node; stay before it
+                    self.seek(None)
+                    raise StopIteration
+                if path[-1].right is child:
+                    break
+        return self._tree._get(path[-1])
+
+    def __iter__(self):
+        return self
+
+
+class BSTMap(object):
+    """
+    Sorted map from keys to values, using the same balanced tree as BST.
+
+    >>> m = BSTMap()
+    >>> m['two'] = 2
+    >>> m['one'] = 1
+    >>> m['three'] = 3
+    >>> m
+    data_structures.bst.BSTMap([('one', 1), ('three', 3), ('two', 2)])
+    >>> m['three']
+    3
+
+    Keys are iterated over in sorted order:
+
+    >>> list(m)
+    ['one', 'three', 'two']
+
+    Items in a range of keys can be traversed without any further lookups:
+
+    >>> list(m.irange_items('p', None))
+    [('three', 3), ('two', 2)]
+
+    The nearest items at or around a key can be found:
+
+    >>> m.floor('p')
+    ('one', 1)
+    >>> m.ceiling('p')
+    ('three', 3)
+
+    Items can also be accessed by their index in sorted order:
+
+    >>> m.item_at(-1)
+    ('two', 2)
+    """
+
+    def __init__(self, items=()):
+        """
+        Create a new map.
+        Accepts a mapping or an iterable of (key, value) pairs to add to the map.
+        If the keys are already in sorted order the tree is built in O(n) time.
+        """
+        self._head = None
+        if hasattr(items, 'items'):
+            items = items.items()
+        items = list(items)
+        sorted_items = _sorted_unique_items(items)
+        if sorted_items is not None:
+            self._head = _build_balanced(sorted_items, 0, len(sorted_items), _make_map_node)
+        else:
+            for key, value in items:
+                self[key] = value
+
+    def __setitem__(self, key, value):
+        """Set the value for a key, adding it to the map if it is not present."""
+        hash(key)  # reject mutable keys
+        if self._head is not None:
+            self._head = self._head.insert(key, value)
+        else:
+            self._head = _BSTMapNode(key, value)
+
+    def __getitem__(self, key):
+        """Return the value for the given key, raising KeyError if it is not present."""
+        node = _find_node(self._head, key)
+        if node is None:
+            raise KeyError(key)
+        return node.value
+
+    def get(self, key, default=None):
+        """Return the value for the given key, or default if it is not present."""
+        node = _find_node(self._head, key)
+        return default if node is None else node.value
+
+    def __delitem__(self, key):
+        """Remove a key from the map, raising KeyError if it is not present."""
+        length = len(self)
+        if self._head is not None:
+            self._head = self._head.remove_val(key)
+        if len(self) == length:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return _find_node(self._head, key) is not None
+
+    def __iter__(self):
+        """Iterate over the keys in sorted order."""
+        return map(_get_val, _in_order_nodes(_left_spine(self._head)))
+
+    keys = __iter__
+
+    def __reversed__(self):
+        """Iterate over the keys in reverse sorted order."""
+        return map(_get_val, _reverse_order_nodes(_right_spine(self._head)))
+
+    def values(self):
+        """Iterate over the values in sorted order of their keys."""
+        return map(_get_value, _in_order_nodes(_left_spine(self._head)))
+
+    def items(self):
+        """Iterate over the (key, value) pairs in sorted order."""
+        return map(_get_item, _in_order_nodes(_left_spine(self._head)))
+
+    def irange(self, start, stop, inclusive=(True, True), reverse=False):
+        """Iterate over the keys within the given range in sorted (or reverse sorted) order."""
+        return map(_get_val, self._irange_nodes(start, stop, inclusive, reverse))
+
+    def irange_items(self, start, stop, inclusive=(True, True), reverse=False):
+        """
+        Iterate over the (key, value) pairs with keys within the given range in
+        sorted (or reverse sorted) order.
+        """
+        return map(_get_item, self._irange_nodes(start, stop, inclusive, reverse))
+
+    def _irange_nodes(self, start, stop, inclusive, reverse):
+        if self._head is None or (stop is not None and start is not None and stop < start):
+            return iter(())
+        else:
+            return _irange_nodes(self._head, start, stop, inclusive, reverse)
+
+    def floor(self, key):
+        """Return the (key, value) pair with the greatest key at or below the given key, or None."""
+        node = _floor_node(self._head, key)
+        return None if node is None else (node.val, node.value)
+
+    def ceiling(self, key):
+        """Return the (key, value) pair with the least key at or above the given key, or None."""
+        node = _ceiling_node(self._head, key)
+        return None if node is None else (node.val, node.value)
+
+    def item_at(self, index):
+        """Return the (key, value) pair at the given index, in sorted order."""
+        index = _check_index(index, len(self))
+        node = self._head.node_at(index)
+        return node.val, node.value
+
+    def clear(self):
+        """Empties the map."""
+        self._head = None
+
+    def __len__(self):
+        return self._head.len_ if self._head is not None else 0
+
+    def depth(self):
+        """Return the depth of the map's lowest leaf node."""
+        return self._head.depth if self._head is not None else 0
 
     def __repr__(self):
-        return "data_structures.bst.BST({0})".format(
-            list(self) if self else ""
+        return "data_structures.bst.BSTMap({0})".format(
+            list(self.items()) if self else ""
         )
@@ -0,0 +1,431 @@
+# coding=utf-8
+
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+
+from data_structures.bst import _sorted_unique
+
+
+"""\
+Chunked sorted set module
+
+Provides ChunkedBST, an alternative to bst.BST that keeps its items in a
+list of sorted lists ("chunks") instead of a tree of nodes. Each item costs
+one list slot rather than a whole node, and scans walk contiguous lists,
+which makes it far more compact and faster to iterate for large sets.
+
+It is a separate class to be used in place of BST, rather than an option of
+BST's constructor, and supports the core of BST's interface: insert, delete,
+update, contains, indexing (and deleting by index or slice), islice, irange,
+in_order and reverse_order, index, bisect_left and bisect_right, count_range,
+clear, from_sorted and len(). It does not have BST's key functions, bulk
+set updates (difference_update, intersection_update and
+symmetric_difference_update), set operators, split and join, copy, floor,
+ceiling, lower, higher, nearest, min, max, pop_min and pop_max, cursors,
+dump and load, or the tree-shaped traversals and stats (pre_order,
+post_order, breadth_first, depth and balance).
+
+Runtime complexities for a chunk size of c are as follows:
+
+contains, bisect, count of items in a range: O(log(n))
+insert, delete: O(log(n) + c)
+index: O(log(n/c))
+size: O(1)
+construction from already-sorted items: O(n)
+"""
+
+
+class ChunkedBST(object):
+    """
+    Sorted set with the core of BST's interface, stored as a list of sorted chunks.
+
+    >>> b = ChunkedBST(['one', 'two', 'three'])
+    >>> b
+    data_structures.chunked.ChunkedBST(['one', 'three', 'two'])
+    >>> b.insert('four')
+    >>> b[0]
+    'four'
+    >>> list(b.irange('p', None))
+    ['three', 'two']
+    >>> b.delete('one')
+    >>> 'one' in b
+    False
+
+    Only the operations listed in the module documentation are provided; in
+    particular there is no key function, and the tree-shaped traversals of
+    BST (pre_order, post_order and breadth_first) have no meaning here.
+    """
+
+    # Chunks are split when they grow past twice this size and merged with a
+    # neighbour when they shrink below half of it.
+    chunk_size = 1000
+
+    def __init__(self, items=()):
+        """
+        Create a new set.
+        If an iterable is passed, all of its items are added to the set.
+        """
+        items = list(items)
+        values = _sorted_unique(items)
+        if values is None:
+            values = sorted(set(items))
+        self._reset(values)
+
+    @classmethod
+    def from_sorted(cls, items):
+        """
+        Create a new set from items that are already in sorted order in O(n)
+        time. Duplicate items are ignored.
+
+        Raises ValueError if the items are not sorted.
+        """
+        values = _sorted_unique(items)
+        if values is None:
+            raise ValueError("items must be in sorted order")
+        result = cls()
+        result._reset(values)
+        return result
+
+    def _reset(self, values):
+        """Replace the contents of the set with the given sorted, unique values."""
+        size = self.chunk_size
+        self._chunks = [values[i:i + size] for i in range(0, len(values), size)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(values)
+        self._index = None
+
+    # Positional index
+    #
+    # Chunk lengths are kept in a Fenwick tree so that the chunk holding any
+    # index can be found in O(log(n/c)). It is rebuilt lazily whenever chunks
+    # are split or merged, and updated in place when a chunk's length changes.
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = [0]
+            index.extend(len(chunk) for chunk in self._chunks)
+            size = len(index)
+            for i in range(1, size):
+                parent = i + (i & -i)
+                if parent < size:
+                    index[parent] += index[i]
+            self._index = index
+        return index
+
+    def _index_add(self, pos, delta):
+        """Record a change in length of the chunk at pos."""
+        index = self._index
+        if index is None:
+            return
+        i = pos + 1
+        size = len(index)
+        while i < size:
+            index[i] += delta
+            i += i & -i
+
+    def _locate(self, index):
+        """Return the position of the chunk holding the given index, and the index within it."""
+        tree = self._get_index()
+        pos = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            next_pos = pos + step
+            if next_pos < len(tree) and tree[next_pos] <= index:
+                pos = next_pos
+                index -= tree[pos]
+            step >>= 1
+        return pos, index
+
+    def _chunk_start(self, pos):
+        """Return the index of the first item in the chunk at pos."""
+        tree = self._get_index()
+        total = 0
+        while pos:
+            total += tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def _rank(self, item, inclusive=False):
+        """
+        Return the number of items less than the given item (or less than or
+        equal to it, if inclusive).
+        """
+        maxes = self._maxes
+        pos = (bisect_right if inclusive else bisect_left)(maxes, item)
+        if pos == len(maxes):
+            return self._len
+        offset = (bisect_right if inclusive else bisect_left)(self._chunks[pos], item)
+        return self._chunk_start(pos) + offset
+
+    def insert(self, item):
+        """Insert an item into the set. If it is already present, ignore."""
+        hash(item)  # reject mutable items
+        maxes = self._maxes
+        if not maxes:
+            self._chunks.append([item])
+            maxes.append(item)
+            self._len = 1
+            self._index = None
+            return
+        pos = bisect_left(maxes, item)
+        if pos == len(maxes):
+            # greater than everything; goes at the end of the last chunk
+            pos -= 1
+            chunk = self._chunks[pos]
+            chunk.append(item)
+            maxes[pos] = item
+        else:
+            chunk = self._chunks[pos]
+            offset = bisect_left(chunk, item)
+            if chunk[offset] == item:
+                return
+            chunk.insert(offset, item)
+        self._len += 1
+        self._index_add(pos, 1)
+        if len(chunk) > 2 * self.chunk_size:
+            half = len(chunk) >> 1
+            self._chunks[pos:pos + 1] = chunk[:half], chunk[half:]
+            maxes.insert(pos, chunk[half - 1])
+            self._index = None
+
+    def delete(self, item):
+        """Delete an item from the set if it exists."""
+        maxes = self._maxes
+        pos = bisect_left(maxes, item)
+        if pos == len(maxes):
+            return
+        chunk = self._chunks[pos]
+        offset = bisect_left(chunk, item)
+        if chunk[offset] != item:
+            return
+        self._delete_at(pos, offset)
+
+    def _delete_at(self, pos, offset):
+        """Delete the item at the given offset of the chunk at pos."""
+        chunks, maxes = self._chunks, self._maxes
+        chunk = chunks[pos]
+        del chunk[offset]
+        self._len -= 1
+        self._index_add(pos, -1)
+        if not chunk:
+            del chunks[pos]
+            del maxes[pos]
+            self._index = None
+            return
+        maxes[pos] = chunk[-1]
+        if len(chunk) < self.chunk_size >> 1 and len(chunks) > 1:
+            # merge with a neighbour, splitting again if that is too big
+            if pos == 0:
+                pos = 1
+            merged = chunks[pos - 1] + chunks[pos]
+            if len(merged) > 2 * self.chunk_size:
+                half = len(merged) >> 1
+                chunks[pos - 1:pos + 1] = merged[:half], merged[half:]
+                maxes[pos - 1] = merged[half - 1]
+            else:
+                chunks[pos - 1:pos + 1] = [merged]
+                del maxes[pos - 1]
+            self._index = None
+
+    def update(self, items):
+        """Insert all the given items into the set."""
+        items = list(items)
+        if len(items) > self._len >> 3:
+            # merging everything at once is cheaper than many insertions
+            self._reset(self._merged(items))
+        else:
+            for item in items:
+                self.insert(item)
+
+    def _merged(self, items):
+        """
+        Return a sorted list of the items in the set and the given items, without
+        duplicates. Only the given items are sorted; each chunk is merged with
+        the ones that fall within it, in O(n + k log(k)) for k items.
+        """
+        batch = _sorted_unique(items)
+        if batch is None:
+            batch = sorted(set(items))
+        values = []
+        lo = 0
+        for chunk in self._chunks:
+            hi = bisect_right(batch, chunk[-1], lo)
+            if hi > lo:
+                # sorting two sorted runs back to back merges them in linear time
+                fresh = [item for item in islice(batch, lo, hi) if chunk[bisect_left(chunk, item)] != item]
+                values.extend(sorted(chunk + fresh))
+            else:
+                values.extend(chunk)
+            lo = hi
+        values.extend(islice(batch, lo, None))
+        return values
+
+    def contains(self, item):
+        """Return True if the given item is in the set."""
+        maxes = self._maxes
+        pos = bisect_left(maxes, item)
+        if pos == len(maxes):
+            return False
+        chunk = self._chunks[pos]
+        return chunk[bisect_left(chunk, item)] == item
+
+    __contains__ = contains
+
+    def in_order(self):
+        """Traverse the set in sorted order."""
+        return chain.from_iterable(self._chunks)
+
+    __iter__ = in_order
+
+    def reverse_order(self):
+        """Traverse the set in reverse sorted order."""
+        return chain.from_iterable(map(reversed, reversed(self._chunks)))
+
+    __reversed__ = reverse_order
+
+    def _iter_from(self, index, reverse=False):
+        """Traverse the set starting at the given index, forwards or backwards."""
+        pos, offset = self._locate(index)
+        chunks = self._chunks
+        if not reverse:
+            yield chunks[pos][offset:]
+            for chunk in islice(chunks, pos + 1, None):
+                yield chunk
+        else:
+            yield reversed(chunks[pos][:offset + 1])
+            for chunk in reversed(chunks[:pos]):
+                yield reversed(chunk)
+
+    def islice(self, start=None, stop=None, step=None):
+        """
+        Iterate over the items with indices in the given slice, in sorted order
+        (or reversed, for a negative step).
+        """
+        start, stop, step = slice(start, stop, step).indices(self._len)
+        count = len(range(start, stop, step))
+        if count == 0:
+            return iter(())
+        items = chain.from_iterable(self._iter_from(start, reverse=step < 0))
+        step = abs(step)
+        return islice(items, 0, (count - 1) * step + 1, step)
+
+    def __getitem__(self, index):
+        """
+        Get an item from the set by index, in sorted order.
+
+        Slicing returns a list of the items.
+        """
+        if isinstance(index, slice):
+            return list(self.islice(index.start, index.stop, index.step))
+        index = self._check_index(index)
+        pos, offset = self._locate(index)
+        return self._chunks[pos][offset]
+
+    def __delitem__(self, index):
+        """
+        Delete an item from the set by index, in sorted order.
+
+        Deleting a contiguous slice trims the chunks at either end of it and
+        drops those in between, in O(log(n) + c + k/c) time for k items.
+        """
+        if isinstance(index, slice):
+            indices = range(*index.indices(self._len))
+            if abs(indices.step) == 1:
+                if indices:
+                    self._delete_run(min(indices), max(indices) + 1)
+            else:
+                values = list(self)
+                del values[index]
+                self._reset(values)
+            return
+        index = self._check_index(index)
+        self._delete_at(*self._locate(index))
+
+    def _delete_run(self, start, stop):
+        """Delete the items with indices from start up to (but not including) stop."""
+        chunks, maxes = self._chunks, self._maxes
+        first, begin = self._locate(start)
+        last, end = self._locate(stop - 1)
+        # keep what is left of the chunks at either end, joined into one if it is small enough
+        left, right = chunks[first][:begin], chunks[last][end + 1:]
+        if len(left) + len(right) <= 2 * self.chunk_size:
+            pieces = [left + right]
+        else:
+            pieces = [left, right]
+        pieces = [piece for piece in pieces if piece]
+        chunks[first:last + 1] = pieces
+        maxes[first:last + 1] = [piece[-1] for piece in pieces]
+        self._len -= stop - start
+        self._index = None
+
+    def _check_index(self, index):
+        if not isinstance(index, int):
+            raise TypeError("indices must be integers")
+        if index < 0:
+            # support negative indexing from the end
+            index += self._len
+        if index < 0 or index >= self._len:
+            raise IndexError
+        return index
+
+    def irange(self, start, stop, inclusive=(True, True), reverse=False):
+        """
+        Iterate over the items within the given range in sorted order, or
+        in reverse sorted order from stop down to start if reverse is True.
+        """
+        if stop is not None and start is not None and stop < start:
+            return iter(())
+        begin, end = self._range_bounds(start, stop, inclusive)
+        if reverse:
+            if begin >= end:
+                return iter(())
+            # a stop of -1 would count from the end, so run to the front with None
+            return self.islice(end - 1, begin - 1 if begin else None, -1)
+        return self.islice(begin, max(begin, end))
+
+    def _range_bounds(self, start, stop, inclusive):
+        """Return the indices of the first item in the given range and the first beyond it."""
+        if start is not None and start == stop:
+            # a range that begins and ends on the same value covers it if either end does
+            inclusive = (True, True) if any(inclusive) else (False, False)
+        begin = 0 if start is None else self._rank(start, not inclusive[0])
+        end = self._len if stop is None else self._rank(stop, inclusive[1])
+        return begin, end
+
+    def index(self, item):
+        """Return the index of an item in sorted order, raising ValueError if it is not present."""
+        if item not in self:
+            raise ValueError("{0!r} is not in the set".format(item))
+        return self._rank(item)
+
+    def bisect_left(self, item):
+        """Return the index where the item would be inserted, before any equal item."""
+        return self._rank(item)
+
+    def bisect_right(self, item):
+        """Return the index where the item would be inserted, after any equal item."""
+        return self._rank(item, inclusive=True)
+
+    def count_range(self, start, stop, inclusive=(True, True)):
+        """
+        Return the number of items in the given range in O(log(n)) time, equal
+        to the number of items irange() would produce for the same range.
+        """
+        begin, end = self._range_bounds(start, stop, inclusive)
+        return max(0, end - begin)
+
+    def clear(self):
+        """Empties the set."""
+        self._reset([])
+
+    def size(self):
+        """Return the number of items in the set."""
+        return self._len
+
+    __len__ = size
+
+    def __repr__(self):
+        return "data_structures.chunked.ChunkedBST({0})".format(
+            list(self) if self else ""
+        )
@@ -0,0 +1,256 @@
+# coding=utf-8
+
+from contextlib import contextmanager
+import threading
+
+from data_structures.bst import PersistentBST
+
+
+class RWLock(object):
+    """
+    Reader-writer lock: any number of readers may hold it at once, or a single
+    writer. Waiting writers are let in ahead of new readers so that a steady
+    stream of readers cannot starve them. The lock is not reentrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentBST(object):
+    """
+    Thread-safe facade over a BST.
+
+    The tree is kept as a PersistentBST, which each change replaces with a new
+    version sharing all but O(log(n)) of its nodes. Lookups and traversals may
+    run in any number of threads at once, while changes to the tree each have
+    it to themselves.
+
+    >>> b = ConcurrentBST([3, 1, 2])
+    >>> b.insert(4)
+    >>> list(b.irange(2, None))
+    [2, 3, 4]
+
+    Iterators hold the lock only while fetching each item, and fail fast with
+    RuntimeError if the tree is changed while they are live:
+
+    >>> it = iter(b)
+    >>> next(it)
+    1
+    >>> b.delete(3)
+    >>> next(it)
+    Traceback (most recent call last):
+        ...
+    RuntimeError: tree changed during iteration
+
+    For long reads that should see one consistent version of the tree without
+    blocking writers, take a snapshot. Snapshots are the immutable
+    PersistentBST versions themselves, so taking one takes O(1) time, and they
+    can be read from without any locking:
+
+    >>> snap = b.snapshot()
+    >>> b.insert(5)
+    >>> snap
+    data_structures.bst.PersistentBST([1, 2, 4])
+    """
+
+    def __init__(self, items=(), key=None):
+        self._tree = PersistentBST(items, key=key)
+        self._key = key
+        self._lock = RWLock()
+        # incremented by every change, so that live iterators can tell
+        self._version = 0
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold the write lock while the body replaces the tree. Each change makes
+        its new version in full before putting it in place, so one that fails
+        leaves the tree (and any live iterators) as they were.
+        """
+        with self._lock.write_locked():
+            yield
+            self._version += 1
+
+    def _guarded(self, start_iterator, *args):
+        """
+        Yield the items of the iterator returned by calling start_iterator on
+        the tree with the given arguments, holding the read lock while getting
+        each one and raising RuntimeError if the tree changes in between.
+        """
+        with self._lock.read_locked():
+            version = self._version
+            iterator = start_iterator(self._tree, *args)
+        while True:
+            with self._lock.read_locked():
+                if self._version != version:
+                    raise RuntimeError("tree changed during iteration")
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def insert(self, item):
+        """Insert an item into the tree. If it is already present, ignore."""
+        with self._writing():
+            self._tree = self._tree.insert(item)
+
+    def delete(self, item):
+        """Delete an item from the tree if it exists."""
+        with self._writing():
+            self._tree = self._tree.delete(item)
+
+    def update(self, items):
+        """Insert all the given items into the tree, in O(k log(n)) time for k items."""
+        items = list(items)
+        with self._writing():
+            tree = self._tree
+            if not tree:
+                tree = PersistentBST(items, key=self._key)
+            else:
+                for item in items:
+                    tree = tree.insert(item)
+            self._tree = tree
+
+    def difference_update(self, items):
+        """Delete all the given items from the tree if they exist, in O(k log(n)) time for k items."""
+        items = list(items)
+        with self._writing():
+            tree = self._tree
+            for item in items:
+                tree = tree.delete(item)
+            self._tree = tree
+
+    def clear(self):
+        """Empties the tree."""
+        with self._writing():
+            self._tree = PersistentBST(key=self._key)
+
+    def __delitem__(self, index):
+        """Delete an item (or slice of items) from the tree by index, in sorted order."""
+        with self._writing():
+            tree = self._tree
+            for item in (tree[index] if isinstance(index, slice) else [tree[index]]):
+                tree = tree.delete(item)
+            self._tree = tree
+
+    def contains(self, item):
+        """Return True if the given item is in the tree."""
+        with self._lock.read_locked():
+            return item in self._tree
+
+    __contains__ = contains
+
+    def __getitem__(self, index):
+        """Get an item (or list of items, for a slice) from the tree by index, in sorted order."""
+        with self._lock.read_locked():
+            return self._tree[index]
+
+    def index(self, item):
+        """Return the index of an item in sorted order, raising ValueError if it is not present."""
+        with self._lock.read_locked():
+            return self._tree.index(item)
+
+    def bisect_left(self, item):
+        """Return the index where the item would be inserted, before any equal item."""
+        with self._lock.read_locked():
+            return self._tree.bisect_left(item)
+
+    def bisect_right(self, item):
+        """Return the index where the item would be inserted, after any equal item."""
+        with self._lock.read_locked():
+            return self._tree.bisect_right(item)
+
+    def count_range(self, start, stop, inclusive=(True, True)):
+        """Return the number of items in the given range."""
+        with self._lock.read_locked():
+            return self._tree.count_range(start, stop, inclusive)
+
+    def in_order(self):
+        """Traverse the tree in-order."""
+        return self._guarded(PersistentBST.in_order)
+
+    __iter__ = in_order
+
+    def reverse_order(self):
+        """Traverse the tree in reversed in-order."""
+        return self._guarded(PersistentBST.reverse_order)
+
+    __reversed__ = reverse_order
+
+    def irange(self, start, stop, inclusive=(True, True), reverse=False):
+        """
+        Iterate over the items within the given range in sorted order, or
+        in reverse sorted order from stop down to start if reverse is True.
+        """
+        return self._guarded(PersistentBST.irange, start, stop, inclusive, reverse)
+
+    def islice(self, start=None, stop=None, step=None):
+        """Iterate over the items with indices in the given slice."""
+        return self._guarded(PersistentBST.islice, start, stop, step)
+
+    def snapshot(self):
+        """
+        Return the tree as it is now, as an immutable PersistentBST, in O(1)
+        time. Later changes make new versions, leaving it as it is.
+        """
+        # replacing the tree is a single assignment, so no lock is needed to read it
+        return self._tree
+
+    def size(self):
+        """Return the number of items in the tree."""
+        with self._lock.read_locked():
+            return len(self._tree)
+
+    __len__ = size
+
+    def __repr__(self):
+        with self._lock.read_locked():
+            return "data_structures.concurrent_bst.ConcurrentBST({0})".format(
+                list(self._tree) if self._tree else ""
+            )
@@ -0,0 +1,474 @@
+# -*- coding: utf -8 -*-
+from builtins import range, zip
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+from heapq import heappop, heappush
+from itertools import chain
+import mmap
+import pickle
+import struct
+import sys
+
+
+"""\
+Frozen trie module
+
+Provides FrozenTrie, a read-only trie with the same lookups as trie.ShortTrie
+that keeps all of its nodes in a handful of flat arrays rather than as Python
+objects, taking a small fraction of the memory.
+
+Nodes are numbered in breadth-first order, with the children of each node
+sorted, so the children of every node (and, level by level, all of its
+descendants) have consecutive numbers. Each node is then described by:
+
+first_child[i]: the number of its first child, its last being first_child[i + 1] - 1
+leaders[i]: the first symbol of the edge leading to it
+labels[label_start[i]:label_start[i + 1]]: the rest of the symbols of that edge
+terminal[i]: whether a token ends there
+
+Tries built with weights also keep, for each node, the weight of the token
+ending there and the greatest weight in its subtree, for ranked auto
+complete; and tries built with values keep each token's value pickled, with
+a table of where each node's value starts.
+
+Symbols are stored as indices into the sorted list of all the distinct
+symbols in the tokens, in the narrowest array type that can hold them.
+
+A frozen trie can be saved to a file and loaded again by memory-mapping it,
+in which case its arrays are read straight from the mapping rather than
+copied into memory: loading takes constant time however large the trie, and
+every process that loads the same file shares the same pages of it.
+"""
+
+
+def _typecode(count):
+    """Return the narrowest array type code that can hold indices below count."""
+    if count <= 1 << 8:
+        return 'B'
+    elif count <= 1 << 16:
+        return 'H'
+    else:
+        return 'I'
+
+
+def _common_length(a, b, start):
+    """Return the length of the common beginning of two sequences known to agree before start."""
+    limit = min(len(a), len(b))
+    while start < limit and a[start] == b[start]:
+        start += 1
+    return start
+
+
+# Saved files
+#
+# A saved trie is a header, followed by its symbols and then its arrays. The
+# header holds a magic number, a code for how the symbols are stored, the
+# type code of the symbol arrays, flags for whether weights and values
+# follow, the number of tokens, nodes and label symbols, and the length of
+# the stored symbols. Symbols of strings are stored as UTF-8 and those of
+# bytes as they are; anything else is pickled along with the empty token.
+# The arrays are stored little-endian, widest first, with the first starting
+# on a multiple of four bytes, so that each is aligned for its type where it
+# lies in the file. Weights and value offsets, if any, come after them,
+# starting on a multiple of eight bytes, and then the pickled values.
+
+_SAVE_MAGIC = b'TRI1'
+_SAVE_HEADER = struct.Struct('<4sccBQIII')
+_HAS_WEIGHTS = 1
+_HAS_VALUES = 2
+_NO_WEIGHT = float('-inf')
+
+
+def _saved_symbols(symbols, empty):
+    """Return the code and bytes to save the symbols and empty token under."""
+    if isinstance(empty, str):
+        return b's', empty.join(symbols).encode('utf-8')
+    elif isinstance(empty, bytes):
+        return b'b', empty.join(symbols)
+    else:
+        return b'p', pickle.dumps((symbols, empty), pickle.HIGHEST_PROTOCOL)
+
+
+def _loaded_symbols(code, data):
+    """Return the symbols and empty token from their saved code and bytes."""
+    if code == b's':
+        return list(data.decode('utf-8')), ''
+    elif code == b'b':
+        return [data[i:i + 1] for i in range(len(data))], b''
+    elif code == b'p':
+        return pickle.loads(data)
+    else:
+        raise ValueError("unknown saved trie format")
+
+
+def _mapped_array(data, offset, typecode, count):
+    """
+    Return a view of the array of count items of the type code saved in the
+    memoryview data at the offset, and the offset of what follows it.
+    """
+    size = array(typecode).itemsize * count
+    values = data[offset:offset + size]
+    if len(values) != size:
+        raise ValueError("unexpected end of saved trie")
+    if sys.byteorder != 'little':  # pragma: no cover
+        # the data can't be viewed as it is; copy it in the right byte order
+        copied = array(typecode)
+        copied.frombytes(values)
+        copied.byteswap()
+        return copied, offset + size
+    return values.cast(typecode), offset + size
+
+
+def _subtree_best(first_child, terminal, weights):
+    """Return an array of the greatest weight of the tokens in each node's subtree."""
+    best = array('d', [_NO_WEIGHT]) * len(terminal)
+    # children are numbered after their parents, so go backwards
+    for node in range(len(terminal) - 1, -1, -1):
+        greatest = weights[node] if terminal[node] else _NO_WEIGHT
+        for child in range(first_child[node], first_child[node + 1]):
+            if best[child] > greatest:
+                greatest = best[child]
+        best[node] = greatest
+    return best
+
+
+def _write_array(f, typecode, values):
+    """Write the values to the file as a little-endian array of the type code."""
+    values = array(typecode, values)
+    if sys.byteorder != 'little':  # pragma: no cover
+        values.byteswap()
+    f.write(values.tobytes())
+
+
+class FrozenTrie(object):
+    """
+    Read-only, compact trie.
+
+    >>> t = FrozenTrie(['apple', 'application', 'apply', 'banana'])
+    >>> 'apply' in t, 'appl' in t
+    (True, False)
+    >>> list(t.auto_complete('appl', max_results=2))
+    ['apple', 'application']
+    >>> len(t)
+    4
+
+    It can be built from any iterable of tokens, including a Trie or
+    ShortTrie. Tokens can be any sequences that can be sliced and whose
+    items are hashable and sortable, but must all be of the same type.
+
+    Like the other tries, it can rank completions by weight, and map tokens
+    to values:
+
+    >>> t = FrozenTrie(['apple', 'apply', 'banana'], weights={'apply': 2}, values={'apple': 'fruit'})
+    >>> list(t.auto_complete('app', ranked=True))
+    ['apply', 'apple']
+    >>> t['apple'], t.get('apply')
+    ('fruit', None)
+
+    save() writes it to a file, which load() maps into memory to answer
+    lookups from directly, without reading it all in first.
+    """
+
+    def __init__(self, tokens=(), weights=None, values=None):
+        """
+        Create a frozen trie of the given tokens. weights and values are
+        optional mappings from some of the tokens to their numeric weights for
+        ranked auto complete (the rest weigh 0), and to their values (the
+        rest have None). Weights are kept as floats, and values pickled.
+        """
+        tokens = sorted(set(tokens))
+        empty = tokens[0][:0] if tokens else ''
+        symbols = sorted(set(token[i:i + 1] for token in tokens for i in range(len(token))))
+        symbol_ids = dict((symbol, i) for i, symbol in enumerate(symbols))
+        typecode = _typecode(len(symbols))
+
+        # the root has no edge leading to it
+        leaders = array(typecode, [0])
+        label_start = array('I', [0, 0])
+        labels = array(typecode)
+        first_child = array('I')
+        terminal = bytearray()
+        token_nodes = []  # the node each token ends at, if it has a weight or value to keep
+        # Each node covers the run of sorted tokens starting with the same
+        # prefix, whose length is its depth. Its children split that run up by
+        # the symbol following the prefix.
+        queue = deque([(0, len(tokens), 0)])
+        count = 1
+        while queue:
+            lo, hi, depth = queue.popleft()
+            first_child.append(count)
+            if lo < hi and len(tokens[lo]) == depth:
+                # the prefix itself sorts first
+                terminal.append(1)
+                if weights or values:
+                    token_nodes.append((len(terminal) - 1, tokens[lo]))
+                lo += 1
+            else:
+                terminal.append(0)
+            while lo < hi:
+                leader = tokens[lo][depth:depth + 1]
+                end = lo + 1
+                while end < hi and tokens[end][depth:depth + 1] == leader:
+                    end += 1
+                # the edge runs as far as the first and last tokens of the run agree
+                first = tokens[lo]
+                child_depth = _common_length(first, tokens[end - 1], depth + 1)
+                leaders.append(symbol_ids[leader])
+                labels.extend(symbol_ids[first[i:i + 1]] for i in range(depth + 1, child_depth))
+                label_start.append(len(labels))
+                queue.append((lo, end, child_depth))
+                count += 1
+                lo = end
+        first_child.append(count)
+
+        own_weights = best = value_offsets = value_data = None
+        if weights:
+            own_weights = array('d', [0.0]) * count
+            for node, token in token_nodes:
+                own_weights[node] = weights.get(token, 0)
+            best = _subtree_best(first_child, terminal, own_weights)
+        if values:
+            node_values = {}
+            for node, token in token_nodes:
+                value = values.get(token)
+                if value is not None:
+                    node_values[node] = value
+            # tokens without values (or with None) take up no space
+            value_offsets = array('Q', [0])
+            value_data = bytearray()
+            for node in range(count):
+                if node in node_values:
+                    value_data += pickle.dumps(node_values[node], pickle.HIGHEST_PROTOCOL)
+                value_offsets.append(len(value_data))
+            value_data = bytes(value_data)
+
+        self._init(symbols, empty, len(tokens), first_child, leaders, label_start, labels, terminal,
+                   own_weights, best, value_offsets, value_data)
+
+    def _init(self, symbols, empty, size, first_child, leaders, label_start, labels, terminal,
+              weights=None, best=None, value_offsets=None, value_data=None):
+        self._symbols = symbols
+        self._symbol_ids = dict((symbol, i) for i, symbol in enumerate(symbols))
+        self._empty = empty
+        if isinstance(empty, (str, bytes)):
+            self._join = empty.join
+        else:
+            self._join = lambda pieces: type(empty)(chain.from_iterable(pieces))
+        self._size = size
+        self._first_child = first_child
+        self._leaders = leaders
+        self._label_start = label_start
+        self._labels = labels
+        self._terminal = terminal
+        self._weights = weights
+        self._best = best
+        self._value_offsets = value_offsets
+        self._value_data = value_data
+
+    def save(self, path):
+        """Write the trie to the file at the given path, for load() to map."""
+        code, symbol_data = _saved_symbols(self._symbols, self._empty)
+        typecode = _typecode(len(self._symbols))
+        flags = ((_HAS_WEIGHTS if self._weights is not None else 0) |
+                 (_HAS_VALUES if self._value_offsets is not None else 0))
+        header = _SAVE_HEADER.pack(
+            _SAVE_MAGIC, code, typecode.encode(), flags, self._size,
+            len(self._terminal), len(self._labels), len(symbol_data))
+        padding = -(len(header) + len(symbol_data)) % 4
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.write(symbol_data)
+            f.write(b'\0' * padding)
+            for item_type, values in (('I', self._first_child), ('I', self._label_start),
+                                      (typecode, self._leaders), (typecode, self._labels)):
+                _write_array(f, item_type, values)
+            f.write(bytes(self._terminal))
+            if flags:
+                f.write(b'\0' * (-f.tell() % 8))
+            if self._weights is not None:
+                _write_array(f, 'd', self._weights)
+                _write_array(f, 'd', self._best)
+            if self._value_offsets is not None:
+                _write_array(f, 'Q', self._value_offsets)
+                f.write(self._value_data)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map the trie saved to the file at the given path into memory, and
+        return it. Only the header and symbols are read in; lookups read the
+        rest of the file from the mapping as they need it.
+        """
+        with open(path, 'rb') as f:
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if len(data) < _SAVE_HEADER.size:
+            raise ValueError("not a saved trie")
+        magic, code, typecode, flags, size, node_count, label_count, symbols_length = (
+            _SAVE_HEADER.unpack(data[:_SAVE_HEADER.size]))
+        if magic != _SAVE_MAGIC:
+            raise ValueError("not a saved trie")
+        typecode = typecode.decode()
+        offset = _SAVE_HEADER.size + symbols_length
+        symbols, empty = _loaded_symbols(code, bytes(data[_SAVE_HEADER.size:offset]))
+        offset += -offset % 4
+        arrays = []
+        for item_type, count in (('I', node_count + 1), ('I', node_count + 1), (typecode, node_count),
+                                 (typecode, label_count), ('B', node_count)):
+            values, offset = _mapped_array(data, offset, item_type, count)
+            arrays.append(values)
+        first_child, label_start, leaders, labels, terminal = arrays
+        weights = best = value_offsets = value_data = None
+        if flags:
+            offset += -offset % 8
+        if flags & _HAS_WEIGHTS:
+            weights, offset = _mapped_array(data, offset, 'd', node_count)
+            best, offset = _mapped_array(data, offset, 'd', node_count)
+        if flags & _HAS_VALUES:
+            value_offsets, offset = _mapped_array(data, offset, 'Q', node_count + 1)
+            value_data = data[offset:offset + value_offsets[-1]]
+            if len(value_data) != value_offsets[-1]:
+                raise ValueError("unexpected end of saved trie")
+        trie = cls.__new__(cls)
+        trie._init(symbols, empty, size, first_child, leaders, label_start, labels, terminal,
+                   weights, best, value_offsets, value_data)
+        return trie
+
+    def _child(self, node, symbol):
+        """Return the child of the node whose edge starts with the symbol id, or None."""
+        lo, hi = self._first_child[node], self._first_child[node + 1]
+        i = bisect_left(self._leaders, symbol, lo, hi)
+        if i < hi and self._leaders[i] == symbol:
+            return i
+        return None
+
+    def _edge(self, node):
+        """Return the symbols of the edge leading to the node."""
+        symbols = self._symbols
+        pieces = [symbols[self._leaders[node]]]
+        pieces.extend(symbols[i] for i in self._labels[self._label_start[node]:self._label_start[node + 1]])
+        return self._join(pieces)
+
+    def _find(self, token):
+        """
+        Follow the token down from the root. Return the node it leads to and
+        how far it ends short of it, partway down the edge leading there, or
+        (None, None) if no token begins with it.
+        """
+        symbol_ids, labels, label_start = self._symbol_ids, self._labels, self._label_start
+        node = 0
+        i = 0
+        while i < len(token):
+            symbol = symbol_ids.get(token[i:i + 1])
+            node = None if symbol is None else self._child(node, symbol)
+            if node is None:
+                return None, None
+            i += 1
+            start, stop = label_start[node], label_start[node + 1]
+            for label in labels[start:stop]:
+                if i == len(token):
+                    return node, stop - start
+                if symbol_ids.get(token[i:i + 1]) != label:
+                    return None, None
+                i += 1
+                start += 1
+        return node, 0
+
+    def contains(self, token):
+        """Return true if token is in trie."""
+        node, short = self._find(token)
+        return node is not None and not short and bool(self._terminal[node])
+
+    __contains__ = contains
+
+    def _value(self, node):
+        """Return the value of the token ending at the node."""
+        if self._value_offsets is None:
+            return None
+        start, stop = self._value_offsets[node], self._value_offsets[node + 1]
+        return pickle.loads(self._value_data[start:stop]) if start < stop else None
+
+    def __getitem__(self, token):
+        """Return the value of token, raising KeyError if it is not in trie."""
+        node, short = self._find(token)
+        if node is None or short or not self._terminal[node]:
+            raise KeyError(token)
+        return self._value(node)
+
+    def get(self, token, default=None):
+        """Return the value of token, or default if it is not in trie."""
+        node, short = self._find(token)
+        if node is None or short or not self._terminal[node]:
+            return default
+        return self._value(node)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """Traversing the trie depth-first, in sorted order."""
+        first_child, terminal = self._first_child, self._terminal
+        stack = [(0, self._empty)]
+        while stack:
+            node, prefix = stack.pop()
+            if terminal[node]:
+                yield prefix
+            # push the children last first, so that they come off in order
+            for child in range(first_child[node + 1] - 1, first_child[node] - 1, -1):
+                stack.append((child, prefix + self._edge(child)))
+
+    def breadth_first(self, prefix=None, node=0):
+        """Helper breadth first traversal function for auto complete."""
+        first_child, terminal = self._first_child, self._terminal
+        q = deque()
+        q.appendleft((node, prefix))
+        while q:
+            node, prefix = q.pop()
+            if terminal[node]:
+                yield prefix
+            for child in range(first_child[node], first_child[node + 1]):
+                edge = self._edge(child)
+                q.appendleft((child, edge if prefix is None else prefix + edge))
+
+    def ranked(self, prefix=None, node=0):
+        """Helper best-first traversal function for ranked auto complete."""
+        if self._weights is None:
+            # every token weighs 0, so any order is ranked
+            return self.breadth_first(prefix, node)
+        return self._ranked(prefix, node)
+
+    def _ranked(self, prefix, node):
+        first_child, terminal, weights, best = self._first_child, self._terminal, self._weights, self._best
+        # entries are (negated weight, order, node or None for a token, prefix),
+        # the order breaking ties without comparing prefixes
+        heap = [(-best[node], 0, node, prefix)]
+        order = 1
+        while heap:
+            _, _, node, prefix = heappop(heap)
+            if node is None:
+                yield prefix
+                continue
+            if terminal[node]:
+                heappush(heap, (-weights[node], order, None, prefix))
+                order += 1
+            for child in range(first_child[node], first_child[node + 1]):
+                edge = self._edge(child)
+                heappush(heap, (-best[child], order, child, edge if prefix is None else prefix + edge))
+                order += 1
+
+    def auto_complete(self, token, max_results=4, ranked=False):
+        """
+        Trie auto complete. Completions come in breadth-first order, or if
+        ranked is true, heaviest first.
+        """
+        node, short = self._find(token)
+        if node is None:
+            return
+        prefix = token
+        if short:
+            # token ends partway down this edge; add the rest of it to the prefix
+            prefix += self._edge(node)[-short:]
+        items = self.ranked(prefix, node) if ranked else self.breadth_first(prefix, node)
+        for item, _ in zip(items, range(max_results)):
+            yield item
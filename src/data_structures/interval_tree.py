@@ -0,0 +1,144 @@
+# coding=utf-8
+
+from operator import itemgetter
+
+from data_structures.augmented_bst import _aggregate_node_types
+from data_structures.bst import BST, _load_values
+
+
+"""\
+Interval tree module
+
+Provides IntervalTree, a set of closed intervals kept in the same balanced
+tree as BST, sorted by their low ends. Each node also keeps the highest high
+end of the intervals in its subtree, which lets searches skip every subtree
+that ends before the interval being searched for. Runtime complexities are:
+
+insert, delete, contains: O(log(n))
+finding the k intervals that overlap an interval or a point: O(min(n, (k + 1) log(n)))
+"""
+
+
+# Interval trees are aggregate trees that keep the maximum high end
+_IntervalNode, _ = _aggregate_node_types(max, itemgetter(1))
+
+
+def _check_interval(interval):
+    if interval[1] < interval[0]:
+        raise ValueError("interval {0!r} ends before it starts".format(interval))
+
+
+def _overlapping_nodes(node, low, high):
+    """Yield the nodes of the subtree whose intervals overlap [low, high] in-order."""
+    stack = []
+    while stack or node is not None:
+        if node is not None:
+            if node.agg < low:
+                # everything in this subtree ends before the query starts
+                node = None
+            else:
+                stack.append(node)
+                node = node.left
+        else:
+            node = stack.pop()
+            if high < node.val[0]:
+                # this and every interval after it starts after the query ends
+                return
+            if low <= node.val[1]:
+                yield node
+            node = node.right
+
+
+class IntervalTree(BST):
+    """
+    Set of closed intervals that can find those overlapping any other interval.
+
+    Intervals are tuples whose first two entries are their low and high ends;
+    any further entries are carried along, and break ties between intervals
+    with the same ends.
+
+    >>> t = IntervalTree([(1, 5), (3, 4), (6, 10), (8, 9, 'meeting')])
+    >>> list(t.overlapping(4, 7))
+    [(1, 5), (3, 4), (6, 10)]
+    >>> list(t.stabbing(8))
+    [(6, 10), (8, 9, 'meeting')]
+    >>> t.delete((6, 10))
+    >>> t.overlaps(7, 7)
+    False
+
+    Otherwise it provides all of the operations of BST, sorting the
+    intervals by their low ends (then their high ends, and so on).
+    """
+
+    def __init__(self, intervals=()):
+        """
+        Create a new interval tree.
+        If an iterable is passed, all of its intervals are added to the tree.
+        """
+        BST.__init__(self)
+        self._make_node = _IntervalNode
+        self.update(intervals)
+
+    @classmethod
+    def from_sorted(cls, intervals):
+        """
+        Create a new, perfectly balanced tree from intervals that are already
+        in sorted order in O(n) time. Duplicate intervals are ignored.
+
+        Raises ValueError if the intervals are not sorted.
+        """
+        intervals = list(intervals)
+        for interval in intervals:
+            _check_interval(interval)
+        return cls()._fill_sorted(intervals)
+
+    @classmethod
+    def load(cls, fileobj):
+        """
+        Create a new tree from the intervals written to a binary file object
+        by dump(), in O(n) time.
+        """
+        return cls.from_sorted(_load_values(fileobj))
+
+    def __reduce__(self):
+        return type(self).from_sorted, (list(self),)
+
+    def insert(self, interval):
+        """
+        Insert an interval into the tree. If it is already present, ignore.
+        Raises ValueError if the interval ends before it starts.
+        """
+        _check_interval(interval)
+        BST.insert(self, interval)
+
+    def update(self, intervals):
+        """Insert all the given intervals into the tree."""
+        intervals = list(intervals)
+        for interval in intervals:
+            _check_interval(interval)
+        BST.update(self, intervals)
+
+    def symmetric_difference_update(self, intervals):
+        """
+        Delete the given intervals that are in the tree, and insert those that
+        are not.
+        """
+        intervals = list(intervals)
+        for interval in intervals:
+            _check_interval(interval)
+        BST.symmetric_difference_update(self, intervals)
+
+    def overlapping(self, low, high):
+        """
+        Iterate over the intervals that overlap the closed interval [low, high],
+        in sorted order.
+        """
+        return map(self._get, _overlapping_nodes(self._head, low, high))
+
+    def stabbing(self, point):
+        """Iterate over the intervals that contain the given point, in sorted order."""
+        return self.overlapping(point, point)
+
+    def overlaps(self, low, high):
+        """Return True if any interval overlaps the closed interval [low, high]."""
+        return next(_overlapping_nodes(self._head, low, high), None) is not None
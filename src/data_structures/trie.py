@@ -2,6 +2,9 @@
 from builtins import next, range, zip
 
 from collections import deque
+from heapq import heappop, heappush
+
+from data_structures.frozen_trie import FrozenTrie
 
 try:
     # noinspection PyUnresolvedReferences
@@ -10,32 +13,251 @@ except NameError:  # pragma: no cover
     STR_TYPES = bytes, str
 
 
+def _empty_token(trie):
+    """Return the empty token of the type of the trie's tokens, or '' if it has none."""
+    for leader in trie._edges:
+        return leader[:0]
+    return ''
+
+
+def _add_token(path, weight):
+    """
+    Make a token end at the last node of the path from the root, giving it the
+    weight, or 0 if it is None and the token is new, and update the counts and
+    greatest weights kept by each node on the path.
+    """
+    node = path[-1]
+    if weight is None:
+        if node._terminates:
+            return  # already there; keep its weight
+        weight = 0
+    decreased = node._terminates and weight < node._weight
+    if not node._terminates:
+        for above in path:
+            above._count += 1
+    node._terminates = True
+    node._weight = weight
+    if decreased:
+        # the old weight may have been the greatest; work them out again from the children
+        for node in reversed(path):
+            node._update_best()
+    else:
+        # a node's greatest weight is never less than its children's, so once
+        # one is heavy enough, so are all those above it
+        for node in reversed(path):
+            if node._best is not None and node._best >= weight:
+                break
+            node._best = weight
+
+
+def _merge_edge(parent, leader):
+    """
+    If the child of a ShortTrie node along the edge starting with leader has
+    no token of its own and only one edge, lengthen the edge to skip it.
+    """
+    more, child = parent._edges[leader]
+    if not child._terminates and len(child._edges) == 1:
+        (child_leader, (child_more, grandchild)), = child._edges.items()
+        parent._edges[leader] = more + child_leader + child_more, grandchild
+
+
+def _remove_token(path):
+    """
+    Update the counts and greatest weights kept by each node on the path from
+    the root after removing a token that ended at its last node.
+    """
+    for node in reversed(path):
+        node._count -= 1
+        node._update_best()
+
+
+def _token_nodes(node, prefix, children):
+    """
+    Yield each token in the subtree of the node with the node it ends at,
+    depth-first. children(node, prefix) gives each child of a node and its prefix.
+    """
+    stack = [(node, prefix)]
+    while stack:
+        node, prefix = stack.pop()
+        if node._terminates:
+            yield prefix, node
+        # push the children last first, so that they come off in order
+        stack.extend(reversed(list(children(node, prefix))))
+
+
+def _items(node, prefix, children):
+    """Yield each token in the subtree of the node with its value, depth-first."""
+    for token, node in _token_nodes(node, prefix, children):
+        yield token, node._value
+
+
+def _ranked(node, prefix, children):
+    """
+    Yield the tokens in the subtree of the node, heaviest first, exploring
+    subtrees in order of the greatest weight in them so that no subtree is
+    entered before its tokens are due. children(node, prefix) gives each
+    child of a node and its prefix.
+    """
+    if node._best is None:
+        return
+    # entries are (negated weight, order, node or None for a token, prefix),
+    # the order breaking ties without comparing nodes or prefixes
+    heap = [(-node._best, 0, node, prefix)]
+    order = 1
+    while heap:
+        _, _, node, prefix = heappop(heap)
+        if node is None:
+            yield prefix
+            continue
+        if node._terminates:
+            heappush(heap, (-node._weight, order, None, prefix))
+            order += 1
+        for child, child_prefix in children(node, prefix):
+            heappush(heap, (-child._best, order, child, child_prefix))
+            order += 1
+
+
 class Trie(object):
-    """Python implementation of trie data structure."""
+    """
+    Python implementation of trie data structure.
+
+    Tokens can be given numeric weights, such as how popular they are, and
+    auto complete can return the heaviest completions first:
+
+    >>> t = Trie()
+    >>> t.insert('apple', weight=3)
+    >>> t.insert('apply', weight=10)
+    >>> t.insert('application', weight=7)
+    >>> list(t.auto_complete('app', max_results=2, ranked=True))
+    ['apply', 'application']
+
+    It can also be used as a map from tokens to values:
+
+    >>> t['apple'] = 'fruit'
+    >>> t['apple'], t.get('apply')
+    ('fruit', None)
+    >>> del t['apply']
+    >>> t.count('app'), sorted(t.items('app'))
+    (2, [('apple', 'fruit'), ('application', None)])
+    """
 
     def __init__(self):
         """Create an empty trie."""
         self._edges = {}
         self._terminates = False
+        self._value = None  # the value of the token ending here, if there is one
+        self._weight = 0  # the weight of the token ending here, if there is one
+        self._best = None  # the greatest weight of the tokens in this subtree
+        self._count = 0  # the number of tokens in this subtree
 
-    def insert(self, token):
-        """Insert token if not already in trie."""
-        if not token:
-            self._terminates = True
-        else:
-            child = self._edges.get(token[:1])
+    def insert(self, token, weight=None):
+        """
+        Insert token if not already in trie. If a weight is given, it becomes
+        the token's weight for ranked auto complete; tokens inserted without
+        one weigh 0.
+        """
+        self._insert(token, weight)
+
+    def _insert(self, token, weight):
+        """Insert token, and return the node it ends at."""
+        node = self
+        path = [node]
+        # walk the token by index rather than slicing off its head at every level
+        for i in range(len(token)):
+            edge = token[i:i + 1]
+            child = node._edges.get(edge)
             if child is None:
-                child = self._edges[token[:1]] = Trie()
-            child.insert(token[1:])
+                child = node._edges[edge] = Trie()
+            node = child
+            path.append(node)
+        _add_token(path, weight)
+        return node
+
+    def _update_best(self):
+        best = self._weight if self._terminates else None
+        for child in self._edges.values():
+            if best is None or best < child._best:
+                best = child._best
+        self._best = best
+
+    def _node(self, token):
+        """Return the node the token ends at, or None if no token begins with it."""
+        node = self
+        for i in range(len(token)):
+            node = node._edges.get(token[i:i + 1])
+            if node is None:
+                return None
+        return node
+
+    def __setitem__(self, token, value):
+        """Insert token if not already in trie, and set its value."""
+        self._insert(token, None)._value = value
+
+    def __getitem__(self, token):
+        """Return the value of token, raising KeyError if it is not in trie."""
+        node = self._node(token)
+        if node is None or not node._terminates:
+            raise KeyError(token)
+        return node._value
+
+    def get(self, token, default=None):
+        """Return the value of token, or default if it is not in trie."""
+        node = self._node(token)
+        if node is None or not node._terminates:
+            return default
+        return node._value
+
+    def __delitem__(self, token):
+        """Remove token and its value, raising KeyError if it is not in trie."""
+        node = self
+        path = [node]
+        for i in range(len(token)):
+            node = node._edges.get(token[i:i + 1])
+            if node is None:
+                raise KeyError(token)
+            path.append(node)
+        if not node._terminates:
+            raise KeyError(token)
+        node._terminates = False
+        node._value = None
+        node._weight = 0
+        # drop the nodes that no longer lead to any token
+        while len(path) > 1 and not path[-1]._terminates and not path[-1]._edges:
+            path.pop()
+            del path[-1]._edges[token[len(path) - 1:len(path)]]
+        _remove_token(path)
+
+    def __len__(self):
+        return self._count
+
+    def count(self, prefix=None):
+        """Return the number of tokens in trie beginning with prefix."""
+        node = self if prefix is None else self._node(prefix)
+        return 0 if node is None else node._count
+
+    def items(self, prefix=None):
+        """Iterate over the tokens in trie beginning with prefix and their values, depth-first."""
+        if prefix is None:
+            node, prefix = self, _empty_token(self)
+        else:
+            node = self._node(prefix)
+            if node is None:
+                return iter(())
+        return _items(node, prefix, self._children)
+
+    @staticmethod
+    def _children(node, prefix):
+        for edge, child in node._edges.items():
+            yield child, edge if prefix is None else prefix + edge
 
     def contains(self, token):
         """Return true if token is in trie."""
-        if not token:
-            return self._terminates
-        elif token[:1] in self._edges:
-            return self._edges[token[:1]].contains(token[1:])
-        else:
-            return False
+        node = self
+        for i in range(len(token)):
+            node = node._edges.get(token[i:i + 1])
+            if node is None:
+                return False
+        return node._terminates
 
     __contains__ = contains
 
@@ -71,29 +293,38 @@ class Trie(object):
             for edge, child in node._edges.items():
                 q.appendleft((child, edge if prefix is None else prefix + edge))
 
-    def auto_complete(self, token, max_results=4):
-        """Trie auto complete."""
-        node = self
+    def ranked(self, prefix=None):
+        """Helper best-first traversal function for ranked auto complete."""
+        return _ranked(self, prefix, self._children)
+
+    def auto_complete(self, token, max_results=4, ranked=False):
+        """
+        Trie auto complete. Completions come in breadth-first order, or if
+        ranked is true, heaviest first.
+        """
         prefix = token
         # traverse down until we have found the node that matches the given token
-        while token:
-            edge, token = token[:1], token[1:]
-            if edge not in node._edges:
-                return  # there are no entries with that prefix
-            else:
-                node = node._edges[edge]
-        # iterate ovr the children breadth first from there
+        node = self._node(token)
+        if node is None:
+            return  # there are no entries with that prefix
+        # iterate ovr the children breadth first (or heaviest first) from there
         # return default maximum of 4 tokens
-        for item, _ in zip(node.breadth_first(prefix), range(max_results)):
+        items = node.ranked(prefix) if ranked else node.breadth_first(prefix)
+        for item, _ in zip(items, range(max_results)):
             yield item
 
 
-def _beginning_match(a, b):
-    """Return the number of characters matching at the beginning of the two symbols"""
+def _match_length(a, start, b):
+    """
+    Return the number of items at the beginning of sequence b that match the
+    items of sequence a from index start onwards, without copying either.
+    """
+    # noinspection PyUnresolvedReferences
+    if isinstance(a, STR_TYPES) and a.startswith(b, start):
+        return len(b)
     matched = 0
-    for ch_a, ch_b in zip(a, b):
-        if ch_a != ch_b:
-            break
+    limit = min(len(a) - start, len(b))
+    while matched < limit and a[start + matched] == b[matched]:
         matched += 1
     return matched
 
@@ -104,65 +335,241 @@ def _startswith(a, b):
         # noinspection PyUnresolvedReferences
         return a.startswith(b)
     else:
-        return _beginning_match(a, b) == len(b)
+        return _match_length(a, 0, b) == len(b)
 
 
 class ShortTrie(object):
     """Python implementation of trie data structure that can have multiple symbols
-    in an edge, shortening the depth of the trie."""
+    in an edge, shortening the depth of the trie.
+
+    Like Trie, it can weigh its tokens and map them to values. Removing tokens
+    merges the edges around any node left with a single child, so the trie
+    stays as short as if they had never been inserted:
+
+    >>> t = ShortTrie()
+    >>> t['apple'], t['apples'] = 1, 2
+    >>> del t['apple']
+    >>> list(t.items()), t.count('app')
+    ([('apples', 2)], 1)
+    """
 
     def __init__(self):
         """Create an empty trie."""
         self._edges = {}  # a dictionary of first character: more characters, child node
         self._terminates = False
+        self._value = None  # the value of the token ending here, if there is one
+        self._weight = 0  # the weight of the token ending here, if there is one
+        self._best = None  # the greatest weight of the tokens in this subtree
+        self._count = 0  # the number of tokens in this subtree
 
-    def insert(self, token):
-        """Insert token if not already in trie."""
-        if not token:
-            self._terminates = True
-            return
+    def insert(self, token, weight=None):
+        """
+        Insert token if not already in trie. If a weight is given, it becomes
+        the token's weight for ranked auto complete; tokens inserted without
+        one weigh 0.
+        """
+        self._insert(token, weight)
 
-        leader = token[:1]
-        if token[:1] in self._edges:
-            # an edge starts with the same character as this token
-            token = token[1:]  # cut off first symbol
-            more, child = self._edges[leader]
-            if _startswith(token, more):
-                # the new token starts with the same run of characters as the current child there
-                # i.e. edge is 'app', new token is 'apply'
-                child.insert(token[len(more):])  # recurse down with 'ly'
-            else:
+    def _insert(self, token, weight):
+        """Insert token, and return the node it ends at."""
+        node = self
+        path = [node]
+        i = 0  # how much of the token has been matched so far
+        while i < len(token):
+            leader = token[i:i + 1]
+            if leader not in node._edges:
+                # no edges start with the rest of this token's first character, insert the
+                # whole rest of it with one edge
+                child = ShortTrie()
+                node._edges[leader] = token[i + 1:], child
+                path.append(child)
+                break
+            # an edge starts with the same character as the rest of this token
+            i += 1  # skip the first symbol
+            more, child = node._edges[leader]
+            matched = _match_length(token, i, more)
+            if matched < len(more):
                 # there is only a partial match here, i.e. edge is 'apples', token is 'application'
-                # cut the edge's label and insert a new node
-                matched = _beginning_match(token, more)  # 4, the length of the common 'appl'
+                # cut the edge's label and insert a new node; matched is 4, the length of the common 'appl'
                 our_more = more[:matched]  # shortened run for this node ('appl')
                 new_edge = more[matched:]  # edge label for our current child in the new node ('es')
-                # insert a new node between ourselves and the curent child there
+                # insert a new node between this node and the current child there
                 new_child = ShortTrie()
-                self._edges[leader] = our_more, new_child  # 'appl' points to new node
+                node._edges[leader] = our_more, new_child  # 'appl' points to new node
                 new_child._edges[new_edge[:1]] = new_edge[1:], child  # new node's 'es' edge points to the old child
-                new_child.insert(token[matched:])  # insert 'ication' into the new node at 'appl'
+                new_child._best, new_child._count = child._best, child._count
+                child = new_child  # carry on inserting 'ication' into the new node at 'appl'
+            # otherwise the token continues with the same run of characters as the edge
+            # i.e. edge is 'app', new token is 'apply', so carry on down with 'ly'
+            node = child
+            path.append(node)
+            i += matched
+        node = path[-1]
+        _add_token(path, weight)
+        return node
+
+    def _update_best(self):
+        best = self._weight if self._terminates else None
+        for _, child in self._edges.values():
+            if best is None or best < child._best:
+                best = child._best
+        self._best = best
+
+    def _node(self, token):
+        """Return the node the token ends at, or None if it doesn't end at one."""
+        node = self
+        i = 0
+        while i < len(token):
+            entry = node._edges.get(token[i:i + 1])
+            if entry is None:
+                return None
+            more, node = entry
+            i += 1  # skip the first symbol
+            if _match_length(token, i, more) < len(more):
+                return None  # does not fully match this edge
+            i += len(more)
+        return node
+
+    def _find_prefix(self, token):
+        """
+        Return the node below which all the tokens beginning with token are,
+        and the prefix they all share there (which is longer than token if it
+        ends partway down an edge), or (None, None) if there are no such tokens.
+        """
+        node = self
+        prefix = token
+        i = 0
+        # traverse down until we have found the node that matches the given token
+        while i < len(token):
+            leader = token[i:i + 1]
+            if leader not in node._edges:
+                return None, None  # there are no entries with that next letter
+            else:
+                more, node = node._edges[leader]
+                i += 1
+                matched = _match_length(token, i, more)
+                if matched < len(more):
+                    if i + matched == len(token):
+                        # token ends partway down this edge without diverging
+                        # add the remainder of this edge to the prefix and go traverse
+                        prefix += more[matched:]
+                        break
+                    else:
+                        return None, None  # the whole edge isn't in the given token, either
+                # skip past the rest of the edge label and continue
+                i += len(more)
+        return node, prefix
+
+    def __setitem__(self, token, value):
+        """Insert token if not already in trie, and set its value."""
+        self._insert(token, None)._value = value
+
+    def __getitem__(self, token):
+        """Return the value of token, raising KeyError if it is not in trie."""
+        node = self._node(token)
+        if node is None or not node._terminates:
+            raise KeyError(token)
+        return node._value
+
+    def get(self, token, default=None):
+        """Return the value of token, or default if it is not in trie."""
+        node = self._node(token)
+        if node is None or not node._terminates:
+            return default
+        return node._value
+
+    def __delitem__(self, token):
+        """Remove token and its value, raising KeyError if it is not in trie."""
+        node = self
+        path = [node]
+        leaders = []  # the first symbols of the edges along the path
+        i = 0
+        while i < len(token):
+            leader = token[i:i + 1]
+            entry = node._edges.get(leader)
+            if entry is None:
+                raise KeyError(token)
+            more, node = entry
+            i += 1  # skip the first symbol
+            if _match_length(token, i, more) < len(more):
+                raise KeyError(token)
+            i += len(more)
+            path.append(node)
+            leaders.append(leader)
+        if not node._terminates:
+            raise KeyError(token)
+        node._terminates = False
+        node._value = None
+        node._weight = 0
+        if len(path) > 1:
+            if node._edges:
+                # if it has one child left, its edges can be joined up
+                _merge_edge(path[-2], leaders[-1])
+            else:
+                # nothing is left below it, so drop it; this may leave its
+                # parent (unless that is the root) with one child to join up with
+                del path[-2]._edges[leaders[-1]]
+                if len(path) > 2:
+                    _merge_edge(path[-3], leaders[-2])
+        _remove_token(path)
+
+    def __len__(self):
+        return self._count
+
+    def count(self, prefix=None):
+        """Return the number of tokens in trie beginning with prefix."""
+        node = self if prefix is None else self._find_prefix(prefix)[0]
+        return 0 if node is None else node._count
+
+    def items(self, prefix=None):
+        """Iterate over the tokens in trie beginning with prefix and their values, depth-first."""
+        if prefix is None:
+            node, prefix = self, _empty_token(self)
         else:
-            # no edges start with this token's first character, insert the whole thing with one edge
-            child = ShortTrie()
-            self._edges[token[:1]] = token[1:], child
-            child._terminates = True
+            node, prefix = self._find_prefix(prefix)
+            if node is None:
+                return iter(())
+        return _items(node, prefix, self._children)
+
+    @staticmethod
+    def _children(node, prefix):
+        for leader, (more, child) in node._edges.items():
+            edge = leader + more
+            yield child, edge if prefix is None else prefix + edge
 
     def contains(self, token):
         """Return true if token is in trie."""
-        if not token:
-            return self._terminates
-        elif token[:1] in self._edges:
-            more, child = self._edges[token[:1]]
-            token = token[1:]  # cut off first symbol
-            if not _startswith(token, more):
+        node = self
+        i = 0
+        while i < len(token):
+            entry = node._edges.get(token[i:i + 1])
+            if entry is None:
+                return False
+            more, node = entry
+            i += 1  # skip the first symbol
+            if _match_length(token, i, more) < len(more):
                 return False  # does not fully match this edge
-            return child.contains(token[len(more):])
-        else:
-            return False
+            i += len(more)
+        return node._terminates
 
     __contains__ = contains
 
+    def save(self, path):
+        """
+        Write the trie to the file at the given path in the flat form of a
+        FrozenTrie, with its tokens' weights (as floats) and values (pickled).
+        FrozenTrie.load(path) maps it back into memory, and can answer
+        contains, lookups and auto_complete, ranked or not, straight from the file.
+        """
+        tokens, weights, values = [], {}, {}
+        for token, node in _token_nodes(self, _empty_token(self), self._children):
+            tokens.append(token)
+            if node._weight != 0:
+                weights[token] = node._weight
+            if node._value is not None:
+                values[token] = node._value
+        FrozenTrie(tokens, weights, values).save(path)
+
     # noinspection PyProtectedMember
     def __iter__(self):
         """Traversing the short-trie depth-first."""
@@ -196,28 +603,20 @@ class ShortTrie(object):
                 edge = leader + more
                 q.appendleft((child, edge if prefix is None else prefix + edge))
 
-    def auto_complete(self, token, max_results=4):
-        """Trie auto complete."""
-        node = self
-        prefix = token
-        # traverse down until we have found the node that matches the given token
-        while token:
-            leader, token = token[:1], token[1:]
-            if leader not in node._edges:
-                return  # there are no entries with that next letter
-            else:
-                more, node = node._edges[leader]
-                if not _startswith(token, more):
-                    if _startswith(more, token):
-                        # token ends partway down this edge without diverging
-                        # add the remainder of this edge to the prefix and go traverse
-                        prefix += more[len(token):]
-                        break
-                    else:
-                        return  # the whole edge isn't in the given token, either
-                # cut off the rest of the edge label and continue
-                token = token[len(more):]
-        # iterate ovr the children breadth first from there
+    def ranked(self, prefix=None):
+        """Helper best-first traversal function for ranked auto complete."""
+        return _ranked(self, prefix, self._children)
+
+    def auto_complete(self, token, max_results=4, ranked=False):
+        """
+        Trie auto complete. Completions come in breadth-first order, or if
+        ranked is true, heaviest first.
+        """
+        node, prefix = self._find_prefix(token)
+        if node is None:
+            return
+        # iterate ovr the children breadth first (or heaviest first) from there
         # return default maximum of 4 tokens
-        for item, _ in zip(node.breadth_first(prefix), range(max_results)):
+        items = node.ranked(prefix) if ranked else node.breadth_first(prefix)
+        for item, _ in zip(items, range(max_results)):
             yield item
@@ -0,0 +1,178 @@
+# coding=utf-8
+from __future__ import unicode_literals
+from builtins import range
+
+import pickle
+import random
+import pytest
+
+from data_structures.augmented_bst import AggregateBST, MAX, MIN, Monoid, SUM
+from data_structures.bst import BST
+
+INCLUSIVES = [(True, True), (True, False), (False, True), (False, False)]
+# concatenation is not commutative, so this checks the order measures are combined in
+CONCAT = Monoid(lambda a, b: a + b, '')
+
+
+def check_aggregates(tree):
+    def check(node):
+        if node is None:
+            return
+        check(node.left)
+        check(node.right)
+        assert node.own == node.measure(getattr(node, 'value', node.val))
+        expected = node.own
+        if node.left is not None:
+            expected = tree._monoid.combine(node.left.agg, expected)
+        if node.right is not None:
+            expected = tree._monoid.combine(expected, node.right.agg)
+        assert node.agg == expected
+        assert node.balance in (-1, 0, 1)
+    check(tree._head)
+
+
+def brute(items, start, stop, inclusive, combine, identity):
+    if start is not None and start == stop:
+        inclusive = (True, True) if any(inclusive) else (False, False)
+    result = None
+    for item in sorted(items):
+        if start is not None and (item < start or (not inclusive[0] and item == start)):
+            continue
+        if stop is not None and (item > stop or (not inclusive[1] and item == stop)):
+            continue
+        result = item if result is None else combine(result, item)
+    return identity if result is None else result
+
+
+@pytest.mark.parametrize('monoid', [SUM, MIN, MAX])
+def test_aggregate_ranges(monoid):
+    items = random.sample(range(100), 40)
+    tree = AggregateBST(items, monoid=monoid)
+    check_aggregates(tree)
+    bounds = [None, -5, 0, 17, 50, 63, 99, 120]
+    for start in bounds:
+        for stop in bounds:
+            for inclusive in INCLUSIVES:
+                assert tree.aggregate(start, stop, inclusive) == brute(
+                    items, start, stop, inclusive, monoid.combine, monoid.identity)
+
+
+def test_aggregate_empty():
+    assert AggregateBST().aggregate() == 0
+    assert AggregateBST(monoid=MIN).aggregate(1, 5) is None
+    assert AggregateBST([1, 2, 3]).aggregate(3, 1) == 0
+
+
+def test_aggregate_order():
+    words = ['d', 'a', 'c', 'e', 'b', 'f', 'g']
+    tree = AggregateBST(words, monoid=CONCAT)
+    assert tree.aggregate() == 'abcdefg'
+    assert tree.aggregate('b', 'f', (False, True)) == 'cdef'
+
+
+def test_aggregate_mutations():
+    tree = AggregateBST(monoid=CONCAT)
+    expected = set()
+    letters = [chr(c) for c in range(ord('a'), ord('z') + 1)]
+    for _ in range(1000):
+        letter = random.choice(letters)
+        if random.random() < 0.6:
+            tree.insert(letter)
+            expected.add(letter)
+        else:
+            tree.delete(letter)
+            expected.discard(letter)
+    check_aggregates(tree)
+    assert tree.aggregate() == ''.join(sorted(expected))
+    assert tree.aggregate('f', 'p') == ''.join(x for x in sorted(expected) if 'f' <= x <= 'p')
+    del tree[2:5]
+    tree.pop_min()
+    tree.update(letters[::3])
+    tree.difference_update(letters[1::4])
+    tree.symmetric_difference_update(letters[::5])
+    check_aggregates(tree)
+    assert tree.aggregate() == ''.join(tree)
+
+
+def test_aggregate_split_join_copy():
+    tree = AggregateBST(range(100))
+    lower, upper = tree.split(40)
+    check_aggregates(lower)
+    check_aggregates(upper)
+    assert lower.aggregate() == sum(range(40))
+    assert upper.aggregate(None, 60) == sum(range(40, 61))
+    copy = upper.copy()
+    upper.join(lower)
+    check_aggregates(upper)
+    assert upper.aggregate() == sum(range(100))
+    copy.insert(1000)
+    assert copy.aggregate() == sum(range(40, 100)) + 1000
+    assert (copy | AggregateBST([1, 2])).aggregate() == sum(range(40, 100)) + 1003
+
+
+def test_aggregate_keyed():
+    events = [(t, random.randint(1, 10)) for t in random.sample(range(1000), 200)]
+    tree = AggregateBST(events, key=lambda event: event[0], measure=lambda event: event[1])
+    check_aggregates(tree)
+    for start, stop in [(0, 999), (100, 400), (500, 500), (990, 10)]:
+        assert tree.aggregate(start, stop) == sum(
+            count for t, count in events if start <= t <= stop)
+    tree.delete(events[0])
+    assert tree.aggregate() == sum(count for _, count in events[1:])
+
+
+def test_aggregate_from_sorted_and_pickle():
+    tree = AggregateBST.from_sorted(range(10), monoid=MAX)
+    check_aggregates(tree)
+    assert tree.aggregate(None, 4) == 4
+    loaded = pickle.loads(pickle.dumps(tree))
+    assert type(loaded) is AggregateBST
+    assert loaded.aggregate(None, 4) == 4
+    loaded.insert(-1)
+    assert loaded.aggregate(None, 0, (True, False)) == -1
+
+
+def test_join_rejects_incompatible_trees():
+    tree = AggregateBST(range(5))
+    for other in (BST(range(10, 15)), AggregateBST(range(10, 15), monoid=MAX)):
+        with pytest.raises((TypeError, ValueError)):
+            tree.join(other)
+        assert list(other) == list(range(10, 15))
+    with pytest.raises(TypeError):
+        BST(range(10, 15)).join(tree)
+    assert tree.aggregate() == 10
+    tree.join(AggregateBST(range(10, 15)))
+    assert tree.aggregate() == 10 + 60
+
+
+def test_set_operators_keep_aggregates():
+    tree = AggregateBST(range(10))
+    for other in (BST([1, 2]), BST(range(-5, 20))):
+        for result in (tree & other, tree | other, tree - other, tree ^ other):
+            assert type(result) is AggregateBST
+            assert result.aggregate() == sum(result)
+    assert (tree & BST([1, 2])).aggregate(2, None) == 2
+
+
+def test_measures_each_item_once():
+    measured = []
+
+    def measure(item):
+        measured.append(item)
+        return item
+
+    tree = AggregateBST(range(100), measure=measure)
+    for i in range(100, 200):
+        tree.insert(i)
+    for i in range(0, 200, 3):
+        tree.delete(i)
+    copied = tree.copy()
+    assert tree.aggregate(10, 150) == sum(i for i in range(10, 151) if i % 3)
+    assert copied.aggregate() == tree.aggregate()
+    assert sorted(measured) == list(range(200))
+
+
+def test_trees_share_node_types():
+    a, b = AggregateBST([1]), AggregateBST([2])
+    assert type(a._head) is type(b._head)
+    assert type(AggregateBST([1], monoid=MAX)._head) is not type(a._head)
@@ -0,0 +1,162 @@
+# coding=utf-8
+from __future__ import unicode_literals
+from builtins import range
+
+from math import log
+import random
+import pytest
+
+from data_structures.balanced_bst import RedBlackBST, WeightBalancedBST
+from data_structures.bst import BST
+
+TREE_TYPES = (RedBlackBST, WeightBalancedBST)
+
+
+def check_node(node):
+    """Check the sizes, depths and order of a subtree, returning its nodes in order."""
+    if node is None:
+        return []
+    left, right = check_node(node.left), check_node(node.right)
+    assert all(n.val < node.val for n in left)
+    assert all(node.val < n.val for n in right)
+    assert node.len_ == len(left) + len(right) + 1
+    assert node.depth == 1 + max(
+        node.left.depth if node.left else 0, node.right.depth if node.right else 0)
+    if hasattr(node, 'rank'):
+        for child in (node.left, node.right):
+            if child is None:
+                assert node.rank == 1
+            else:
+                assert node.rank - child.rank in (0, 1)
+                if node.rank == child.rank:
+                    # red children have black children
+                    for grandchild in (child.left, child.right):
+                        assert grandchild is None or grandchild.rank < child.rank
+    else:
+        left_weight, right_weight = len(left) + 1, len(right) + 1
+        assert left_weight <= 3 * right_weight and right_weight <= 3 * left_weight
+    return left + [node] + right
+
+
+def check_invariants(tree):
+    check_node(tree._head)
+    assert tree.depth() <= 2 * log(len(tree) + 1, 2) + 1
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+@pytest.mark.parametrize('order', ['random', 'sorted', 'reversed', 'zigzag'])
+def test_insert_delete(tree_type, order):
+    items = list(range(500))
+    if order == 'random':
+        random.shuffle(items)
+    elif order == 'reversed':
+        items.reverse()
+    elif order == 'zigzag':
+        items = [x for pair in zip(items[:250], reversed(items[250:])) for x in pair]
+    tree = tree_type()
+    for item in items:
+        tree.insert(item)
+    check_invariants(tree)
+    assert list(tree) == sorted(items)
+    for item in items[::2]:
+        tree.delete(item)
+    check_invariants(tree)
+    assert list(tree) == sorted(items[1::2])
+    for item in items[1::2]:
+        tree.delete(item)
+        assert item not in tree
+    assert list(tree) == []
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_fuzz(tree_type):
+    tree = tree_type()
+    expected = set()
+    for _ in range(3000):
+        item = random.randint(0, 300)
+        if random.random() < 0.55:
+            tree.insert(item)
+            expected.add(item)
+        else:
+            tree.delete(item)
+            expected.discard(item)
+    check_invariants(tree)
+    assert list(tree) == sorted(expected)
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_from_sorted(tree_type):
+    for size in range(100):
+        tree = tree_type.from_sorted(range(size))
+        check_invariants(tree)
+        tree.insert(size)
+        tree.delete(0)
+        check_invariants(tree)
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_bulk_operations(tree_type):
+    tree = tree_type(random.sample(range(2000), 500))
+    expected = set(tree)
+    for _ in range(20):
+        batch = random.sample(range(2000), random.randint(1, 300))
+        operation = random.choice(['update', 'difference_update',
+                                   'intersection_update', 'symmetric_difference_update'])
+        getattr(tree, operation)(batch)
+        getattr(expected, operation)(batch)
+        check_invariants(tree)
+        assert list(tree) == sorted(expected)
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_split_join_slices(tree_type):
+    tree = tree_type(range(1000))
+    lower, upper = tree.split(123)
+    check_invariants(lower)
+    check_invariants(upper)
+    upper.join(tree_type(range(2000, 2003)))
+    check_invariants(upper)
+    lower.join(upper)
+    check_invariants(lower)
+    assert list(lower) == list(range(1000)) + [2000, 2001, 2002]
+    expected = list(lower)
+    del lower[100:900], expected[100:900]
+    check_invariants(lower)
+    del lower[::3], expected[::3]
+    check_invariants(lower)
+    assert lower.pop_min() == expected[0]
+    assert lower.pop_max() == expected[-1]
+    check_invariants(lower)
+    assert list(lower) == expected[1:-1]
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_keyed_and_copied(tree_type):
+    words = ['pear', 'Apple', 'fig', 'banana', 'Cherry', 'date']
+    tree = tree_type(words, key=str.lower)
+    assert list(tree) == sorted(words, key=str.lower)
+    tree.delete('APPLE')
+    check_invariants(tree)
+    copy = tree.copy()
+    assert type(copy) is tree_type
+    copy.insert('elderberry')
+    check_invariants(copy)
+    assert 'elderberry' not in tree
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_join_rejects_other_balancing(tree_type):
+    for left, right in [(tree_type([1]), BST([5, 6])), (BST([1]), tree_type([5, 6]))]:
+        with pytest.raises(TypeError):
+            left.join(right)
+        assert list(left) == [1]
+        assert list(right) == [5, 6]
+
+
+@pytest.mark.parametrize('tree_type', TREE_TYPES)
+def test_set_operators_keep_balancing(tree_type):
+    tree = tree_type(range(10))
+    for other in (BST([1]), BST(range(20))):
+        for result in (tree & other, tree | other, tree - other, tree ^ other):
+            assert type(result) is tree_type
+            check_invariants(result)
@@ -5,7 +5,7 @@ from builtins import open, range, reversed
 from itertools import count
 import pytest
 
-from data_structures.bst import BST
+from data_structures.bst import BST, BSTMap, PersistentBST
 
 # Our big-ish tree, constructed naiively, is shaped like so if populated naiively:
 #            12
@@ -533,3 +533,840 @@ def test_tree_invariants_fuzz():
         check_invariants(bst)
         bst.delete(random.randint(0, 49))
         check_invariants(bst)
+
+
+@pytest.mark.parametrize('items', TREE_INORDER + [list(range(1000))])
+def test_from_sorted(items):
+    bst = BST.from_sorted(items)
+    assert list(bst) == items
+    check_invariants(bst)
+
+
+def test_from_sorted_duplicates():
+    bst = BST.from_sorted([1, 1, 2, 3, 3, 3, 4])
+    assert list(bst) == [1, 2, 3, 4]
+    assert len(bst) == 4
+    check_invariants(bst)
+
+
+def test_from_sorted_unsorted():
+    with pytest.raises(ValueError):
+        BST.from_sorted([1, 3, 2])
+
+
+def test_from_sorted_mutable():
+    with pytest.raises(TypeError):
+        BST.from_sorted([[]])
+
+
+def test_init_sorted_is_perfectly_balanced():
+    bst = BST(range(1023))
+    assert bst.depth() == 10
+    assert len(bst) == 1023
+    check_invariants(bst)
+
+
+def _recursive_traversals(node):
+    """Reference recursive traversals of a subtree: pre-order, in-order, and post-order."""
+    if node is None:
+        return [], [], []
+    left_pre, left_in, left_post = _recursive_traversals(node.left)
+    right_pre, right_in, right_post = _recursive_traversals(node.right)
+    return (
+        [node.val] + left_pre + right_pre,
+        left_in + [node.val] + right_in,
+        left_post + right_post + [node.val],
+    )
+
+
+def test_traversals_large_tree():
+    import random
+    items = list(range(500))
+    random.shuffle(items)
+    bst = BST(items)
+    pre, in_, post = _recursive_traversals(bst._head)
+    assert list(bst.pre_order()) == pre
+    assert list(bst) == in_ == list(range(500))
+    assert list(bst.post_order()) == post
+    assert list(reversed(bst)) == in_[::-1]
+
+
+@pytest.mark.parametrize('inclusive', INCLUSIVES)
+def test_irange_fuzz(inclusive):
+    import random
+    items = random.sample(range(1000), 300)
+    bst = BST(items)
+    for _ in range(100):
+        start, stop = sorted(random.randint(-10, 1010) for _ in range(2))
+        expected = [
+            x for x in sorted(items)
+            if (start < x or (inclusive[0] and x == start)) and
+            (x < stop or (inclusive[1] and x == stop))
+        ]
+        if start == stop and any(inclusive) and start in bst:
+            expected = [start]
+        assert list(bst.irange(start, stop, inclusive)) == expected
+        assert list(bst.irange(start, stop, inclusive, reverse=True)) == expected[::-1]
+        assert list(bst.irange(None, stop, inclusive, reverse=True)) == [
+            x for x in reversed(sorted(items)) if x < stop or (inclusive[1] and x == stop)]
+
+
+def test_node_memory():
+    """Nodes should be compact: no per-node __dict__, and well under 100 bytes each."""
+    import tracemalloc
+    values = list(range(10000))
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        bst = BST.from_sorted(values)
+        per_node = (tracemalloc.get_traced_memory()[0] - before) / len(values)
+    finally:
+        tracemalloc.stop()
+    assert not hasattr(bst._head, '__dict__')
+    assert per_node < 100
+
+
+def test_map_set_get():
+    m = BSTMap()
+    for i, key in enumerate(BIGTREE_ITEMS):
+        m[key] = i
+    for i, key in enumerate(BIGTREE_ITEMS):
+        assert m[key] == i
+    assert len(m) == len(BIGTREE_ITEMS)
+    m[12] = 'replaced'
+    assert m[12] == 'replaced'
+    assert len(m) == len(BIGTREE_ITEMS)
+    check_invariants(m)
+
+
+def test_map_missing():
+    m = BSTMap({1: 'a'})
+    with pytest.raises(KeyError):
+        _ = m[2]
+    assert m.get(2) is None
+    assert m.get(2, 'default') == 'default'
+    assert 2 not in m
+    with pytest.raises(KeyError):
+        del m[2]
+    with pytest.raises(KeyError):
+        del BSTMap()[2]
+
+
+def test_map_mutable_key():
+    m = BSTMap()
+    with pytest.raises(TypeError):
+        m[[]] = 1
+
+
+@pytest.mark.parametrize('items', TREE_ITEMS)
+def test_map_iteration(items):
+    m = BSTMap((key, str(key)) for key in items)
+    assert list(m) == list(m.keys()) == sorted(items)
+    assert list(reversed(m)) == sorted(items, reverse=True)
+    assert list(m.values()) == [str(key) for key in sorted(items)]
+    assert list(m.items()) == [(key, str(key)) for key in sorted(items)]
+
+
+def test_map_from_sorted_items():
+    m = BSTMap([(1, 'a'), (2, 'b'), (2, 'c'), (3, 'd')])
+    assert list(m.items()) == [(1, 'a'), (2, 'c'), (3, 'd')]
+    check_invariants(m)
+
+
+def test_map_irange_items():
+    m = BSTMap((key, -key) for key in range(10))
+    assert list(m.irange(3, 6)) == [3, 4, 5, 6]
+    assert list(m.irange_items(3, 6, (False, True))) == [(4, -4), (5, -5), (6, -6)]
+    assert list(m.irange_items(6, 3)) == []
+    assert list(BSTMap().irange_items(None, None)) == []
+
+
+def test_map_floor_ceiling():
+    m = BSTMap((key, str(key)) for key in range(0, 100, 10))
+    assert m.floor(25) == (20, '20')
+    assert m.floor(20) == (20, '20')
+    assert m.floor(-1) is None
+    assert m.ceiling(25) == (30, '30')
+    assert m.ceiling(30) == (30, '30')
+    assert m.ceiling(91) is None
+
+
+def test_map_item_at():
+    m = BSTMap((key, str(key)) for key in range(100, 120))
+    for i in range(20):
+        assert m.item_at(i) == (100 + i, str(100 + i))
+        assert m.item_at(-1 - i) == (119 - i, str(119 - i))
+    with pytest.raises(IndexError):
+        m.item_at(20)
+
+
+def test_map_fuzz():
+    import random
+    m = BSTMap()
+    d = {}
+    for _ in range(500):
+        key = random.randint(0, 60)
+        if random.random() < 0.4 and key in d:
+            del m[key]
+            del d[key]
+        else:
+            value = random.random()
+            m[key] = value
+            d[key] = value
+        check_invariants(m)
+    assert list(m.items()) == sorted(d.items())
+
+
+@pytest.mark.parametrize('items', TREE_ITEMS + [range(50)])
+@pytest.mark.parametrize('batch', [[], [3], [0, 1, 2], [5, 3, 3, 100, -1], list(range(-20, 80, 3))])
+def test_update(items, batch):
+    bst = BST(items)
+    bst.update(batch)
+    assert list(bst) == sorted(set(items) | set(batch))
+    check_invariants(bst)
+
+
+@pytest.mark.parametrize('items', TREE_ITEMS + [range(50)])
+@pytest.mark.parametrize('batch', [[], [3], [0, 1, 2], [5, 3, 3, 100, -1], list(range(-20, 80, 3))])
+def test_difference_update(items, batch):
+    bst = BST(items)
+    bst.difference_update(batch)
+    assert list(bst) == sorted(set(items) - set(batch))
+    check_invariants(bst)
+
+
+def test_update_mutable():
+    bst = BST()
+    with pytest.raises(TypeError):
+        bst.update([1, []])
+
+
+def test_batch_update_fuzz():
+    import random
+    bst = BST()
+    expected = set()
+    for _ in range(50):
+        added = [random.randint(0, 500) for _ in range(random.randint(0, 60))]
+        removed = [random.randint(0, 500) for _ in range(random.randint(0, 60))]
+        bst.update(added)
+        expected.update(added)
+        check_invariants(bst)
+        bst.difference_update(removed)
+        expected.difference_update(removed)
+        check_invariants(bst)
+        assert list(bst) == sorted(expected)
+
+
+@pytest.mark.parametrize('items', TREE_ITEMS + [range(50)])
+@pytest.mark.parametrize('key', [-5, 0, 1, 2, 3, 12.5, 13, 25, 137, 200])
+def test_split(items, key):
+    bst = BST(items)
+    lower, upper = bst.split(key)
+    assert list(lower) == sorted(x for x in items if x < key)
+    assert list(upper) == sorted(x for x in items if x >= key)
+    assert len(bst) == 0
+    check_invariants(lower)
+    check_invariants(upper)
+
+
+@pytest.mark.parametrize('low_size', [0, 1, 2, 5, 17, 100])
+@pytest.mark.parametrize('high_size', [0, 1, 3, 40])
+def test_join(low_size, high_size):
+    low = BST(range(low_size))
+    high = BST(range(1000, 1000 + high_size))
+    expected = list(low) + list(high)
+    low.join(high)
+    assert list(low) == expected
+    assert len(high) == 0
+    check_invariants(low)
+    # the lesser tree may also be joined into the greater
+    low, high = BST(range(low_size)), BST(range(1000, 1000 + high_size))
+    high.join(low)
+    assert list(high) == expected
+    assert len(low) == 0
+    check_invariants(high)
+
+
+def test_join_overlapping():
+    bst = BST([1, 5])
+    other = BST([3])
+    with pytest.raises(ValueError):
+        bst.join(other)
+    assert list(bst) == [1, 5]
+    assert list(other) == [3]
+    with pytest.raises(ValueError):
+        bst.join(bst)
+
+
+def test_join_rejects_incompatible_trees():
+    # persistent trees share their nodes between versions, so they must not be taken apart
+    persistent = PersistentBST([5, 6, 7])
+    bst = BST([1])
+    with pytest.raises(TypeError):
+        bst.join(persistent)
+    assert list(persistent) == [5, 6, 7]
+    assert list(bst) == [1]
+    # nor can trees keyed differently be joined, either way round
+    keyed = BST([-5, 6], key=abs)
+    for left, right in [
+        (bst, keyed),
+        (keyed, BST([7, 8])),
+        (keyed, BST([7, 8], key=lambda item: abs(item))),
+    ]:
+        before = list(left), list(right)
+        with pytest.raises(ValueError):
+            left.join(right)
+        assert (list(left), list(right)) == before
+    # a tree of the same type with the same key function is fine
+    keyed.join(BST([7, -8], key=abs))
+    assert list(keyed) == [-5, 6, 7, -8]
+    check_invariants(keyed)
+
+
+def test_split_join_roundtrip():
+    import random
+    items = random.sample(range(10000), 1000)
+    bst = BST(items)
+    for _ in range(50):
+        lower, upper = bst.split(random.randint(0, 10000))
+        lower.join(upper)
+        bst = lower
+        check_invariants(bst)
+    assert list(bst) == sorted(items)
+
+
+SET_OPERANDS = TREE_ITEMS + [range(50), range(-10, 100, 7)]
+
+
+@pytest.mark.parametrize('a', SET_OPERANDS)
+@pytest.mark.parametrize('b', SET_OPERANDS)
+def test_set_operators(a, b):
+    for op, expected in [
+        ('__or__', set(a) | set(b)),
+        ('__and__', set(a) & set(b)),
+        ('__sub__', set(a) - set(b)),
+        ('__xor__', set(a) ^ set(b)),
+    ]:
+        tree_a, tree_b = BST(a), BST(b)
+        result = getattr(tree_a, op)(tree_b)
+        assert list(result) == sorted(expected)
+        check_invariants(result)
+        # operands are unchanged
+        assert list(tree_a) == sorted(set(a))
+        assert list(tree_b) == sorted(set(b))
+
+
+@pytest.mark.parametrize('a', SET_OPERANDS)
+@pytest.mark.parametrize('b', SET_OPERANDS)
+def test_set_inplace_operators(a, b):
+    for op, expected in [
+        ('__ior__', set(a) | set(b)),
+        ('__iand__', set(a) & set(b)),
+        ('__isub__', set(a) - set(b)),
+        ('__ixor__', set(a) ^ set(b)),
+    ]:
+        tree_a, tree_b = BST(a), BST(b)
+        result = getattr(tree_a, op)(tree_b)
+        assert result is tree_a
+        assert list(tree_a) == sorted(expected)
+        check_invariants(tree_a)
+        assert list(tree_b) == sorted(set(b))
+
+
+def test_set_operators_self():
+    bst = BST(range(10))
+    assert list(bst & bst) == list(range(10))
+    assert list(bst - bst) == []
+    bst ^= bst
+    assert list(bst) == []
+
+
+def test_set_operators_other_types():
+    with pytest.raises(TypeError):
+        _ = BST() | {1}
+    with pytest.raises(TypeError):
+        bst = BST()
+        bst &= [1]
+
+
+def test_set_operators_keep_left_operand_kind():
+    # the result is like the left operand, whichever is smaller
+    keyed = BST([-1, 2, -3, 4, 5], key=abs)
+    for other in (BST([1, 3]), PersistentBST([1, 3]), BST(range(-20, 20))):
+        result = keyed & other
+        assert type(result) is BST
+        assert result._key is abs
+        assert list(result) == ([-1, -3] if len(other) < 5 else [-1, 2, -3, 4, 5])
+        check_invariants(result)
+    big = BST(range(4))
+    for other in (PersistentBST([1, 7]), PersistentBST(range(-5, 10))):
+        for op, expected in [
+            ('__or__', set(range(4)) | set(other)),
+            ('__and__', set(range(4)) & set(other)),
+            ('__sub__', set(range(4)) - set(other)),
+            ('__xor__', set(range(4)) ^ set(other)),
+        ]:
+            result = getattr(big, op)(other)
+            assert type(result) is BST
+            assert list(result) == sorted(expected)
+            check_invariants(result)
+    assert list(big) == [0, 1, 2, 3]
+
+
+def test_copy():
+    bst = BST(BIGTREE_ITEMS)
+    copied = bst.copy()
+    assert list(copied) == list(bst)
+    assert list(copied.pre_order()) == list(bst.pre_order())
+    copied.insert(1000)
+    assert 1000 not in bst
+    check_invariants(copied)
+
+
+def test_index():
+    bst = BST(BIGTREE_ITEMS)
+    for i, item in enumerate(sorted(BIGTREE_ITEMS)):
+        assert bst.index(item) == i
+    with pytest.raises(ValueError):
+        bst.index(14)
+    with pytest.raises(ValueError):
+        BST().index(14)
+
+
+@pytest.mark.parametrize('item', range(-1, 30))
+def test_bisect(item):
+    import bisect
+    items = list(range(0, 30, 3))
+    bst = BST(items)
+    assert bst.bisect_left(item) == bisect.bisect_left(items, item)
+    assert bst.bisect_right(item) == bisect.bisect_right(items, item)
+
+
+@pytest.mark.parametrize('inclusive', INCLUSIVES)
+def test_count_range(inclusive):
+    import random
+    items = random.sample(range(200), 80)
+    bst = BST(items)
+    bounds = [None] + list(range(-5, 205, 3)) + sorted(items)[::7]
+    for start in bounds:
+        for stop in bounds[::5]:
+            assert bst.count_range(start, stop, inclusive) == \
+                len(list(bst.irange(start, stop, inclusive)))
+    assert BST().count_range(1, 2) == 0
+
+
+SLICES = [
+    slice(None), slice(3, 7), slice(-5, None), slice(None, -5), slice(8, 3), slice(100, 200),
+    slice(None, None, 2), slice(1, 15, 3), slice(None, None, -1), slice(15, 2, -2), slice(-1, -8, -3),
+]
+
+
+@pytest.mark.parametrize('items', TREE_ITEMS + [range(20)])
+@pytest.mark.parametrize('index', SLICES)
+def test_slice(items, index):
+    bst = BST(items)
+    assert bst[index] == sorted(items)[index]
+    assert list(bst.islice(index.start, index.stop, index.step)) == sorted(items)[index]
+
+
+@pytest.mark.parametrize('items', TREE_ITEMS + [range(20), range(100)])
+@pytest.mark.parametrize('index', SLICES)
+def test_delete_slice(items, index):
+    bst = BST(items)
+    expected = sorted(items)
+    del expected[index]
+    del bst[index]
+    assert list(bst) == expected
+    check_invariants(bst)
+
+
+def test_slice_bad_step():
+    bst = BST(range(10))
+    with pytest.raises(ValueError):
+        _ = bst[::0]
+    with pytest.raises(ValueError):
+        del bst[::0]
+
+
+RECORDS = [{'id': i, 'name': name} for i, name in enumerate(['eve', 'bob', 'dan', 'amy', 'cat', 'fay'])]
+
+
+def _by_name(record):
+    return record['name']
+
+
+def test_key_ordering():
+    bst = BST(RECORDS, key=_by_name)
+    assert list(bst) == sorted(RECORDS, key=_by_name)
+    assert list(reversed(bst)) == sorted(RECORDS, key=_by_name, reverse=True)
+    assert bst[0] == {'id': 3, 'name': 'amy'}
+    assert bst[1:3] == [{'id': 1, 'name': 'bob'}, {'id': 4, 'name': 'cat'}]
+    assert sorted(bst.pre_order(), key=_by_name) == list(bst)
+    assert sorted(bst.breadth_first(), key=_by_name) == list(bst)
+    check_invariants(bst)
+
+
+def test_key_computed_once_per_insert():
+    calls = []
+
+    def key(record):
+        calls.append(record)
+        return record['name']
+
+    bst = BST(key=key)
+    for record in RECORDS:
+        bst.insert(record)
+    assert len(calls) == len(RECORDS)
+    del calls[:]
+    BST(RECORDS, key=key)
+    assert len(calls) == len(RECORDS)
+
+
+def test_key_equal_items():
+    bst = BST(RECORDS, key=_by_name)
+    bst.insert({'id': 100, 'name': 'bob'})
+    assert len(bst) == len(RECORDS)
+    assert {'id': 100, 'name': 'bob'} in bst
+    assert bst[1] == {'id': 1, 'name': 'bob'}
+    assert bst.index({'name': 'dan'}) == 3
+    bst.delete({'name': 'dan'})
+    assert {'name': 'dan'} not in bst
+    check_invariants(bst)
+
+
+def test_key_mutable_key():
+    bst = BST(key=lambda x: [x])
+    with pytest.raises(TypeError):
+        bst.insert(1)
+
+
+def test_key_ranges():
+    bst = BST(range(20), key=lambda x: -x)
+    assert list(bst) == list(range(19, -1, -1))
+    assert list(bst.irange(-10, -5)) == [10, 9, 8, 7, 6, 5]
+    assert bst.count_range(-10, -5) == 6
+    assert bst.bisect_left(10) == 9
+    assert bst.bisect_right(10) == 10
+
+
+def test_key_from_sorted():
+    bst = BST.from_sorted(range(20, 0, -1), key=lambda x: -x)
+    assert list(bst) == list(range(20, 0, -1))
+    with pytest.raises(ValueError):
+        BST.from_sorted(range(20), key=lambda x: -x)
+
+
+def test_key_batch_operations():
+    def key(x):
+        return -x
+    bst = BST(range(0, 50, 2), key=key)
+    bst.update(range(0, 50, 3))
+    assert list(bst) == sorted(set(range(0, 50, 2)) | set(range(0, 50, 3)), reverse=True)
+    check_invariants(bst)
+    bst.difference_update(range(0, 50, 5))
+    bst.symmetric_difference_update(range(40, 60))
+    bst.intersection_update(range(10, 55))
+    expected = set(range(0, 50, 2)) | set(range(0, 50, 3))
+    expected -= set(range(0, 50, 5))
+    expected ^= set(range(40, 60))
+    expected &= set(range(10, 55))
+    assert list(bst) == sorted(expected, reverse=True)
+    check_invariants(bst)
+
+
+def test_key_preserved():
+    bst = BST(range(10), key=lambda x: -x)
+    assert list(bst.copy()) == list(range(9, -1, -1))
+    assert list(bst | BST([20])) == [20] + list(range(9, -1, -1))
+    lower, upper = bst.split(5)
+    assert list(lower) == [9, 8, 7, 6]
+    assert list(upper) == [5, 4, 3, 2, 1, 0]
+    upper.insert(100)
+    assert list(upper) == [100, 5, 4, 3, 2, 1, 0]
+
+
+def test_persistent_versions():
+    import random
+    versions = [(PersistentBST(), set())]
+    for _ in range(300):
+        tree, expected = versions[-1]
+        item = random.randint(0, 100)
+        if random.random() < 0.6:
+            versions.append((tree.insert(item), expected | {item}))
+        else:
+            versions.append((tree.delete(item), expected - {item}))
+    # every version is still intact
+    for tree, expected in versions:
+        assert list(tree) == sorted(expected)
+        check_invariants(tree)
+
+
+def test_persistent_shares_nodes():
+    def nodes(tree):
+        stack = [tree._head]
+        while stack:
+            node = stack.pop()
+            if node is not None:
+                yield node
+                stack.extend((node.left, node.right))
+
+    old = PersistentBST(range(1000))
+    for new in (old.insert(500.5), old.delete(500), old.delete(0), old.insert(-1)):
+        old_nodes = set(map(id, nodes(old)))
+        new_nodes = [node for node in nodes(new) if id(node) not in old_nodes]
+        # only the path to the change (and a few rotated nodes) is new
+        assert len(new_nodes) <= 2 * old.depth()
+        check_invariants(new)
+    assert list(old) == list(range(1000))
+
+
+def test_persistent_unchanged():
+    tree = PersistentBST([1, 2, 3])
+    assert tree.insert(2) is tree
+    assert tree.delete(4) is tree
+    with pytest.raises(TypeError):
+        tree.insert([])
+
+
+def test_persistent_read_operations():
+    tree = PersistentBST(BIGTREE_ITEMS)
+    assert list(tree) == sorted(BIGTREE_ITEMS)
+    assert tree[2] == 12
+    assert list(tree.irange(10, 50)) == [12, 13, 28, 42]
+    assert tree.count_range(10, 50) == 4
+    assert tree.index(42) == 5
+    assert 137 in tree
+    assert repr(tree) == "data_structures.bst.PersistentBST({0})".format(sorted(BIGTREE_ITEMS))
+    assert list(BST([1, 5]) | tree) == sorted(set(BIGTREE_ITEMS) | {1})
+
+
+def test_persistent_key():
+    tree = PersistentBST(range(10), key=lambda x: -x)
+    newer = tree.insert(20).delete(5)
+    assert list(tree) == list(range(9, -1, -1))
+    assert list(newer) == [20, 9, 8, 7, 6, 4, 3, 2, 1, 0]
+    check_invariants(newer)
+
+
+@pytest.mark.parametrize('value', [x / 2 for x in range(-4, 90)])
+def test_floor_ceiling_lower_higher(value):
+    items = list(range(0, 41, 4))
+    bst = BST(items)
+    below = [x for x in items if x <= value]
+    above = [x for x in items if x >= value]
+    assert bst.floor(value) == (below[-1] if below else None)
+    assert bst.ceiling(value) == (above[0] if above else None)
+    strictly_below = [x for x in items if x < value]
+    strictly_above = [x for x in items if x > value]
+    assert bst.lower(value) == (strictly_below[-1] if strictly_below else None)
+    assert bst.higher(value) == (strictly_above[0] if strictly_above else None)
+
+
+def test_nearness_empty():
+    bst = BST()
+    assert bst.floor(1) is bst.ceiling(1) is bst.lower(1) is bst.higher(1) is None
+    assert bst.nearest(1, 5) == []
+    with pytest.raises(ValueError):
+        bst.min()
+    with pytest.raises(ValueError):
+        bst.max()
+    with pytest.raises(IndexError):
+        bst.pop_min()
+    with pytest.raises(IndexError):
+        bst.pop_max()
+
+
+def test_min_max_pop():
+    import random
+    items = random.sample(range(1000), 100)
+    bst = BST(items)
+    assert bst.min() == min(items)
+    assert bst.max() == max(items)
+    remaining = sorted(items)
+    while remaining:
+        if random.random() < 0.5:
+            assert bst.pop_min() == remaining.pop(0)
+        else:
+            assert bst.pop_max() == remaining.pop()
+        assert list(bst) == remaining
+        check_invariants(bst)
+
+
+@pytest.mark.parametrize('value', [-3, 0, 7, 10, 11.5, 25, 48, 60])
+@pytest.mark.parametrize('k', [0, 1, 2, 5, 100])
+def test_nearest(value, k):
+    items = list(range(0, 50, 3))
+    bst = BST(items)
+    expected = sorted(items, key=lambda x: (abs(x - value), x))[:k]
+    assert bst.nearest(value, k) == expected
+
+
+def test_nearest_key():
+    samples = [(t, 'sample {0}'.format(t)) for t in range(0, 100, 10)]
+    bst = BST(samples, key=lambda sample: sample[0])
+    assert bst.floor(35) == (30, 'sample 30')
+    assert bst.nearest(36, 2) == [(40, 'sample 40'), (30, 'sample 30')]
+
+
+@pytest.mark.parametrize('items', [
+    [],
+    [5, -3, 12, 1 << 62, -(1 << 63)],
+    [1 << 70, 3, -2],
+    [2.5, -1.0, 1e300],
+    ['pear', 'apple', '', 'çafé'],
+    [b'\x00\xff', b'abc', b''],
+    [(1, 'a'), (0, 'b')],
+    [True, 3],
+])
+def test_dump_load(items):
+    from io import BytesIO
+    bst = BST(items)
+    f = BytesIO()
+    bst.dump(f)
+    f.write(b'trailing data')
+    f.seek(0)
+    loaded = BST.load(f)
+    assert list(loaded) == list(bst)
+    assert [type(x) for x in loaded] == [type(x) for x in bst]
+    check_invariants(loaded)
+    assert f.read() == b'trailing data'
+
+
+def test_dump_load_compact():
+    from io import BytesIO
+    f = BytesIO()
+    BST(range(1000)).dump(f)
+    assert len(f.getvalue()) < 8 * 1000 + 20
+
+
+def test_load_invalid():
+    from io import BytesIO
+    with pytest.raises(ValueError):
+        BST.load(BytesIO(b'not a tree at all'))
+    f = BytesIO()
+    BST(range(10)).dump(f)
+    with pytest.raises(ValueError):
+        BST.load(BytesIO(f.getvalue()[:-1]))
+
+
+def test_dump_load_key_and_persistent():
+    from io import BytesIO
+    f = BytesIO()
+    BST(['b', 'A', 'c'], key=str.lower).dump(f)
+    f.seek(0)
+    loaded = PersistentBST.load(f, key=str.lower)
+    assert isinstance(loaded, PersistentBST)
+    assert list(loaded) == ['A', 'b', 'c']
+    assert 'a' in loaded
+
+
+@pytest.mark.parametrize('items', [
+    [-(1 << 70), 5],
+    [3, -(1 << 63) - 1, 1 << 62],
+    [-(1 << 63), 1, (1 << 63) - 1],
+])
+def test_dump_load_keyed_ints(items):
+    from io import BytesIO
+    f = BytesIO()
+    BST(items, key=abs).dump(f)
+    f.seek(0)
+    loaded = BST.load(f, key=abs)
+    assert list(loaded) == sorted(items, key=abs)
+    check_invariants(loaded)
+
+
+def test_pickle():
+    import pickle
+    bst = BST(range(100000))
+    loaded = pickle.loads(pickle.dumps(bst))
+    assert type(loaded) is BST
+    assert list(loaded) == list(bst)
+    check_invariants(loaded)
+    persistent = pickle.loads(pickle.dumps(PersistentBST([3, 1, 2])))
+    assert type(persistent) is PersistentBST
+    assert list(persistent) == [1, 2, 3]
+
+
+def test_map_irange_reverse():
+    m = BSTMap((i, str(i)) for i in range(10))
+    assert list(m.irange(3, 6, reverse=True)) == [6, 5, 4, 3]
+    assert list(m.irange_items(7, None, (False, True), reverse=True)) == [(9, '9'), (8, '8')]
+
+
+def test_cursor_walk():
+    items = list(range(0, 200, 2))
+    bst = BST(items)
+    cursor = bst.cursor()
+    assert list(cursor) == items
+    with pytest.raises(StopIteration):
+        cursor.next()
+    assert [cursor.prev() for _ in items] == items[::-1]
+    with pytest.raises(StopIteration):
+        cursor.prev()
+    assert cursor.next() == 0
+
+
+@pytest.mark.parametrize('key', [-1, 0, 7, 8, 150, 198, 199, 300])
+@pytest.mark.parametrize('inclusive', [True, False])
+def test_cursor_seek(key, inclusive):
+    items = list(range(0, 200, 2))
+    bst = BST(items)
+    after = [x for x in items if x > key or (inclusive and x == key)]
+    before = [x for x in items if x not in after]
+    assert list(bst.cursor(key, inclusive)) == after
+    cursor = bst.cursor(key, inclusive)
+    assert [cursor.prev() for _ in before] == before[::-1]
+    with pytest.raises(StopIteration):
+        cursor.prev()
+
+
+def test_cursor_random_walk():
+    import random
+    items = sorted(random.sample(range(1000), 200))
+    cursor = BST(items).cursor()
+    position = 0  # index of the item after the cursor
+    for _ in range(2000):
+        if random.random() < 0.5:
+            if position < len(items):
+                assert cursor.next() == items[position]
+                position += 1
+            else:
+                with pytest.raises(StopIteration):
+                    cursor.next()
+        else:
+            if position > 0:
+                position -= 1
+                assert cursor.prev() == items[position]
+            else:
+                with pytest.raises(StopIteration):
+                    cursor.prev()
+
+
+def test_cursor_survives_changes():
+    bst = BST(range(10))
+    cursor = bst.cursor(5)
+    bst.delete(5)
+    bst.insert(4.5)
+    assert cursor.next() == 6
+    bst.delete(6)
+    bst.update([5.5, 5.75])
+    assert cursor.prev() == 5.75
+    bst.clear()
+    with pytest.raises(StopIteration):
+        cursor.next()
+    bst.insert(1)
+    assert cursor.next() == 1
+    empty = BST()
+    cursor = empty.cursor()
+    with pytest.raises(StopIteration):
+        cursor.prev()
+    empty.insert('a')
+    assert list(cursor) == ['a']
+
+
+def test_cursor_keyed_and_persistent():
+    words = ['Delta', 'alpha', 'Charlie', 'bravo']
+    cursor = BST(words, key=str.lower).cursor('b')
+    assert list(cursor) == ['bravo', 'Charlie', 'Delta']
+    cursor = PersistentBST(range(5)).cursor(2, inclusive=False)
+    assert cursor.prev() == 2
@@ -0,0 +1,224 @@
+# coding=utf-8
+from __future__ import unicode_literals
+from builtins import range, reversed
+
+import random
+import pytest
+
+from data_structures.bst import BST
+from data_structures.chunked import ChunkedBST
+
+
+class SmallChunks(ChunkedBST):
+    """Tiny chunks, so that splitting and merging happen constantly."""
+    chunk_size = 4
+
+
+SET_TYPES = (ChunkedBST, SmallChunks)
+TREE_ITEMS = [
+    [],
+    [1],
+    [2, 1],
+    [12, 5, 9, 137, 42, 13, 28],
+    list(range(100)),
+    random.Random(12).sample(range(1000), 300),
+]
+INCLUSIVES = [(True, True), (True, False), (False, True), (False, False)]
+
+
+def check_invariants(s):
+    assert [len(chunk) for chunk in s._chunks if not chunk] == []
+    assert s._maxes == [chunk[-1] for chunk in s._chunks]
+    items = list(s)
+    assert items == sorted(set(items))
+    assert len(s) == len(items)
+    for i in range(len(s)):
+        assert s[i] == items[i]
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+@pytest.mark.parametrize('items', TREE_ITEMS)
+def test_init(set_type, items):
+    s = set_type(items)
+    assert list(s) == sorted(items)
+    assert list(reversed(s)) == sorted(items, reverse=True)
+    check_invariants(s)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+@pytest.mark.parametrize('items', TREE_ITEMS)
+def test_insert_contains(set_type, items):
+    s = set_type()
+    for item in items:
+        s.insert(item)
+        s.insert(item)
+    check_invariants(s)
+    for item in items:
+        assert item in s
+    assert -1 not in s
+    assert 10000 not in s
+
+
+def test_insert_mutable():
+    with pytest.raises(TypeError):
+        ChunkedBST().insert([])
+
+
+def test_from_sorted():
+    assert list(ChunkedBST.from_sorted([1, 1, 2, 3])) == [1, 2, 3]
+    with pytest.raises(ValueError):
+        ChunkedBST.from_sorted([2, 1])
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_fuzz(set_type):
+    rng = random.Random(12)
+    s = set_type()
+    expected = set()
+    for _ in range(2000):
+        item = rng.randint(0, 200)
+        if rng.random() < 0.5:
+            s.insert(item)
+            expected.add(item)
+        else:
+            s.delete(item)
+            expected.discard(item)
+    check_invariants(s)
+    assert list(s) == sorted(expected)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_indexing(set_type):
+    s = set_type(range(100, 200))
+    for i in range(100):
+        assert s[i] == 100 + i
+        assert s[-1 - i] == 199 - i
+        assert s.index(100 + i) == i
+    with pytest.raises(IndexError):
+        _ = s[100]
+    with pytest.raises(TypeError):
+        _ = s[1.5]
+    with pytest.raises(ValueError):
+        s.index(5)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_delete_index(set_type):
+    rng = random.Random(12)
+    items = list(range(50))
+    s = set_type(items)
+    while items:
+        i = rng.randrange(-len(items), len(items))
+        del items[i]
+        del s[i]
+        check_invariants(s)
+        assert list(s) == items
+
+
+SLICES = [
+    slice(None), slice(3, 7), slice(-5, None), slice(8, 3), slice(1, 15, 3),
+    slice(None, None, -1), slice(15, 2, -2),
+]
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+@pytest.mark.parametrize('index', SLICES)
+def test_slices(set_type, index):
+    items = list(range(20))
+    s = set_type(items)
+    assert s[index] == items[index]
+    del items[index]
+    del s[index]
+    assert list(s) == items
+    check_invariants(s)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_delete_runs(set_type):
+    rng = random.Random(12)
+    items = list(range(300))
+    s = set_type(items)
+    while items:
+        start = rng.randrange(len(items))
+        stop = start + rng.choice((1, 2, 5, 13, 40))
+        index = slice(start, stop) if rng.random() < 0.5 else slice(stop - 1, start - 1 if start else None, -1)
+        del items[index]
+        del s[index]
+        check_invariants(s)
+        assert list(s) == items
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+@pytest.mark.parametrize('inclusive', INCLUSIVES)
+def test_irange_matches_bst(set_type, inclusive):
+    items = random.Random(12).sample(range(200), 80)
+    s = set_type(items)
+    bst = BST(items)
+    bounds = [None] + list(range(-5, 205, 4)) + sorted(items)[::7]
+    for start in bounds:
+        for stop in bounds[::5]:
+            expected = list(bst.irange(start, stop, inclusive))
+            assert list(s.irange(start, stop, inclusive)) == expected
+            assert list(s.irange(start, stop, inclusive, reverse=True)) == expected[::-1]
+            assert s.count_range(start, stop, inclusive) == len(expected)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_bisect(set_type):
+    import bisect
+    items = list(range(0, 60, 3))
+    s = set_type(items)
+    for item in range(-2, 62):
+        assert s.bisect_left(item) == bisect.bisect_left(items, item)
+        assert s.bisect_right(item) == bisect.bisect_right(items, item)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_update(set_type):
+    s = set_type(range(0, 100, 2))
+    s.update([1, 3, 5])
+    s.update(range(50, 150))
+    assert list(s) == sorted(set(range(0, 100, 2)) | {1, 3, 5} | set(range(50, 150)))
+    check_invariants(s)
+
+
+@pytest.mark.parametrize('set_type', SET_TYPES)
+def test_update_merges_batches(set_type):
+    rng = random.Random(12)
+    expected = set(rng.sample(range(3000), 500))
+    s = set_type(expected)
+    for size in (10, 100, 400, 2000):
+        batch = [rng.randrange(-100, 3100) for _ in range(size)]
+        if size == 400:
+            batch.sort()
+        s.update(batch)
+        expected.update(batch)
+        check_invariants(s)
+        assert list(s) == sorted(expected)
+
+
+def test_clear_repr():
+    s = ChunkedBST([3, 1, 2])
+    assert repr(s) == "data_structures.chunked.ChunkedBST([1, 2, 3])"
+    s.clear()
+    assert len(s) == 0
+    assert repr(s) == "data_structures.chunked.ChunkedBST()"
+
+
+def test_memory_compared_to_bst():
+    """Items should cost a small fraction of the memory of a BST node each."""
+    import tracemalloc
+    values = list(range(20000))
+
+    def measure(build):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            result = build(values)
+            return result, tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+    _, chunked_size = measure(ChunkedBST.from_sorted)
+    _, bst_size = measure(BST.from_sorted)
+    assert chunked_size * 5 < bst_size
@@ -0,0 +1,157 @@
+# coding=utf-8
+from __future__ import unicode_literals
+from builtins import range
+
+import random
+import threading
+import pytest
+
+from data_structures.concurrent_bst import ConcurrentBST, RWLock
+
+
+def test_operations():
+    bst = ConcurrentBST([5, 3, 8])
+    bst.insert(1)
+    bst.update([10, 11])
+    bst.delete(8)
+    bst.difference_update([11])
+    assert list(bst) == [1, 3, 5, 10]
+    assert list(reversed(bst)) == [10, 5, 3, 1]
+    assert len(bst) == 4
+    assert 3 in bst
+    assert 8 not in bst
+    assert bst[1] == 3
+    assert bst[1:3] == [3, 5]
+    assert bst.index(5) == 2
+    assert bst.bisect_left(4) == bst.bisect_right(4) == 2
+    assert bst.count_range(2, 10) == 3
+    assert list(bst.irange(2, 6)) == [3, 5]
+    assert list(bst.irange(2, 6, reverse=True)) == [5, 3]
+    assert list(bst.islice(1, None)) == [3, 5, 10]
+    del bst[0]
+    assert list(bst) == [3, 5, 10]
+    bst.clear()
+    assert len(bst) == 0
+    assert repr(bst) == "data_structures.concurrent_bst.ConcurrentBST()"
+
+
+@pytest.mark.parametrize('change', [
+    lambda bst: bst.insert(100),
+    lambda bst: bst.delete(5),
+    lambda bst: bst.update([1]),
+    lambda bst: bst.clear(),
+])
+def test_iterators_fail_fast(change):
+    bst = ConcurrentBST(range(10))
+    iterators = [iter(bst), reversed(bst), bst.irange(2, 8), bst.islice(1, 5)]
+    for iterator in iterators:
+        next(iterator)
+    change(bst)
+    for iterator in iterators:
+        with pytest.raises(RuntimeError):
+            next(iterator)
+
+
+def test_snapshot():
+    bst = ConcurrentBST(range(10), key=lambda x: -x)
+    snap = bst.snapshot()
+    bst.insert(10)
+    bst.delete(0)
+    assert list(snap) == list(range(9, -1, -1))
+    assert list(bst) == list(range(10, 0, -1))
+
+
+def test_snapshot_shares_versions():
+    bst = ConcurrentBST(range(100000))
+    snap = bst.snapshot()
+    # taking a snapshot copies nothing
+    assert bst.snapshot() is snap
+    bst.insert(-1)
+    assert bst.snapshot() is not snap
+    assert len(snap) == 100000
+    assert len(bst.snapshot()) == 100001
+
+
+@pytest.mark.parametrize('change', [
+    lambda bst: bst.__delitem__(100),
+    lambda bst: bst.insert([1]),
+    lambda bst: bst.update([11, [1]]),
+    lambda bst: bst.difference_update([{}]),
+])
+def test_failed_changes_leave_iterators(change):
+    bst = ConcurrentBST(range(10))
+    iterator = iter(bst)
+    next(iterator)
+    with pytest.raises((IndexError, TypeError)):
+        change(bst)
+    assert list(iterator) == list(range(1, 10))
+    assert list(bst) == list(range(10))
+
+
+def test_rwlock_concurrent_readers():
+    lock = RWLock()
+    both_reading = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.read_locked():
+            both_reading.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not both_reading.broken
+
+
+def test_rwlock_writer_excludes_readers():
+    lock = RWLock()
+    events = []
+    lock.acquire_write()
+
+    def reader():
+        with lock.read_locked():
+            events.append('read')
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    thread.join(0.1)
+    events.append('write done')
+    lock.release_write()
+    thread.join(5)
+    assert events == ['write done', 'read']
+
+
+def test_threaded_use():
+    bst = ConcurrentBST()
+    errors = []
+
+    def writer(seed):
+        rng = random.Random(seed)
+        for _ in range(300):
+            if rng.random() < 0.6:
+                bst.insert(rng.randint(0, 500))
+            else:
+                bst.delete(rng.randint(0, 500))
+
+    def reader():
+        for _ in range(100):
+            snap = bst.snapshot()
+            items = list(snap)
+            if items != sorted(set(items)):
+                errors.append(items)
+            try:
+                items = list(bst.irange(100, 400))
+            except RuntimeError:
+                continue
+            if items != sorted(set(items)):
+                errors.append(items)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(4)]
+    threads += [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert list(bst) == sorted(set(bst))
@@ -0,0 +1,103 @@
+# coding=utf-8
+from __future__ import unicode_literals
+from builtins import range
+
+from io import BytesIO
+import pickle
+import random
+import pytest
+
+from data_structures.interval_tree import IntervalTree
+
+
+def random_intervals(count, span=1000, longest=100):
+    intervals = []
+    for _ in range(count):
+        low = random.randint(0, span)
+        intervals.append((low, low + random.randint(0, longest)))
+    return intervals
+
+
+def check_max_ends(tree):
+    def check(node):
+        if node is None:
+            return None
+        ends = [node.val[1], check(node.left), check(node.right)]
+        highest = max(end for end in ends if end is not None)
+        assert node.agg == highest
+        return highest
+    check(tree._head)
+
+
+def brute_overlapping(intervals, low, high):
+    return sorted(set(i for i in intervals if i[0] <= high and low <= i[1]))
+
+
+def test_overlapping():
+    intervals = random_intervals(300)
+    tree = IntervalTree(intervals)
+    check_max_ends(tree)
+    for _ in range(200):
+        low = random.randint(-50, 1150)
+        high = low + random.randint(0, 60)
+        assert list(tree.overlapping(low, high)) == brute_overlapping(intervals, low, high)
+        assert tree.overlaps(low, high) == bool(brute_overlapping(intervals, low, high))
+        assert list(tree.stabbing(low)) == brute_overlapping(intervals, low, low)
+
+
+def test_mutations():
+    tree = IntervalTree()
+    expected = set()
+    for _ in range(2000):
+        interval = random_intervals(1, span=200, longest=20)[0]
+        if random.random() < 0.6:
+            tree.insert(interval)
+            expected.add(interval)
+        else:
+            tree.delete(interval)
+            expected.discard(interval)
+        if random.random() < 0.05:
+            victim = random.choice(list(expected)) if expected else None
+            tree.delete(victim)
+            expected.discard(victim)
+    check_max_ends(tree)
+    assert list(tree) == sorted(expected)
+    for point in range(-5, 230, 7):
+        assert list(tree.stabbing(point)) == brute_overlapping(expected, point, point)
+    lower, upper = tree.split((100, 100))
+    check_max_ends(lower)
+    check_max_ends(upper)
+    assert list(upper.stabbing(100)) == [i for i in brute_overlapping(expected, 100, 100) if i >= (100, 100)]
+
+
+def test_invalid_interval():
+    tree = IntervalTree([(1, 2)])
+    with pytest.raises(ValueError):
+        tree.insert((3, 1))
+    with pytest.raises(ValueError):
+        tree.update([(4, 5), (3, 1)])
+    with pytest.raises(ValueError):
+        IntervalTree.from_sorted([(3, 1)])
+    assert list(tree) == [(1, 2)]
+
+
+def test_payloads_and_empty():
+    assert list(IntervalTree().overlapping(0, 10)) == []
+    assert not IntervalTree().overlaps(0, 10)
+    tree = IntervalTree([(1, 3, 'a'), (1, 3, 'b'), (2, 2, 'c')])
+    assert list(tree.stabbing(2)) == [(1, 3, 'a'), (1, 3, 'b'), (2, 2, 'c')]
+    assert list(tree.stabbing(3)) == [(1, 3, 'a'), (1, 3, 'b')]
+
+
+def test_persistence():
+    tree = IntervalTree(random_intervals(50))
+    for loaded in (pickle.loads(pickle.dumps(tree)), tree.copy()):
+        assert type(loaded) is IntervalTree
+        check_max_ends(loaded)
+        assert list(loaded.stabbing(500)) == list(tree.stabbing(500))
+    f = BytesIO()
+    tree.dump(f)
+    f.seek(0)
+    loaded = IntervalTree.load(f)
+    check_max_ends(loaded)
+    assert list(loaded) == list(tree)
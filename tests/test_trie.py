@@ -3,7 +3,9 @@ from builtins import input, open, str
 
 import mock
 import pytest
+import random
 
+from data_structures.frozen_trie import FrozenTrie
 from data_structures.trie import Trie, ShortTrie, _startswith
 
 # inspector doesn't see this otherwise
@@ -167,6 +169,33 @@ def test_breadth_first_many(trie_type, prefix, st):
     assert unique_iterated == set(prefix + st(word) for word in words)
 
 
+@pytest.mark.parametrize('st', SEQUENCE_TYPES)
+@pytest.mark.parametrize('trie_type', (Trie, ShortTrie))
+def test_long_tokens(trie_type, st):
+    # far deeper than the recursion limit
+    long_token = st('ab' * 10000)
+    trie = trie_type()
+    trie.insert(long_token)
+    trie.insert(long_token[:-3])
+    assert long_token in trie
+    assert long_token[:-3] in trie
+    assert long_token[:-1] not in trie
+    assert long_token + st('a') not in trie
+    assert list(trie.auto_complete(long_token[:-2])) == [long_token]
+
+
+@pytest.mark.parametrize('st', SEQUENCE_TYPES)
+def test_short_trie_partial_edges(st):
+    trie = ShortTrie()
+    for word in ['apples', 'application', 'app', 'apple']:
+        trie.insert(st(word))
+    assert sorted(trie) == sorted(st(word) for word in ['apples', 'application', 'app', 'apple'])
+    for word in ['a', 'ap', 'appl', 'applic', 'applesauce', 'b']:
+        assert st(word) not in trie
+    assert sorted(trie.auto_complete(st('appli'))) == [st('application')]
+    assert list(trie.auto_complete(st('applix'))) == []
+
+
 AUTOCOMPLETE_DATA = [
     (['a', 'ab', 'abc', 'abcd', 'aardvark', 'asdffasg', 'asdf', 'bsdf', 'absolutel', '5'], 'a', 8),
     (['a', 'ab', 'abc', 'abcd', 'aardvark', 'asdffasg', 'asdf', 'bsdf', 'absolutel', '5'], 'as', 2),
@@ -193,6 +222,255 @@ def test_autocomplete(items, token, most, limit, st):
     assert all(len(x) == len(set(x)) for x in (autocompleted, short_auto))
 
 
+@pytest.mark.parametrize('trie_type', (Trie, ShortTrie))
+@pytest.mark.parametrize('st', SEQUENCE_TYPES)
+def test_ranked_autocomplete(trie_type, st):
+    rng = random.Random(24)
+    trie = trie_type()
+    weights = {}
+    for word in words[:500] + ['']:
+        weights[st(word)] = rng.randrange(100)
+        trie.insert(st(word), weight=weights[st(word)])
+    # reweigh some, both up and down, and reinsert others without a weight
+    for word in rng.sample(words[:500], 200):
+        weights[st(word)] = rng.randrange(100)
+        trie.insert(st(word), weight=weights[st(word)])
+    for word in rng.sample(words[:500], 50):
+        trie.insert(st(word))
+    for word in words[:50]:
+        for end in (0, 1, 2, 3):
+            prefix = st(word[:end])
+            expected = sorted((weight for token, weight in weights.items() if _startswith(token, prefix)),
+                              reverse=True)
+            for limit in (1, 5, 10 ** 9):
+                ranked = list(trie.auto_complete(prefix, max_results=limit, ranked=True))
+                assert [weights[token] for token in ranked] == expected[:limit]
+                assert all(_startswith(token, prefix) for token in ranked)
+                assert len(ranked) == len(set(ranked))
+    assert list(trie.auto_complete(st('&*$'), ranked=True)) == []
+
+
+@pytest.mark.parametrize('trie_type', (Trie, ShortTrie))
+def test_ranked_autocomplete_default_weights(trie_type):
+    trie = trie_type()
+    for word in ('car', 'cart', 'carton', 'care'):
+        trie.insert(word)
+    trie.insert('carbon', weight=5)
+    trie.insert('cargo', weight=-1)
+    assert list(trie.auto_complete('car', max_results=1, ranked=True)) == ['carbon']
+    assert sorted(trie.auto_complete('car', max_results=5, ranked=True)) == [
+        'car', 'carbon', 'care', 'cart', 'carton']
+    assert list(trie.auto_complete('carg', ranked=True)) == ['cargo']
+    trie.insert('carbon', weight=-5)
+    assert list(trie.auto_complete('car', max_results=10, ranked=True))[-2:] == ['cargo', 'carbon']
+    assert list(trie_type().auto_complete('', ranked=True)) == []
+
+
+def _shape(trie):
+    """Return the edges and terminal flags of a ShortTrie, as nested tuples."""
+    return trie._terminates, sorted((leader + more, _shape(child)) for leader, (more, child) in trie._edges.items())
+
+
+@pytest.mark.parametrize('trie_type', (Trie, ShortTrie))
+@pytest.mark.parametrize('st', SEQUENCE_TYPES)
+def test_trie_map(trie_type, st):
+    rng = random.Random(25)
+    pool = [st(word) for word in words[:300]] + [st(word[:3]) for word in words[:30]] + [st('')]
+    trie = trie_type()
+    expected = {}
+    for _ in range(3000):
+        token = rng.choice(pool)
+        if rng.random() < 0.6:
+            trie[token] = expected[token] = rng.random()
+        elif token in expected:
+            del trie[token]
+            del expected[token]
+        else:
+            with pytest.raises(KeyError):
+                del trie[token]
+        assert len(trie) == len(expected)
+    assert sorted(trie.items()) == sorted(expected.items())
+    for token in pool:
+        assert (token in trie) == (token in expected)
+        assert trie.get(token) == expected.get(token)
+        if token in expected:
+            assert trie[token] == expected[token]
+        else:
+            with pytest.raises(KeyError):
+                trie[token]
+        for end in (0, 1, 2, 4):
+            prefix = token[:end]
+            matching = sorted((k, v) for k, v in expected.items() if _startswith(k, prefix))
+            assert sorted(trie.items(prefix)) == matching
+            assert trie.count(prefix) == len(matching)
+    assert trie.count() == len(expected)
+    assert list(trie.items(st('&*$'))) == []
+    assert trie.count(st('&*$')) == 0
+    if trie_type is ShortTrie:
+        # removals leave the trie as short as if the tokens had never been inserted
+        fresh = ShortTrie()
+        for token in expected:
+            fresh.insert(token)
+        assert _shape(trie) == _shape(fresh)
+
+
+@pytest.mark.parametrize('trie_type', (Trie, ShortTrie))
+def test_trie_map_keeps_weights(trie_type):
+    trie = trie_type()
+    trie.insert('carbon', weight=5)
+    trie.insert('cart', weight=3)
+    trie['carbon'] = 'element'
+    trie['care'] = 'concern'
+    assert list(trie.auto_complete('car', ranked=True))[:2] == ['carbon', 'cart']
+    del trie['carbon']
+    assert list(trie.auto_complete('car', ranked=True)) == ['cart', 'care']
+    assert trie.count('car') == 2
+    trie.insert('cart')
+    assert trie['cart'] is None
+    del trie['cart']
+    del trie['care']
+    assert len(trie) == 0
+    assert trie._edges == {}
+    assert list(trie.auto_complete('', ranked=True)) == []
+
+
+@pytest.mark.parametrize('st', SEQUENCE_TYPES)
+@pytest.mark.parametrize('values', OVERLAPPING_WORD_SETS + SHORTENABLE + [[], ['']])
+def test_frozen_matches_short_trie(values, st):
+    values = [st(value) for value in values]
+    short = ShortTrie()
+    for value in values:
+        short.insert(value)
+    frozen = FrozenTrie(values)
+    assert sorted(FrozenTrie(short)) == sorted(short)
+    assert len(frozen) == len(set(values))
+    assert list(frozen) == sorted(set(values))
+    assert sorted(frozen.breadth_first()) == sorted(short.breadth_first())
+    for value in values[:50]:
+        assert value in frozen
+        for cut in (1, 2, 5):
+            assert (value[:-cut] in frozen) == (value[:-cut] in short)
+        assert value + st('!') not in frozen
+        for end in (0, 1, 3, len(value) // 2):
+            assert sorted(frozen.auto_complete(value[:end], max_results=10 ** 9)) == sorted(
+                short.auto_complete(value[:end], max_results=10 ** 9))
+    assert list(frozen.auto_complete(st('&*$'))) == []
+
+
+def test_frozen_breadth_first_order():
+    frozen = FrozenTrie(['abc', 'abcdef', 'abcdefghi', 'abc123', 'abc123456'])
+    assert list(frozen.auto_complete('ab', max_results=3)) == ['abc', 'abc123', 'abcdef']
+
+
+def test_frozen_memory():
+    """A frozen trie of the words should take a small fraction of a ShortTrie's memory."""
+    import tracemalloc
+    # build one first, so that the memory the interpreter keeps for reuse
+    # (such as its free lists) isn't counted against the frozen trie
+    FrozenTrie(words)
+    tracemalloc.start()
+    short = ShortTrie()
+    for word in words:
+        short.insert(word)
+    short_size = tracemalloc.get_traced_memory()[0]
+    del short
+    baseline = tracemalloc.get_traced_memory()[0]
+    frozen = FrozenTrie(words)
+    frozen_size = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    assert frozen_size * 5 < short_size
+    assert len(frozen) == len(words)
+
+
+@pytest.mark.parametrize('st', SEQUENCE_TYPES)
+@pytest.mark.parametrize('values', OVERLAPPING_WORD_SETS + SHORTENABLE + [[], ['']])
+def test_frozen_save_load(values, st, tmp_path):
+    values = [st(value) for value in values]
+    frozen = FrozenTrie(values)
+    path = str(tmp_path / 'trie')
+    frozen.save(path)
+    loaded = FrozenTrie.load(path)
+    assert len(loaded) == len(frozen)
+    assert list(loaded) == list(frozen)
+    assert list(loaded.breadth_first()) == list(frozen.breadth_first())
+    for value in values[:50]:
+        assert value in loaded
+        assert value + st('!') not in loaded
+        for end in (0, 1, 3):
+            assert list(loaded.auto_complete(value[:end])) == list(frozen.auto_complete(value[:end]))
+    # saving a loaded trie writes the same file again
+    loaded.save(path + '2')
+    with open(path, 'rb') as f, open(path + '2', 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_frozen_save_load_bytes(tmp_path):
+    values = [b'\x00', b'abc', b'abd', b'\xff\xfe', b'']
+    path = str(tmp_path / 'trie')
+    FrozenTrie(values).save(path)
+    loaded = FrozenTrie.load(path)
+    assert list(loaded) == sorted(values)
+    assert list(loaded.auto_complete(b'ab')) == [b'abc', b'abd']
+
+
+def test_short_trie_save(tmp_path):
+    short = ShortTrie()
+    for word in words + ['']:
+        short.insert(word)
+    path = str(tmp_path / 'words')
+    short.save(path)
+    loaded = FrozenTrie.load(path)
+    assert len(loaded) == len(words) + 1
+    assert '' in loaded
+    for word in words[:100]:
+        assert word in loaded
+        assert sorted(loaded.auto_complete(word[:2], 10 ** 9)) == sorted(short.auto_complete(word[:2], 10 ** 9))
+
+
+def test_short_trie_save_weights_and_values(tmp_path):
+    rng = random.Random(23)
+    short = ShortTrie()
+    weights = {}
+    for word in words[:500] + ['']:
+        weights[word] = rng.randrange(100)
+        short.insert(word, weight=weights[word])
+    for word in words[:50]:
+        short[word] = (word, len(word))
+    path = str(tmp_path / 'words')
+    short.save(path)
+    loaded = FrozenTrie.load(path)
+    for word in words[:50]:
+        assert loaded[word] == short[word] == loaded.get(word)
+    assert loaded[words[60]] is None
+    assert loaded.get('no such word', 'missing') == 'missing'
+    with pytest.raises(KeyError):
+        loaded['no such word']
+    for prefix in ['', 'a', 'ca', 'pro', 'zzz']:
+        expected = [weights[word] for word in short.auto_complete(prefix, 10, ranked=True)]
+        assert [weights[word] for word in loaded.auto_complete(prefix, 10, ranked=True)] == expected
+    # a loaded trie saves to the same file
+    short.save(path)
+    again = str(tmp_path / 'again')
+    FrozenTrie.load(path).save(again)
+    with open(path, 'rb') as f, open(again, 'rb') as g:
+        assert f.read() == g.read()
+
+
+def test_frozen_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'other'
+    path.write_bytes(b'not a trie at all, just some bytes')
+    with pytest.raises(ValueError):
+        FrozenTrie.load(str(path))
+    path = str(tmp_path / 'trie')
+    FrozenTrie(words).save(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        FrozenTrie.load(path)
+
+
 def main():
     trie = ShortTrie()
     for word in _words():